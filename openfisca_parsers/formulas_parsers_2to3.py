@@ -29,6 +29,7 @@
 from __future__ import division
 
 import collections
+import gc
 import inspect
 import itertools
 import lib2to3.pgen2.token
@@ -40,11 +41,81 @@ import textwrap
 import numpy as np
 from openfisca_core import conv
 
+from . import legislation_paths
+
 
 symbols = lib2to3.pygram.python_symbols  # Note: symbols is a module.
 tokens = lib2to3.pgen2.token  # Note: tokens is a module.
 type_symbol = lib2to3.pytree.type_repr  # Note: type_symbol is a function.
 
+# Arguments shared by the calls without named or positional arguments. Caution: They must never be modified.
+empty_named_arguments = collections.OrderedDict()
+empty_positional_arguments = []
+
+# Memo of AbstractWrapper.get_guess_rule_expected_name: (wrapper class, parser class, expected class) => name or None
+guess_rule_expected_name_by_key = {}
+
+# Names available in every module, with the factory of their value (or None when their value is unknown). Their
+# variables are created on first use and shared by all the modules of a parser (see Parser.get_builtin_variable).
+builtin_value_factory_by_name = dict(
+    and_ = None,
+    around = None,
+    apply_along_axis = None,
+    array = None,
+    CAT = lambda parser: parser.Enum(parser = parser),
+    ceil = None,
+    CHEF = lambda parser: parser.Number(parser = parser, value = 0),
+    # combine_tax_scales = None,
+    CONJ = lambda parser: parser.Number(parser = parser, value = 1),
+    CREF = lambda parser: parser.Number(parser = parser, value = 1),
+    date = None,
+    datetime64 = None,
+    dict = None,
+    # ENFS = lambda parser: parser.UniformList(parser = parser, value = parser.Number(parser = parser, value = x)),
+    ENFS = None,
+    floor = None,
+    fromiter = None,
+    fsolve = None,
+    hasattr = None,
+    holidays = None,
+    int16 = lambda parser: parser.Type(parser = parser, value = np.int16),
+    int32 = lambda parser: parser.Type(parser = parser, value = np.int32),
+    izip = None,
+    law = lambda parser: parser.CompactNode(parser = parser, value = parser.tax_benefit_system.legislation_json),
+    len = None,
+    log = lambda parser: parser.Logger(parser = parser),
+    MarginalRateTaxScale = None,
+    max = None,
+    max_ = None,
+    math = None,
+    min_ = None,
+    not_ = None,
+    ones = None,
+    or_ = None,
+    original_busday_count = None,
+    PAC1 = lambda parser: parser.Number(parser = parser, value = 2),
+    PAC2 = lambda parser: parser.Number(parser = parser, value = 3),
+    PAC3 = lambda parser: parser.Number(parser = parser, value = 4),
+    PART = lambda parser: parser.Number(parser = parser, value = 1),
+    partial = None,
+    PREF = lambda parser: parser.Number(parser = parser, value = 0),
+    round = None,
+    round_ = None,
+    # scale_tax_scales = None,
+    SCOLARITE_COLLEGE = lambda parser: parser.Number(parser = parser, value = 1),
+    sorted = None,
+    startswith = None,
+    TAUX_DE_PRIME = lambda parser: parser.Number(parser = parser, value = 1 / 4),
+    # TaxScalesTree = None,
+    timedelta64 = None,
+    ValueError = None,
+    VOUS = lambda parser: parser.Number(parser = parser, value = 0),
+    where = None,
+    xor_ = None,
+    zeros = None,
+    zone_apl_by_depcom = None,
+    )
+
 
 # Monkey patches to support utf-8 strings
 lib2to3.pytree.Base.__str__ = lambda self: unicode(self).encode('utf-8')
@@ -54,30 +125,86 @@ lib2to3.pytree.Leaf.__unicode__ = lambda self: self.prefix.decode('utf-8') + (se
     )
 
 
+# Exceptions
+
+
+class ParseError(Exception):
+    """Error raised when a formula uses Python code that the parsers don't handle
+
+    Unlike the assertions of the parsers, which check their own consistency and are skipped under "python -O" (or, for
+    the most frequent ones, by parsers created with validate = False), parse errors are always raised: Callers catch
+    them to skip the formulas that can't be parsed.
+    """
+
+
 # Abstract Wrappers
 
 
+class WrapperType(type):
+    """Metaclass of wrappers, converting their declared fields into slots
+
+    Each wrapper class declares the names of the fields it adds in a "fields" tuple, and their default values as class
+    attributes. To reduce the memory used by the (many) wrappers, these fields are stored in __slots__ instead of an
+    instance dictionary, and their default values are set by AbstractWrapper.__init__. A class attribute named like an
+    inherited field gives it a new default value. The other class attributes (constants, tables…) are left untouched.
+    Subclasses (including the ones mixed with classes that have empty __slots__) only get slots for the fields they add.
+    """
+    def __new__(mcs, name, bases, namespace):
+        default_by_field_name = {}
+        for base in reversed(bases):
+            base_default_by_field_name = getattr(base, 'default_by_field_name', None)
+            if base_default_by_field_name is not None:
+                default_by_field_name.update(base_default_by_field_name)
+        fields = namespace.pop('fields', ())
+        for field_name in fields:
+            if field_name in default_by_field_name:
+                raise TypeError("Field {} of wrapper class {} is already a field of a base class".format(field_name,
+                    name))
+            if field_name not in namespace:
+                raise TypeError("Missing default value of field {} of wrapper class {}".format(field_name, name))
+        for field_name in namespace.keys():
+            if field_name in default_by_field_name or field_name in fields:
+                default_by_field_name[field_name] = namespace.pop(field_name)
+        namespace.setdefault('__slots__', tuple(sorted(fields)))
+        namespace['default_by_field_name'] = default_by_field_name
+        namespace['field_defaults'] = tuple(sorted(default_by_field_name.iteritems()))
+        return super(WrapperType, mcs).__new__(mcs, name, bases, namespace)
+
+
 class AbstractWrapper(object):
+    __metaclass__ = WrapperType
+    fields = ('container', 'guessed_by_expected', 'hint', 'node', 'parser')
     container = None  # The wrapper directly containing this wrapper
+    # Names of the wrapper classes having guess rules, by decreasing precedence: An expected class is guessed as the
+    # first one that is a subclass of it.
+    guess_rule_expected_names = ()
+    # Name of the method guessing a wrapper whatever the name of the subject, by name of the expected wrapper class
+    guess_rule_name_by_expected_name = {}
+    # Name of the method guessing a wrapper, by (name of the expected wrapper class, name of the attribute or method)
+    guess_rule_name_by_expected_name_and_name = {}
+    guessed_by_expected = None  # Memo of guesses: expected class => (parser guess generation, guessed wrapper)
     hint = None  # A wrapper that is the hinted type of this wrapper
     node = None  # The lib2to3 node
     parser = None
 
     def __init__(self, container = None, hint = None, node = None, parser = None):
-        if container is not None:
-            assert isinstance(container, AbstractWrapper), "Invalid container {} for node:\n{}\n\n{}".format(container,
+        if parser.validate:
+            assert isinstance(parser, Parser), "Invalid parser {} for node:\n{}\n\n{}".format(parser, repr(node),
+                unicode(node).encode('utf-8'))
+            assert container is None or isinstance(container, AbstractWrapper), \
+                "Invalid container {} for node:\n{}\n\n{}".format(container, repr(node), unicode(node).encode('utf-8'))
+            assert hint is None or isinstance(hint, AbstractWrapper), "Invalid hint {} for node:\n{}\n\n{}".format(
+                hint, repr(node), unicode(node).encode('utf-8'))
+            assert node is None or isinstance(node, lib2to3.pytree.Base), "Invalid node:\n{}\n\n{}".format(
                 repr(node), unicode(node).encode('utf-8'))
+        for field_name, default in self.field_defaults:
+            setattr(self, field_name, default)
+        if container is not None:
             self.container = container
         if hint is not None:
-            assert isinstance(hint, AbstractWrapper), "Invalid hint {} for node:\n{}\n\n{}".format(hint, repr(node),
-                unicode(node).encode('utf-8'))
             self.hint = hint
         if node is not None:
-            assert isinstance(node, lib2to3.pytree.Base), "Invalid node:\n{}\n\n{}".format(repr(node),
-                unicode(node).encode('utf-8'))
             self.node = node
-        assert isinstance(parser, Parser), "Invalid parser {} for node:\n{}\n\n{}".format(parser, repr(node),
-            unicode(node).encode('utf-8'))
         self.parser = parser
 
     @property
@@ -101,7 +228,81 @@ class AbstractWrapper(object):
             return None
         return container.containing_module
 
+    def get_guess_rule_expected_name(self, expected):
+        """Return the name of the wrapper class having guess rules that matches the expected class, or None.
+
+        Like a chain of "elif issubclass(parser.X, expected)" tests, the first matching name of
+        guess_rule_expected_names wins.
+        """
+        parser = self.parser
+        key = (self.__class__, parser.__class__, expected)
+        try:
+            return guess_rule_expected_name_by_key[key]
+        except KeyError:
+            pass
+        assert set(self.iter_guess_rule_expected_names()).issubset(self.guess_rule_expected_names), \
+            "Guess rules of {} for wrapper classes missing from guess_rule_expected_names: {}".format(
+                self.__class__.__name__,
+                sorted(set(self.iter_guess_rule_expected_names()).difference(self.guess_rule_expected_names)))
+        expected_name = None
+        for name in self.guess_rule_expected_names:
+            if issubclass(getattr(parser, name), expected):
+                expected_name = name
+                break
+        guess_rule_expected_name_by_key[key] = expected_name
+        return expected_name
+
     def guess(self, expected):
+        """Return a wrapper of class expected that this wrapper is guessed to be, or None.
+
+        Guesses are memoized, until the parser guess generation changes (ie when a variable is bound to another value).
+        """
+        parser = self.parser
+        if not parser.memoize_guesses:
+            if parser.profiler is not None:
+                return self.guess_profiled(expected)
+            return self.guess_uncached(expected)
+        guessed_by_expected = self.guessed_by_expected
+        if guessed_by_expected is None:
+            self.guessed_by_expected = guessed_by_expected = {}
+        else:
+            generation_and_guessed = guessed_by_expected.get(expected)
+            if generation_and_guessed is not None and generation_and_guessed[0] == parser.guess_generation:
+                parser.guess_hit_count += 1
+                if parser.profiler is not None:
+                    parser.profiler.count_guess_hit(self.__class__.__name__)
+                return generation_and_guessed[1]
+        parser.guess_miss_count += 1
+        # Use generation before guessing, in case guessing invalidates it.
+        generation = parser.guess_generation
+        guessed = self.guess_uncached(expected) if parser.profiler is None else self.guess_profiled(expected)
+        guessed_by_expected[expected] = (generation, guessed)
+        return guessed
+
+    def guess_by_rule(self, rule_name, expected, *arguments):
+        """Call the guess rule method named rule_name, timing it with the parser profiler when there is one."""
+        rule = getattr(self, rule_name)
+        profiler = self.parser.profiler
+        if profiler is None:
+            return rule(expected, *arguments)
+        class_name = self.__class__.__name__
+        profiler.start('guess_rule', column = self.parser.column, rule_name = '{}.{}'.format(class_name, rule_name),
+            wrapper_class_name = class_name)
+        try:
+            return rule(expected, *arguments)
+        finally:
+            profiler.stop()
+
+    def guess_profiled(self, expected):
+        """Call guess_uncached, timing it with the parser profiler."""
+        profiler = self.parser.profiler
+        profiler.start('guess', column = self.parser.column, wrapper_class_name = self.__class__.__name__)
+        try:
+            return self.guess_uncached(expected)
+        finally:
+            profiler.stop()
+
+    def guess_uncached(self, expected):
         assert issubclass(expected, AbstractWrapper)
         if isinstance(self, expected):
             return self
@@ -111,11 +312,19 @@ class AbstractWrapper(object):
                 return guessed
         return None
 
+    def iter_guess_rule_expected_names(self):
+        """Iterate over the names of the expected wrapper classes used as keys of the guess rule tables."""
+        for expected_name in self.guess_rule_name_by_expected_name:
+            yield expected_name
+        for expected_name, name in self.guess_rule_name_by_expected_name_and_name:
+            yield expected_name
+
 
 # Level-1 Wrappers
 
 
 class AndExpression(AbstractWrapper):
+    fields = ('operands', 'operator')
     operands = None
     operator = None
 
@@ -126,8 +335,8 @@ class AndExpression(AbstractWrapper):
         assert isinstance(operator, basestring)
         self.operator = operator
 
-    def guess(self, expected):
-        guessed = super(AndExpression, self).guess(expected)
+    def guess_uncached(self, expected):
+        guessed = super(AndExpression, self).guess_uncached(expected)
         if guessed is not None:
             return guessed
 
@@ -178,6 +387,7 @@ class AndExpression(AbstractWrapper):
 
 
 class AndTest(AbstractWrapper):
+    fields = ('operands', 'operator')
     operands = None
     operator = None
 
@@ -188,8 +398,8 @@ class AndTest(AbstractWrapper):
         assert isinstance(operator, basestring)
         self.operator = operator
 
-    def guess(self, expected):
-        guessed = super(AndTest, self).guess(expected)
+    def guess_uncached(self, expected):
+        guessed = super(AndTest, self).guess_uncached(expected)
         if guessed is not None:
             return guessed
 
@@ -233,6 +443,7 @@ class AndTest(AbstractWrapper):
 
 
 class ArithmeticExpression(AbstractWrapper):
+    fields = ('items',)
     items = None
 
     def __init__(self, container = None, hint = None, items = None, node = None, parser = None):
@@ -241,8 +452,8 @@ class ArithmeticExpression(AbstractWrapper):
         assert len(items) >= 3 and (len(items) & 1)
         self.items = items
 
-    def guess(self, expected):
-        guessed = super(ArithmeticExpression, self).guess(expected)
+    def guess_uncached(self, expected):
+        guessed = super(ArithmeticExpression, self).guess_uncached(expected)
         if guessed is not None:
             return guessed
 
@@ -291,6 +502,7 @@ class ArithmeticExpression(AbstractWrapper):
 
 class Array(AbstractWrapper):
     """Wrapper for a NumPy array"""
+    fields = ('cell', 'entity_class', 'value')
     cell = None  # Cell wrapper
     entity_class = None
     value = None  # array value, as a numpy array
@@ -322,6 +534,7 @@ class Array(AbstractWrapper):
 
 
 class Assert(AbstractWrapper):
+    fields = ('error', 'test')
     error = None
     test = None
 
@@ -351,6 +564,7 @@ class Assert(AbstractWrapper):
 
 
 class Assignment(AbstractWrapper):
+    fields = ('left', 'operator', 'right')
     left = None
     operator = None
     right = None
@@ -376,12 +590,14 @@ class Assignment(AbstractWrapper):
         assert node.type == symbols.expr_stmt, "Unexpected assignement type:\n{}\n\n{}".format(repr(node),
             unicode(node).encode('utf-8'))
         children = node.children
-        assert len(children) == 3, "Unexpected length {} of children in assignment:\n{}\n\n{}".format(
-            len(children), repr(node), unicode(node).encode('utf-8'))
+        if len(children) != 3:
+            raise ParseError("Unexpected length {} of children in assignment:\n{}\n\n{}".format(
+                len(children), repr(node), unicode(node).encode('utf-8')))
         left, operator, right = children
-        assert operator.type in (tokens.AMPEREQUAL, tokens.EQUAL, tokens.MINEQUAL, tokens.PLUSEQUAL,
-            tokens.STAREQUAL), "Unexpected assignment operator:\n{}\n\n{}".format(repr(node), unicode(node).encode(
-                'utf-8'))
+        if operator.type not in (tokens.AMPEREQUAL, tokens.EQUAL, tokens.MINEQUAL, tokens.PLUSEQUAL,
+                tokens.STAREQUAL):
+            raise ParseError("Unexpected assignment operator:\n{}\n\n{}".format(repr(node), unicode(node).encode(
+                'utf-8')))
 
         # Right items must be parsed before left ones, to avoid reuse of left variables (for example in statements like:
         # period = period).
@@ -408,7 +624,9 @@ class Assignment(AbstractWrapper):
             child_index = 0
             while child_index < len(left_children):
                 left_child = left_children[child_index]
-                assert left_child.type == tokens.NAME
+                if left_child.type != tokens.NAME:
+                    raise ParseError("Unexpected assignment left item:\n{}\n\n{}".format(repr(node),
+                        unicode(node).encode('utf-8')))
                 variable = parser.Variable.parse(left_child, container = container, parser = parser)
                 left_items.append(variable)
                 container.variable_by_name[variable.name] = variable
@@ -420,8 +638,9 @@ class Assignment(AbstractWrapper):
         elif left.type == symbols.power:
             left_items.append(parser.parse_power(left, container = container))
         else:
-            assert left.type == tokens.NAME, \
-                "Unexpected assignment left operand:\n{}\n\n{}".format(repr(node), unicode(node).encode('utf-8'))
+            if left.type != tokens.NAME:
+                raise ParseError("Unexpected assignment left operand:\n{}\n\n{}".format(repr(node),
+                    unicode(node).encode('utf-8')))
             variable = parser.Variable.parse(left, container = container, parser = parser,
                 value = None if operator.type == tokens.EQUAL else container.get_variable(left.value, parser = parser))
             left_items.append(variable)
@@ -432,6 +651,36 @@ class Assignment(AbstractWrapper):
 
 
 class Attribute(AbstractWrapper):
+    fields = ('name', 'subject')
+    guess_rule_expected_names = (
+        'Boolean',  # Before Number, because Boolean is a subclass of Number.
+        'CompactNode',
+        'Date',
+        'Entity',
+        'FormulaClass',
+        'Holder',
+        'Instant',
+        'Number',
+        'String',
+        'TaxScale',
+        'UniformDictionary',
+        )
+    guess_rule_name_by_expected_name = dict(
+        Boolean = 'guess_boolean_parameter',
+        CompactNode = 'guess_compact_node_child',
+        Number = 'guess_number_parameter',
+        TaxScale = 'guess_tax_scale_child',
+        )
+    guess_rule_name_by_expected_name_and_name = {
+        ('Date', 'date'): 'guess_period_date',
+        ('Entity', 'entity'): 'guess_holder_entity',
+        ('FormulaClass', '__class__'): 'guess_formula_class',
+        ('Holder', 'holder'): 'guess_formula_holder',
+        ('Instant', 'start'): 'guess_period_start',
+        ('Number', 'count'): 'guess_entity_count',
+        ('String', '__name__'): 'guess_formula_class_name',
+        ('UniformDictionary', '_array_by_period'): 'guess_holder_array_by_period',
+        }
     name = None
     subject = None
 
@@ -442,96 +691,131 @@ class Attribute(AbstractWrapper):
         assert isinstance(subject, AbstractWrapper)
         self.subject = subject
 
-    def guess(self, expected):
-        guessed = super(Attribute, self).guess(expected)
-        if guessed is not None:
-            return guessed
+    def guess_boolean_parameter(self, expected):
+        parser = self.parser
+        compact_node_wrapper = self.subject.guess(parser.CompactNode)
+        if compact_node_wrapper is not None:
+            child_path = compact_node_wrapper.get_child_path(self.name)
+            if child_path.type == u'Parameter' and child_path.format == 'boolean':
+                return parser.Boolean(parser = parser)
+        return None
 
+    def guess_compact_node_child(self, expected):
         parser = self.parser
-        if issubclass(parser.Boolean, expected):
-            compact_node_wrapper = self.subject.guess(parser.CompactNode)
-            if compact_node_wrapper is not None:
-                child_json = compact_node_wrapper.value['children'][self.name]
-                child_type = child_json['@type']
-                if child_type == u'Parameter' and child_json.get('format') == 'boolean':
-                    return parser.Boolean(parser = parser)
-        elif issubclass(parser.CompactNode, expected):
-            compact_node = self.subject.guess(parser.CompactNode)
-            if compact_node is not None:
-                child_json = compact_node.value['children'].get(self.name)
-                if child_json is not None:
-                    child_type = child_json['@type']
-                    if child_type == u'Node':
-                        return parser.CompactNode(is_reference = compact_node.is_reference, name = self.name,
-                            parent = compact_node, parser = parser, value = child_json)
-        elif issubclass(parser.Date, expected):
-            if self.name == 'date':
-                period = self.subject.guess(parser.Period)
-                if period is not None:
-                    return parser.Date(parser = parser)
-        elif issubclass(parser.Entity, expected):
-            if self.name == 'entity':
-                holder = self.subject.guess(parser.Holder)
-                if holder is not None:
-                    entity_class = parser.tax_benefit_system.entity_class_by_key_plural[holder.column.entity_key_plural]
-                    return parser.Entity(entity_class = entity_class, parser = parser)
-        elif issubclass(parser.FormulaClass, expected):
-            if self.name == '__class__':
-                formula = self.subject.guess(parser.Formula)
-                if formula is not None:
-                    return formula.formula_class
-        elif issubclass(parser.Holder, expected):
-            if self.name == 'holder':
-                formula = self.subject.guess(parser.Formula)
-                if formula is not None:
-                    return parser.Holder(column = formula.column, parser = parser)
-        elif issubclass(parser.Instant, expected):
-            if self.name == 'start':
-                    period = self.subject.guess(parser.Period)
-                    if period is not None:
-                        return parser.Instant(parser = parser)
-        elif issubclass(parser.Number, expected):
-            if self.name == 'count':
-                entity = self.subject.guest(parser.Entity)
-                if entity is not None:
-                    return parser.Number(parser = parser)
-            compact_node_wrapper = self.subject.guess(parser.CompactNode)
-            if compact_node_wrapper is not None:
-                child_json = compact_node_wrapper.value['children'][self.name]
-                child_type = child_json['@type']
-                if child_type == u'Parameter' and child_json.get('format') != 'boolean':
-                    return parser.Number(parser = parser)
-        elif issubclass(parser.String, expected):
-            if self.name == '__name__':
-                formula_class = self.subject.guess(parser.FormulaClass)
-                if formula_class is not None:
-                    return parser.String(parser = parser, value = parser.column.name)
-        elif issubclass(parser.TaxScale, expected):
-            compact_node_wrapper = self.subject.guess(parser.CompactNode)
-            if compact_node_wrapper is not None:
-                child_json = compact_node_wrapper.value['children'][self.name]
-                child_type = child_json['@type']
-                if child_type == u'Scale':
-                    return parser.TaxScale(parser = parser)
-        elif issubclass(parser.UniformDictionary, expected):
-            if self.name == '_array_by_period':
-                holder = self.subject.guess(parser.Holder)
-                if holder is not None:
-                    column = holder.column
-                    entity_class = parser.tax_benefit_system.entity_class_by_key_plural[column.entity_key_plural]
-                    cell_wrapper = parser.get_cell_wrapper(container = self.container, type = column.dtype)
-                    return parser.UniformDictionary(
-                        key = parser.Period(
-                            parser = parser,
-                            ),
-                        parser = parser,
-                        value = parser.Array(
-                            cell = cell_wrapper,
-                            entity_class = parser.entity_class,
-                            parser = parser,
-                            ),
-                        )
+        compact_node = self.subject.guess(parser.CompactNode)
+        if compact_node is not None:
+            try:
+                child_path = compact_node.get_child_path(self.name)
+            except KeyError:
+                pass
+            else:
+                if child_path.type == u'Node':
+                    return parser.CompactNode(is_reference = compact_node.is_reference,
+                        legislation_path = child_path, name = self.name, parent = compact_node, parser = parser,
+                        value = child_path.json)
+        return None
+
+    def guess_entity_count(self, expected):
+        parser = self.parser
+        entity = self.subject.guess(parser.Entity)
+        if entity is not None:
+            return parser.Number(parser = parser)
+        return None
+
+    def guess_formula_class(self, expected):
+        formula = self.subject.guess(self.parser.Formula)
+        if formula is not None:
+            return formula.formula_class
+        return None
+
+    def guess_formula_class_name(self, expected):
+        parser = self.parser
+        formula_class = self.subject.guess(parser.FormulaClass)
+        if formula_class is not None:
+            return parser.String(parser = parser, value = parser.column.name)
+        return None
+
+    def guess_formula_holder(self, expected):
+        parser = self.parser
+        formula = self.subject.guess(parser.Formula)
+        if formula is not None:
+            return parser.Holder(column = formula.column, parser = parser)
+        return None
+
+    def guess_holder_array_by_period(self, expected):
+        parser = self.parser
+        holder = self.subject.guess(parser.Holder)
+        if holder is not None:
+            column = holder.column
+            cell_wrapper = parser.get_cell_wrapper(container = self.container, type = column.dtype)
+            return parser.UniformDictionary(
+                key = parser.Period(
+                    parser = parser,
+                    ),
+                parser = parser,
+                value = parser.Array(
+                    cell = cell_wrapper,
+                    entity_class = parser.entity_class,
+                    parser = parser,
+                    ),
+                )
+        return None
+
+    def guess_holder_entity(self, expected):
+        parser = self.parser
+        holder = self.subject.guess(parser.Holder)
+        if holder is not None:
+            entity_class = parser.tax_benefit_system.entity_class_by_key_plural[holder.column.entity_key_plural]
+            return parser.Entity(entity_class = entity_class, parser = parser)
+        return None
+
+    def guess_number_parameter(self, expected):
+        parser = self.parser
+        compact_node_wrapper = self.subject.guess(parser.CompactNode)
+        if compact_node_wrapper is not None:
+            child_path = compact_node_wrapper.get_child_path(self.name)
+            if child_path.type == u'Parameter' and child_path.format != 'boolean':
+                return parser.Number(parser = parser)
+        return None
+
+    def guess_period_date(self, expected):
+        parser = self.parser
+        period = self.subject.guess(parser.Period)
+        if period is not None:
+            return parser.Date(parser = parser)
+        return None
+
+    def guess_period_start(self, expected):
+        parser = self.parser
+        period = self.subject.guess(parser.Period)
+        if period is not None:
+            return parser.Instant(parser = parser)
+        return None
 
+    def guess_tax_scale_child(self, expected):
+        parser = self.parser
+        compact_node_wrapper = self.subject.guess(parser.CompactNode)
+        if compact_node_wrapper is not None:
+            if compact_node_wrapper.get_child_path(self.name).type == u'Scale':
+                return parser.TaxScale(parser = parser)
+        return None
+
+    def guess_uncached(self, expected):
+        guessed = super(Attribute, self).guess_uncached(expected)
+        if guessed is not None:
+            return guessed
+
+        expected_name = self.get_guess_rule_expected_name(expected)
+        if expected_name is None:
+            return None
+        rule_name = self.guess_rule_name_by_expected_name_and_name.get((expected_name, self.name))
+        if rule_name is not None:
+            guessed = self.guess_by_rule(rule_name, expected)
+            if guessed is not None:
+                return guessed
+        rule_name = self.guess_rule_name_by_expected_name.get(expected_name)
+        if rule_name is not None:
+            return self.guess_by_rule(rule_name, expected)
         return None
 
     @classmethod
@@ -549,6 +833,61 @@ class Attribute(AbstractWrapper):
 
 
 class Call(AbstractWrapper):
+    fields = ('keyword_argument', 'named_arguments', 'positional_arguments', 'star_argument', 'subject')
+    guess_rule_expected_names = (
+        'Array',
+        'Boolean',  # Before Number, because Boolean is a subclass of Number.
+        'CompactNode',
+        'Date',
+        'DatedHolder',
+        'Instant',
+        'Number',
+        'Period',
+        'TaxScale',
+        'UniformDictionary',
+        'UniformIterator',
+        )
+    guess_rule_name_by_expected_name_and_function_name = {
+        ('Array', 'and_'): 'guess_boolean_array_from_arguments',
+        ('Array', 'floor'): 'guess_number_array_from_arguments',
+        ('Array', 'max_'): 'guess_number_array_from_arguments',
+        ('Array', 'min_'): 'guess_number_array_from_arguments',
+        ('Array', 'not_'): 'guess_boolean_array_from_not',
+        ('Array', 'or_'): 'guess_boolean_array_from_arguments',
+        ('Array', 'round_'): 'guess_number_array_from_arguments',
+        ('Array', 'xor_'): 'guess_boolean_array_from_arguments',
+        ('Boolean', 'hasattr'): 'guess_boolean',
+        ('Date', 'date'): 'guess_date',
+        ('Number', 'len'): 'guess_number',
+        ('UniformIterator', 'sorted'): 'guess_uniform_iterator_from_sorted',
+        }
+    guess_rule_name_by_expected_name_and_name = {
+        ('Array', 'all'): 'guess_boolean',
+        ('Array', 'any'): 'guess_boolean',
+        ('Array', 'any_by_roles'): 'guess_entity_array_from_persons_variable',
+        ('Array', 'calculate'): 'guess_array_from_calculate',
+        ('Array', 'calculate_add'): 'guess_array_from_calculate',
+        ('Array', 'calculate_add_divide'): 'guess_array_from_calculate',
+        ('Array', 'calculate_divide'): 'guess_array_from_calculate',
+        ('Array', 'cast_from_entity_to_role'): 'guess_persons_array_from_entity_variable',
+        ('Array', 'cast_from_entity_to_roles'): 'guess_persons_array_from_entity_variable',
+        ('Array', 'filter_role'): 'guess_entity_array_from_filter_role',
+        ('Array', 'get_array'): 'guess_array_from_calculate',
+        ('Array', 'sum_by_entity'): 'guess_entity_array_from_persons_variable',
+        ('CompactNode', 'legislation_at'): 'guess_compact_node_from_legislation_at',
+        ('DatedHolder', 'compute'): 'guess_dated_holder_from_compute',
+        ('DatedHolder', 'compute_add'): 'guess_dated_holder_from_compute',
+        ('DatedHolder', 'compute_add_divide'): 'guess_dated_holder_from_compute',
+        ('DatedHolder', 'compute_divide'): 'guess_dated_holder_from_compute',
+        ('Instant', 'offset'): 'guess_instant_from_offset',
+        ('Period', 'offset'): 'guess_period_from_offset',
+        ('Period', 'period'): 'guess_period_from_instant',
+        ('TaxScale', 'calc'): 'guess_tax_scale_from_calc',
+        ('UniformDictionary', 'split_by_roles'): 'guess_uniform_dictionary_from_split_by_roles',
+        ('UniformIterator', 'iteritems'): 'guess_uniform_iterator_from_dictionary_method',
+        ('UniformIterator', 'iterkeys'): 'guess_uniform_iterator_from_dictionary_method',
+        ('UniformIterator', 'itervalues'): 'guess_uniform_iterator_from_dictionary_method',
+        }
     keyword_argument = None
     named_arguments = None
     positional_arguments = None
@@ -562,12 +901,12 @@ class Call(AbstractWrapper):
             assert isinstance(keyword_argument, AbstractWrapper)
             self.keyword_argument = keyword_argument
         if named_arguments is None:
-            named_arguments = collections.OrderedDict()
+            named_arguments = empty_named_arguments
         else:
             assert isinstance(named_arguments, collections.OrderedDict)
         self.named_arguments = named_arguments
         if positional_arguments is None:
-            positional_arguments = []
+            positional_arguments = empty_positional_arguments
         else:
             assert isinstance(positional_arguments, list)
         self.positional_arguments = positional_arguments
@@ -581,8 +920,196 @@ class Call(AbstractWrapper):
         if function is not None:
             function.parse_call(self)
 
-    def guess(self, expected):
-        guessed = super(Call, self).guess(expected)
+    def get_variable_cell_wrapper(self, argument):
+        """Return the wrapper of a cell of the column named by the variable (or holder) argument, or None."""
+        parser = self.parser
+        variable = argument.guess(parser.Variable)
+        if variable is None:
+            return None
+        variable_name = variable.name
+        if variable_name.endswith(u'_holder'):
+            variable_name = variable_name[:-len(u'_holder')]
+        column = parser.tax_benefit_system.column_by_name[variable_name]
+        return parser.get_cell_wrapper(container = self.container, type = column.dtype)
+
+    def guess_array_from_calculate(self, expected, method):
+        parser = self.parser
+        if len(self.positional_arguments) < 1:
+            raise ParseError("Method {} expects a variable name".format(method.name))
+        variable_name_wrapper = self.positional_arguments[0].guess(parser.String)
+        if variable_name_wrapper is None:
+            cell_wrapper = None
+            entity_class = None
+        else:
+            tax_benefit_system = parser.tax_benefit_system
+            column = tax_benefit_system.column_by_name[variable_name_wrapper.value]
+            cell_wrapper = parser.get_cell_wrapper(container = self.container, type = column.dtype)
+            entity_class = tax_benefit_system.entity_class_by_key_plural[column.entity_key_plural]
+        return parser.Array(
+            cell = cell_wrapper,
+            entity_class = entity_class,
+            parser = parser,
+            )
+
+    def guess_boolean(self, expected, callee):
+        return self.parser.Boolean(parser = self.parser)
+
+    def guess_boolean_array_from_arguments(self, expected, function):
+        parser = self.parser
+        for argument in self.positional_arguments:
+            array = argument.guess(parser.Array)
+            if array is not None:
+                return parser.Array(
+                    cell = parser.Boolean(
+                        parser = parser,
+                        ),
+                    entity_class = array.entity_class,
+                    parser = parser,
+                    )
+        return None
+
+    def guess_boolean_array_from_not(self, expected, function):
+        parser = self.parser
+        if len(self.positional_arguments) != 1:
+            raise ParseError("Function not_ expects 1 positional argument, got {}".format(
+                len(self.positional_arguments)))
+        array = self.positional_arguments[0].guess(parser.Array)
+        if array is not None:
+            return parser.Array(
+                cell = parser.Boolean(
+                    parser = parser,
+                    ),
+                entity_class = array.entity_class,
+                parser = parser,
+                )
+        return None
+
+    def guess_compact_node_from_legislation_at(self, expected, method):
+        parser = self.parser
+        if method.subject.guess(parser.Simulation):
+            positional_arguments = self.positional_arguments
+            if len(positional_arguments) != 1:
+                raise ParseError("Method legislation_at expects 1 positional argument, got {}".format(
+                    len(positional_arguments)))
+            instant = positional_arguments[0].guess(parser.Instant)
+            if instant is not None:
+                named_arguments = self.named_arguments
+                if len(named_arguments) > 1:
+                    raise ParseError("Method legislation_at expects at most 1 named argument, got {}".format(
+                        len(named_arguments)))
+                reference = named_arguments.get('reference')
+                if reference is not None:
+                    raise ParseError("Method legislation_at is not supported with a reference")
+                return parser.CompactNode(
+                    is_reference = bool(reference),
+                    parser = parser,
+                    value = parser.tax_benefit_system.legislation_json,
+                    )
+        return None
+
+    def guess_date(self, expected, function):
+        return self.parser.Date(parser = self.parser)
+
+    def guess_dated_holder_from_compute(self, expected, method):
+        parser = self.parser
+        if len(self.positional_arguments) < 1:
+            raise ParseError("Method {} expects a variable name".format(method.name))
+        variable_name_wrapper = self.positional_arguments[0].guess(parser.String)
+        if variable_name_wrapper is None:
+            column = None
+        else:
+            column = parser.tax_benefit_system.column_by_name[variable_name_wrapper.value]
+        return parser.DatedHolder(
+            column = column,
+            parser = parser,
+            )
+
+    def guess_entity_array_from_filter_role(self, expected, method):
+        parser = self.parser
+        if len(self.positional_arguments) < 1:
+            raise ParseError("Method {} expects a variable".format(method.name))
+        return parser.Array(
+            cell = self.get_variable_cell_wrapper(self.positional_arguments[0]),
+            entity_class = parser.entity_class,
+            parser = parser,
+            )
+
+    def guess_entity_array_from_persons_variable(self, expected, method):
+        parser = self.parser
+        if len(self.positional_arguments) != 1:
+            raise ParseError("Method {} expects 1 positional argument, got {}".format(method.name,
+                len(self.positional_arguments)))
+        if len(self.named_arguments) != 0:
+            raise ParseError("Method {} expects no named argument, got {}".format(method.name,
+                len(self.named_arguments)))
+        return parser.Array(
+            cell = self.get_variable_cell_wrapper(self.positional_arguments[0]),
+            entity_class = parser.entity_class,
+            parser = parser,
+            )
+
+    def guess_instant_from_offset(self, expected, method):
+        parser = self.parser
+        if method.subject.guess(parser.Instant) is not None:
+            return parser.Instant(parser = parser)
+        return None
+
+    def guess_number(self, expected, function):
+        return self.parser.Number(parser = self.parser)
+
+    def guess_number_array_from_arguments(self, expected, function):
+        parser = self.parser
+        for argument in self.positional_arguments:
+            array = argument.guess(parser.Array)
+            if array is not None:
+                return parser.Array(
+                    cell = parser.Number(
+                        parser = parser,
+                        ),
+                    entity_class = array.entity_class,
+                    parser = parser,
+                    )
+        return None
+
+    def guess_period_from_instant(self, expected, method):
+        parser = self.parser
+        if method.subject.guess(parser.Instant):
+            # instant.period(...)
+            if len(self.positional_arguments) < 1:
+                raise ParseError("Method period expects a unit")
+            unit = self.positional_arguments[0].guess(parser.String)
+            if unit is not None:
+                if unit.value is None:
+                    raise ParseError('Missing value in unit string')
+                return parser.Period(parser = parser, unit = unit.value)
+        return None
+
+    def guess_period_from_offset(self, expected, method):
+        parser = self.parser
+        period = method.subject.guess(parser.Period)
+        if period is not None:
+            # period.offset(...)
+            return parser.Period(parser = parser, unit = period.unit)
+        return None
+
+    def guess_persons_array_from_entity_variable(self, expected, method):
+        parser = self.parser
+        if len(self.positional_arguments) < 1:
+            raise ParseError("Method {} expects a variable".format(method.name))
+        return parser.Array(
+            cell = self.get_variable_cell_wrapper(self.positional_arguments[0]),
+            entity_class = parser.person_class,
+            parser = parser,
+            )
+
+    def guess_tax_scale_from_calc(self, expected, method):
+        parser = self.parser
+        if method.subject.guess(parser.Instant) is not None:
+            return parser.TaxScale(parser = parser)
+        return None
+
+    def guess_uncached(self, expected):
+        guessed = super(Call, self).guess_uncached(expected)
         if guessed is not None:
             return guessed
 
@@ -598,267 +1125,92 @@ class Call(AbstractWrapper):
                             ),
                         parser = parser,
                         )
-            assert function.returns, "Function {} has no return statement".format(function.name)
+            if not function.returns:
+                raise ParseError("Function {} has no return statement".format(function.name))
             return function.returns[-1].guess(expected)
 
-        if issubclass(parser.Array, expected):
-            function = self.subject.guess(parser.Variable)
-            if function is not None:
-                if function.name in (u'and_', u'or_', u'xor_'):
-                    for argument in self.positional_arguments:
-                        array = argument.guess(parser.Array)
-                        if array is not None:
-                            return parser.Array(
-                                cell = parser.Boolean(
-                                    parser = parser,
-                                    ),
-                                entity_class = array.entity_class,
-                                parser = parser,
-                                )
-                elif function.name in (u'floor', u'max_', u'min_', u'round_'):
-                    for argument in self.positional_arguments:
-                        array = argument.guess(parser.Array)
-                        if array is not None:
-                            return parser.Array(
-                                cell = parser.Number(
-                                    parser = parser,
-                                    ),
-                                entity_class = array.entity_class,
-                                parser = parser,
-                                )
-                elif function.name == 'not_':
-                    assert len(self.positional_arguments) == 1
-                    argument = self.positional_arguments[0]
-                    array = argument.guess(parser.Array)
-                    if array is not None:
-                        return parser.Array(
-                            cell = parser.Boolean(
-                                parser = parser,
-                                ),
-                            entity_class = array.entity_class,
-                            parser = parser,
-                            )
-            else:
-                method = self.subject.guess(parser.Attribute)
-                if method is not None:
-                    if method.name in ('all', 'any'):
-                        return parser.Boolean(
-                            parser = parser,
-                            )
-                    if method.name in ('any_by_roles', 'sum_by_entity'):
-                        assert len(self.positional_arguments) == 1, self.positional_arguments
-                        assert len(self.named_arguments) == 0, self.named_arguments
-                        variable = self.positional_arguments[0].guess(parser.Variable)
-                        if variable is None:
-                            cell_wrapper = None
-                        else:
-                            variable_name = variable.name
-                            if variable_name.endswith(u'_holder'):
-                                variable_name = variable_name[:-len(u'_holder')]
-                            tax_benefit_system = parser.tax_benefit_system
-                            column = tax_benefit_system.column_by_name[variable_name]
-                            cell_wrapper = parser.get_cell_wrapper(container = self.container, type = column.dtype)
-                        return parser.Array(
-                            cell = cell_wrapper,
-                            entity_class = parser.entity_class,
-                            parser = parser,
-                            )
-                    if method.name in ('calculate', 'calculate_add', 'calculate_add_divide', 'calculate_divide',
-                            'get_array'):
-                        assert len(self.positional_arguments) >= 1
-                        variable_name_wrapper = self.positional_arguments[0].guess(parser.String)
-                        if variable_name_wrapper is None:
-                            cell_wrapper = None
-                            entity_class = None
-                        else:
-                            tax_benefit_system = parser.tax_benefit_system
-                            column = tax_benefit_system.column_by_name[variable_name_wrapper.value]
-                            cell_wrapper = parser.get_cell_wrapper(container = self.container, type = column.dtype)
-                            entity_class = tax_benefit_system.entity_class_by_key_plural[column.entity_key_plural]
-                        return parser.Array(
-                            cell = cell_wrapper,
-                            entity_class = entity_class,
-                            parser = parser,
-                            )
-                    if method.name in ('cast_from_entity_to_role', 'cast_from_entity_to_roles'):
-                        assert len(self.positional_arguments) >= 1
-                        variable = self.positional_arguments[0].guess(parser.Variable)
-                        if variable is None:
-                            cell_wrapper = None
-                        else:
-                            variable_name = variable.name
-                            if variable_name.endswith(u'_holder'):
-                                variable_name = variable_name[:-len(u'_holder')]
-                            tax_benefit_system = parser.tax_benefit_system
-                            column = tax_benefit_system.column_by_name[variable_name]
-                            cell_wrapper = parser.get_cell_wrapper(container = self.container, type = column.dtype)
-                        return parser.Array(
-                            cell = cell_wrapper,
-                            entity_class = parser.person_class,
-                            parser = parser,
-                            )
-                    if method.name == 'filter_role':
-                        assert len(self.positional_arguments) >= 1
-                        variable = self.positional_arguments[0].guess(parser.Variable)
-                        if variable is None:
-                            cell_wrapper = None
-                        else:
-                            variable_name = variable.name
-                            if variable_name.endswith(u'_holder'):
-                                variable_name = variable_name[:-len(u'_holder')]
-                            tax_benefit_system = parser.tax_benefit_system
-                            column = tax_benefit_system.column_by_name[variable_name]
-                            cell_wrapper = parser.get_cell_wrapper(container = self.container, type = column.dtype)
-                        return parser.Array(
-                            cell = cell_wrapper,
-                            entity_class = parser.entity_class,
-                            parser = parser,
-                            )
-        elif issubclass(parser.Boolean, expected):
-            function = self.subject.guess(parser.Variable)
-            if function is not None:
-                if function.name == 'hasattr':
-                    return parser.Boolean(parser = parser)
-        elif issubclass(parser.CompactNode, expected):
-            method = self.subject.guess(parser.Attribute)
-            if method is not None:
-                if method.name == 'legislation_at':
-                    method_subject = method.subject
-                    if method_subject.guess(parser.Simulation):
-                        positional_arguments = self.positional_arguments
-                        assert len(positional_arguments) == 1, positional_arguments
-                        instant = positional_arguments[0].guess(parser.Instant)
-                        if instant is not None:
-                            named_arguments = self.named_arguments
-                            assert len(named_arguments) <= 1, named_arguments
-                            reference = named_arguments.get('reference')
-                            assert reference is None
-                            return parser.CompactNode(
-                                is_reference = bool(reference),
-                                parser = parser,
-                                value = parser.tax_benefit_system.legislation_json,
-                                )
-        elif issubclass(parser.Date, expected):
-            function = self.subject.guess(parser.Variable)
-            if function is not None:
-                if function.name == 'date':
-                    return parser.Date(parser = parser)
-        elif issubclass(parser.DatedHolder, expected):
-            method = self.subject.guess(parser.Attribute)
-            if method is not None:
-                if method.name in ('compute', 'compute_add', 'compute_add_divide', 'compute_divide'):
-                    assert len(self.positional_arguments) >= 1
-                    variable_name_wrapper = self.positional_arguments[0].guess(parser.String)
-                    if variable_name_wrapper is None:
-                        column = None
-                    else:
-                        column = parser.tax_benefit_system.column_by_name[variable_name_wrapper.value]
-                    return parser.DatedHolder(
-                        column = column,
-                        parser = parser,
-                        )
-        elif issubclass(parser.Instant, expected):
-            method = self.subject.guess(parser.Attribute)
-            if method is not None:
-                if method.name == 'offset':
-                    if method.subject.guess(parser.Instant) is not None:
-                        return parser.Instant(parser = parser)
-        elif issubclass(parser.Number, expected):
-            function = self.subject.guess(parser.Variable)
-            if function is not None:
-                if function.name == 'len':
-                    return parser.Number(parser = parser)
-        elif issubclass(parser.Period, expected):
-            method = self.subject.guess(parser.Attribute)
-            if method is not None:
-                if method.name == 'offset':
-                    period = method.subject.guess(parser.Period)
-                    if period is not None:
-                        # period.offset(...)
-                        return parser.Period(parser = parser, unit = period.unit)
-                elif method.name == 'period':
-                    if method.subject.guess(parser.Instant):
-                        # instant.period(...)
-                        assert len(self.positional_arguments) >= 1
-                        unit = self.positional_arguments[0].guess(parser.String)
-                        if unit is not None:
-                            assert unit.value is not None, 'Missing value in unit string'
-                            return parser.Period(parser = parser, unit = unit.value)
-        elif issubclass(parser.TaxScale, expected):
-            method = self.subject.guess(parser.Attribute)
-            if method is not None:
-                if method.name == 'calc':
-                    if method.subject.guess(parser.Instant) is not None:
-                        return parser.TaxScale(parser = parser)
-        elif issubclass(parser.UniformDictionary, expected):
+        expected_name = self.get_guess_rule_expected_name(expected)
+        if expected_name is None:
+            return None
+        function = self.subject.guess(parser.Variable)
+        if function is not None:
+            rule_name = self.guess_rule_name_by_expected_name_and_function_name.get((expected_name, function.name))
+            if rule_name is not None:
+                guessed = self.guess_by_rule(rule_name, expected, function)
+                if guessed is not None:
+                    return guessed
+        else:
             method = self.subject.guess(parser.Attribute)
             if method is not None:
-                if method.name == 'split_by_roles':
-                    assert len(self.positional_arguments) == 1, self.positional_arguments
-                    assert len(self.named_arguments) <= 1, self.named_arguments
-                    variable = self.positional_arguments[0].guess(parser.Variable)
-                    if variable is None:
-                        cell_wrapper = None
-                    else:
-                        variable_name = variable.name
-                        if variable_name.endswith(u'_holder'):
-                            variable_name = variable_name[:-len(u'_holder')]
-                        tax_benefit_system = parser.tax_benefit_system
-                        column = tax_benefit_system.column_by_name[variable_name]
-                        cell_wrapper = parser.get_cell_wrapper(container = self.container, type = column.dtype)
-                    return parser.UniformDictionary(
-                        key = parser.Role(
-                            parser = parser,
-                            ),
-                        parser = parser,
-                        value = parser.Array(
-                            cell = cell_wrapper,
-                            entity_class = parser.entity_class,
-                            parser = parser,
-                            ),
-                        )
-        elif issubclass(parser.UniformIterator, expected):
-            function = self.subject.guess(parser.Variable)
-            if function is not None:
-                if function.name == 'sorted':
-                    assert len(self.positional_arguments) >= 1
-                    argument = self.positional_arguments[0]
-                    uniform_iterator = argument.guess(expected)
-                    if uniform_iterator is not None:
-                        return uniform_iterator
-                    uniform_dictionary = argument.guess(parser.UniformDictionary)
-                    if uniform_dictionary is not None:
-                        return uniform_dictionary.guess(expected)
-            else:
-                method = self.subject.guess(parser.Attribute)
-                if method is not None:
-                    if method.name == 'iterkeys':
-                        uniform_dictionary = method.subject.guess(parser.UniformDictionary)
-                        if uniform_dictionary is not None:
-                            return parser.UniformIterator(
-                                items = [uniform_dictionary.key],
-                                parser = parser,
-                                )
-                    elif method.name == 'iteritems':
-                        uniform_dictionary = method.subject.guess(parser.UniformDictionary)
-                        if uniform_dictionary is not None:
-                            return parser.UniformIterator(
-                                items = [
-                                    uniform_dictionary.key,
-                                    uniform_dictionary.value,
-                                    ],
-                                parser = parser,
-                                )
-                    elif method.name == 'itervalues':
-                        uniform_dictionary = method.subject.guess(parser.UniformDictionary)
-                        if uniform_dictionary is not None:
-                            return parser.UniformIterator(
-                                items = [uniform_dictionary.value],
-                                parser = parser,
-                                )
+                rule_name = self.guess_rule_name_by_expected_name_and_name.get((expected_name, method.name))
+                if rule_name is not None:
+                    guessed = self.guess_by_rule(rule_name, expected, method)
+                    if guessed is not None:
+                        return guessed
+        rule_name = self.guess_rule_name_by_expected_name.get(expected_name)
+        if rule_name is not None:
+            return self.guess_by_rule(rule_name, expected, None)
+        return None
+
+    def guess_uniform_dictionary_from_split_by_roles(self, expected, method):
+        parser = self.parser
+        if len(self.positional_arguments) != 1:
+            raise ParseError("Method split_by_roles expects 1 positional argument, got {}".format(
+                len(self.positional_arguments)))
+        if len(self.named_arguments) > 1:
+            raise ParseError("Method split_by_roles expects at most 1 named argument, got {}".format(
+                len(self.named_arguments)))
+        return parser.UniformDictionary(
+            key = parser.Role(
+                parser = parser,
+                ),
+            parser = parser,
+            value = parser.Array(
+                cell = self.get_variable_cell_wrapper(self.positional_arguments[0]),
+                entity_class = parser.entity_class,
+                parser = parser,
+                ),
+            )
 
+    def guess_uniform_iterator_from_dictionary_method(self, expected, method):
+        parser = self.parser
+        uniform_dictionary = method.subject.guess(parser.UniformDictionary)
+        if uniform_dictionary is None:
+            return None
+        if method.name == 'iteritems':
+            items = [
+                uniform_dictionary.key,
+                uniform_dictionary.value,
+                ]
+        elif method.name == 'iterkeys':
+            items = [uniform_dictionary.key]
+        else:
+            assert method.name == 'itervalues', method.name
+            items = [uniform_dictionary.value]
+        return parser.UniformIterator(
+            items = items,
+            parser = parser,
+            )
+
+    def guess_uniform_iterator_from_sorted(self, expected, function):
+        parser = self.parser
+        if len(self.positional_arguments) < 1:
+            raise ParseError("Function sorted expects an iterable")
+        argument = self.positional_arguments[0]
+        uniform_iterator = argument.guess(expected)
+        if uniform_iterator is not None:
+            return uniform_iterator
+        uniform_dictionary = argument.guess(parser.UniformDictionary)
+        if uniform_dictionary is not None:
+            return uniform_dictionary.guess(expected)
         return None
 
+    def iter_guess_rule_expected_names(self):
+        for expected_name in super(Call, self).iter_guess_rule_expected_names():
+            yield expected_name
+        for expected_name, name in self.guess_rule_name_by_expected_name_and_function_name:
+            yield expected_name
+
     @classmethod
     def parse(cls, subject, node, container = None, parser = None):
         if node is None:
@@ -877,8 +1229,9 @@ class Call(AbstractWrapper):
             if argument.type == symbols.argument:
                 # Named argument
                 argument_children = argument.children
-                assert len(argument_children) == 3, "Unexpected length {} of children in argument:\n{}\n\n{}".format(
-                    len(argument_children), repr(argument), unicode(argument).encode('utf-8'))
+                if len(argument_children) != 3:
+                    raise ParseError("Unexpected length {} of children in argument:\n{}\n\n{}".format(
+                        len(argument_children), repr(argument), unicode(argument).encode('utf-8')))
                 argument_name, equal, argument_value = argument_children
                 assert argument_name.type == tokens.NAME, "Unexpected name type:\n{}\n\n{}".format(repr(argument_name),
                     unicode(argument_name).encode('utf-8'))
@@ -905,12 +1258,13 @@ class Call(AbstractWrapper):
             assert child.type == tokens.COMMA, "Unexpected comma type:\n{}\n\n{}".format(repr(child),
                 unicode(child).encode('utf-8'))
             child_index += 1
-        return cls(container = container, keyword_argument = keyword_argument, named_arguments = named_arguments,
-            node = node, parser = parser, positional_arguments = positional_arguments, star_argument = star_argument,
-            subject = subject)
+        return cls(container = container, keyword_argument = keyword_argument,
+            named_arguments = named_arguments or None, node = node, parser = parser,
+            positional_arguments = positional_arguments or None, star_argument = star_argument, subject = subject)
 
 
 class Class(AbstractWrapper):
+    fields = ('base_class_name', 'name', 'variable_by_name')
     base_class_name = None
     name = None
     variable_by_name = None
@@ -952,14 +1306,16 @@ class Class(AbstractWrapper):
     def parse(cls, node, container = None, parser = None):
         try:
             children = node.children
-            assert len(children) == 7, len(children)
+            if len(children) != 7 or children[2].type != tokens.LPAR or children[3].type != tokens.NAME \
+                    or children[4].type != tokens.RPAR:
+                raise ParseError("Unexpected class definition, without a single base class name:\n{}\n\n{}".format(
+                    repr(node), unicode(node).encode('utf-8')))
             assert children[0].type == tokens.NAME and children[0].value == 'class'
             assert children[1].type == tokens.NAME
             name = children[1].value
-            assert children[2].type == tokens.LPAR and children[2].value == '('
-            assert children[3].type == tokens.NAME
+            assert children[2].value == '('
             base_class_name = children[3].value
-            assert children[4].type == tokens.RPAR and children[4].value == ')'
+            assert children[4].value == ')'
             assert children[5].type == tokens.COLON and children[5].value == ':'
 
             variable_by_name = collections.OrderedDict()
@@ -967,11 +1323,13 @@ class Class(AbstractWrapper):
                 parser = parser, variable_by_name = variable_by_name)
 
             suite = children[6]
-            assert suite.type == symbols.suite
+            if suite.type != symbols.suite or suite.children[1].value != '    ':
+                raise ParseError("Unexpected class body, not indented by 4 spaces:\n{}\n\n{}".format(repr(node),
+                    unicode(node).encode('utf-8')))
             suite_children = suite.children
             assert len(suite_children) > 2, len(suite_children)
             assert suite_children[0].type == tokens.NEWLINE and suite_children[0].value == '\n'
-            assert suite_children[1].type == tokens.INDENT and suite_children[1].value == '    '
+            assert suite_children[1].type == tokens.INDENT
             for suite_child in itertools.islice(suite_children, 2, None):
                 if suite_child.type == symbols.decorated:
                     decorator = parser.Decorator.parse(suite_child, container = self, parser = parser)
@@ -983,15 +1341,16 @@ class Class(AbstractWrapper):
                     variable_by_name[function.name] = parser.Variable(container = self, name = function.name,
                         parser = parser, value = function)
                 elif suite_child.type == symbols.simple_stmt:
-                    assert len(suite_child.children) == 2, len(suite_child.children)
                     expression = suite_child.children[0]
-                    assert expression.type in (symbols.expr_stmt, tokens.STRING), expression.type
+                    if len(suite_child.children) != 2 or expression.type not in (symbols.expr_stmt, tokens.STRING):
+                        raise ParseError("Unexpected simple statement in class definition:\n{}\n\n{}".format(
+                            repr(suite_child), unicode(suite_child).encode('utf-8')))
                     assert suite_child.children[1].type == tokens.NEWLINE and suite_child.children[1].value == '\n'
                 elif suite_child.type == tokens.DEDENT:
                     continue
                 else:
-                    assert False, "Unexpected statement in class definition:\n{}\n\n{}".format(repr(suite_child),
-                        unicode(suite_child).encode('utf-8'))
+                    raise ParseError("Unexpected statement in class definition:\n{}\n\n{}".format(repr(suite_child),
+                        unicode(suite_child).encode('utf-8')))
             return self
         except:
             if node is not None:
@@ -1005,40 +1364,66 @@ class ClassFileInput(AbstractWrapper):
         return parser.Class
 
     @classmethod
-    def parse(cls, class_definition, parser = None):
-        source_lines, line_number = inspect.getsourcelines(class_definition)
-        source = textwrap.dedent(''.join(source_lines))
-        node = parser.driver.parse_string(source)
-        assert node.type == symbols.file_input, "Unexpected file input type:\n{}\n\n{}".format(repr(node),
-            unicode(node).encode('utf-8'))
-        children = node.children
-        assert len(children) == 2 and children[0].type == symbols.classdef and children[1].type == tokens.ENDMARKER, \
-            "Unexpected node children in:\n{}\n\n{}".format(repr(node), unicode(node).encode('utf-8'))
+    def parse(cls, class_definition, node = None, parser = None):
+        """Wrap a class definition.
+
+        node is the parse tree of the (dedented) source of the class, when the caller has already parsed it.
+        """
+        module_node = None
+        if parser.parse_whole_modules:
+            module_node, class_node = parser.get_definition_node(class_definition)
+            if module_node is not None:
+                node = class_node
+        if module_node is None:
+            if node is None:
+                source_lines, line_number = inspect.getsourcelines(class_definition)
+                source = textwrap.dedent(''.join(source_lines))
+                node = parser.parse_string(source)
+            assert node.type == symbols.file_input, "Unexpected file input type:\n{}\n\n{}".format(repr(node),
+                unicode(node).encode('utf-8'))
+            children = node.children
+            if not (len(children) == 2 and children[0].type == symbols.classdef
+                    and children[1].type == tokens.ENDMARKER):
+                raise ParseError("Unexpected node children in:\n{}\n\n{}".format(repr(node),
+                    unicode(node).encode('utf-8')))
+            module_node = node
+            class_node = children[0]
+        if class_node.type != symbols.classdef:
+            raise ParseError("Unexpected class definition type:\n{}\n\n{}".format(
+                repr(class_node), unicode(class_node).encode('utf-8')))
         python_module = inspect.getmodule(class_definition)
         if parser.country_package is not None:
             assert python_module.__file__.startswith(os.path.dirname(parser.country_package.__file__)), \
-                "Requested class is defined outside country_package:\n{}".format(source)
+                "Requested class is defined outside country_package:\n{}".format(unicode(class_node).encode('utf-8'))
         module = parser.python_module_by_name.get(python_module.__name__)
         if module is None:
-            parser.python_module_by_name[python_module.__name__] = module = parser.Module(node, python = python_module,
-                parser = parser)
+            parser.python_module_by_name[python_module.__name__] = module = parser.Module(module_node,
+                python = python_module, parser = parser)
         self = cls(parser = parser)
         class_definition_class = self.get_class_class(parser = parser)
+        profiler = parser.profiler
+        if profiler is not None:
+            profiler.start('wrap', column = parser.column)
         try:
-            return class_definition_class.parse(children[0], container = module, parser = parser)
+            return class_definition_class.parse(class_node, container = module, parser = parser)
         except:
-            if node is not None:
-                print "An exception occurred in node:\n{}\n\n{}".format(repr(node), unicode(node).encode('utf-8'))
+            print "An exception occurred in node:\n{}\n\n{}".format(repr(node), unicode(node).encode('utf-8'))
             raise
+        finally:
+            if profiler is not None:
+                profiler.stop()
 
 
 class CompactNode(AbstractWrapper):
+    fields = ('is_reference', 'legislation_path', 'name', 'parent', 'value')
     is_reference = True
+    legislation_path = None  # Path of value in the legislation paths index (None when value is not indexed)
     name = None
     parent = None  # Parent Compact Node wrapper
     value = None  # Law node JSON
 
-    def __init__(self, is_reference = False, name = None, parent = None, parser = None, value = None):
+    def __init__(self, is_reference = False, legislation_path = None, name = None, parent = None, parser = None,
+            value = None):
         super(CompactNode, self).__init__(parser = parser)
         if not is_reference:
             self.is_reference = False
@@ -1051,8 +1436,26 @@ class CompactNode(AbstractWrapper):
         if value is not None:
             assert isinstance(value, dict)
             self.value = value
+            if legislation_path is None:
+                legislation_path = parser.legislation_paths_index.get_path_of_json(value)
+        if legislation_path is not None:
+            assert legislation_path.json is value
+            self.legislation_path = legislation_path
+
+    def get_child_path(self, name):
+        """Return the legislation path of a child of this node, raising KeyError when it doesn't exist."""
+        legislation_path = self.legislation_path
+        if legislation_path is None:
+            # Value is not a node of the legislation of the tax-benefit system: Index it alone.
+            self.legislation_path = legislation_path = legislation_paths.LegislationPathsIndex(self.value).root
+        return legislation_path.child_by_name[name]
 
     def iter_names(self):
+        legislation_path = self.legislation_path
+        if legislation_path is not None and legislation_path.name == self.name:
+            for name in legislation_path.names:
+                yield name
+            return
         parent = self.parent
         if parent is not None:
             for ancestor_name in parent.iter_names():
@@ -1061,12 +1464,21 @@ class CompactNode(AbstractWrapper):
         if name is not None:
             yield name
 
+    @property
+    def names(self):
+        """Return the tuple of the names of this node, from the root of the legislation."""
+        legislation_path = self.legislation_path
+        if legislation_path is not None and legislation_path.name == self.name:
+            return legislation_path.names
+        return tuple(self.iter_names())
+
     @property
     def path(self):
-        return '.'.join(self.iter_names())
+        return '.'.join(self.names)
 
 
 class Comparison(AbstractWrapper):
+    fields = ('left', 'operator', 'right')
     left = None
     operator = None
     right = None
@@ -1081,8 +1493,8 @@ class Comparison(AbstractWrapper):
         assert isinstance(right, AbstractWrapper)
         self.right = right
 
-    def guess(self, expected):
-        guessed = super(Comparison, self).guess(expected)
+    def guess_uncached(self, expected):
+        guessed = super(Comparison, self).guess_uncached(expected)
         if guessed is not None:
             return guessed
 
@@ -1128,8 +1540,9 @@ class Comparison(AbstractWrapper):
         assert node.type == symbols.comparison, "Unexpected comparison type:\n{}\n\n{}".format(repr(node),
             unicode(node).encode('utf-8'))
         children = node.children
-        assert len(children) == 3, "Unexpected length {} of children in comparison:\n{}\n\n{}".format(len(children),
-            repr(node), unicode(node).encode('utf-8'))
+        if len(children) != 3:
+            raise ParseError("Unexpected length {} of children in comparison:\n{}\n\n{}".format(len(children),
+                repr(node), unicode(node).encode('utf-8')))
         left, operator, right = children
         left = parser.parse_value(left, container = container)
         if operator.type == tokens.NAME:
@@ -1148,8 +1561,8 @@ class Comparison(AbstractWrapper):
                     and second_word.value == 'in':
                 operator_symbol = 'not in'
             else:
-                assert False, "Unexpected comp_op children:\n{}\n\n{}".format(repr(node),
-                    unicode(node).encode('utf-8'))
+                raise ParseError("Unexpected comp_op children:\n{}\n\n{}".format(repr(node),
+                    unicode(node).encode('utf-8')))
         else:
             assert operator.type in (
                 tokens.EQEQUAL,
@@ -1175,6 +1588,7 @@ class Date(AbstractWrapper):
 
 
 class DatedHolder(AbstractWrapper):
+    fields = ('column', 'value')
     column = None
     value = None  # array value, as a numpy array
 
@@ -1207,6 +1621,7 @@ class DateTime64(AbstractWrapper):
 
 
 class Decorator(AbstractWrapper):
+    fields = ('decorated', 'name', 'subject')
     decorated = None
     name = None
     subject = None  # The decorator
@@ -1224,12 +1639,15 @@ class Decorator(AbstractWrapper):
     def parse(cls, node, container = None, parser = None):
         try:
             children = node.children
-            assert len(children) == 2, len(children)
+            if len(children) != 2 or children[0].type != symbols.decorator or children[1].type != symbols.funcdef:
+                raise ParseError("Unexpected decorated definition, without a single decorated function:\n{}\n\n{}"
+                    .format(repr(node), unicode(node).encode('utf-8')))
 
             decorator = children[0]
-            assert decorator.type == symbols.decorator
             decorator_children = decorator.children
-            assert len(decorator_children) == 6, len(decorator_children)
+            if len(decorator_children) != 6:
+                raise ParseError("Unexpected decorator, without a single call:\n{}\n\n{}".format(repr(decorator),
+                    unicode(decorator).encode('utf-8')))
             assert decorator_children[0].type == tokens.AT and decorator_children[0].value == '@'
             subject = parser.Variable.parse(decorator_children[1], container = container, parser = parser)
             name = decorator_children[1].value
@@ -1240,7 +1658,6 @@ class Decorator(AbstractWrapper):
             subject = subject
 
             decorated = children[1]
-            assert decorated.type == symbols.funcdef
             decorated = container.get_function_class(parser = parser).parse(decorated, container = container,
                 parser = parser)
 
@@ -1253,6 +1670,7 @@ class Decorator(AbstractWrapper):
 
 
 class Dictionary(AbstractWrapper):
+    fields = ('value',)
     value = None  # Dictionary value, as a dict
 
     def __init__(self, container = None, hint = None, node = None, parser = None, value = None):
@@ -1263,6 +1681,7 @@ class Dictionary(AbstractWrapper):
 
 
 class Enum(AbstractWrapper):
+    fields = ('value',)
     value = None
 
     def __init__(self, container = None, node = None, parser = None, value = None):
@@ -1270,8 +1689,8 @@ class Enum(AbstractWrapper):
         if value is not None:
             self.value = value
 
-    def guess(self, expected):
-        guessed = super(Enum, self).guess(expected)
+    def guess_uncached(self, expected):
+        guessed = super(Enum, self).guess_uncached(expected)
         if guessed is not None:
             return guessed
 
@@ -1295,6 +1714,7 @@ class Enum(AbstractWrapper):
 
 
 class Entity(AbstractWrapper):
+    fields = ('entity_class',)
     entity_class = None
 
     def __init__(self, container = None, entity_class = None, hint = None, node = None, parser = None):
@@ -1304,6 +1724,7 @@ class Entity(AbstractWrapper):
 
 
 class Expression(AbstractWrapper):
+    fields = ('operands', 'operator')
     operands = None
     operator = None
 
@@ -1314,8 +1735,8 @@ class Expression(AbstractWrapper):
         assert isinstance(operator, basestring)
         self.operator = operator
 
-    def guess(self, expected):
-        guessed = super(Expression, self).guess(expected)
+    def guess_uncached(self, expected):
+        guessed = super(Expression, self).guess_uncached(expected)
         if guessed is not None:
             return guessed
 
@@ -1366,6 +1787,7 @@ class Expression(AbstractWrapper):
 
 
 class Factor(AbstractWrapper):
+    fields = ('operand', 'operator')
     operand = None
     operator = None
 
@@ -1384,13 +1806,15 @@ class Factor(AbstractWrapper):
         assert len(children) == 2, "Unexpected length {} of children in factor:\n{}\n\n{}".format(len(children),
             repr(node), unicode(node).encode('utf-8'))
         operator, operand = children
-        assert operator.type in (tokens.MINUS, tokens.TILDE), "Unexpected operator type:\n{}\n\n{}".format(repr(node),
-            unicode(node).encode('utf-8'))
+        if operator.type not in (tokens.MINUS, tokens.TILDE):
+            raise ParseError("Unexpected operator type:\n{}\n\n{}".format(repr(node),
+                unicode(node).encode('utf-8')))
         operand = parser.parse_value(operand, container = container)
         return cls(container = container, node = node, operand = operand, operator = operator.value, parser = parser)
 
 
 class For(AbstractWrapper):
+    fields = ('body', 'iterator', 'variable_by_name')
     body = None
     iterator = None
     variable_by_name = None
@@ -1417,7 +1841,7 @@ class For(AbstractWrapper):
                     parser = parser,
                     )
             else:
-                assert False, "{} has no iterator".format(iterator)
+                raise ParseError("{} has no iterator".format(iterator))
 
         assert isinstance(variable_by_name, collections.OrderedDict)
         for variable, value in itertools.izip(variable_by_name.itervalues(), guessed_iterator.items):
@@ -1430,8 +1854,9 @@ class For(AbstractWrapper):
         assert node.type == symbols.for_stmt, "Unexpected for statement type:\n{}\n\n{}".format(repr(node),
             unicode(node).encode('utf-8'))
         children = node.children
-        assert len(children) == 6, "Unexpected length {} of children in for statement:\n{}\n\n{}".format(
-            len(children), repr(node), unicode(node).encode('utf-8'))
+        if len(children) != 6:
+            raise ParseError("Unexpected length {} of children in for statement:\n{}\n\n{}".format(
+                len(children), repr(node), unicode(node).encode('utf-8')))
         for_word, variables, in_word, iterator, colon, body = children
         assert for_word.type == tokens.NAME and for_word.value == 'for'
         variable_by_name = collections.OrderedDict()
@@ -1440,7 +1865,9 @@ class For(AbstractWrapper):
             variable_index = 0
             while variable_index < len(variables):
                 variable = variables[variable_index]
-                assert variable.type == tokens.NAME
+                if variable.type != tokens.NAME:
+                    raise ParseError("Unexpected variables in for statement:\n{}\n\n{}".format(repr(node),
+                        unicode(node).encode('utf-8')))
                 variable_name = variable.value
                 variable_by_name[variable_name] = parser.Variable(container = container, name = variable_name,
                     parser = parser)
@@ -1456,8 +1883,8 @@ class For(AbstractWrapper):
             variable_by_name[variable_name] = parser.Variable(container = container, name = variable_name,
                 parser = parser)
         else:
-            assert False, "Unexpected variables in for statement:\n{}\n\n{}".format(repr(node),
-                unicode(node).encode('utf-8'))
+            raise ParseError("Unexpected variables in for statement:\n{}\n\n{}".format(repr(node),
+                unicode(node).encode('utf-8')))
         assert in_word.type == tokens.NAME and in_word.value == 'in'
         iterator = parser.parse_value(iterator, container = container)
         assert colon.type == tokens.COLON and colon.value == ':'
@@ -1469,6 +1896,17 @@ class For(AbstractWrapper):
 
 
 class Function(AbstractWrapper):
+    fields = (
+        'body',
+        'body_parsed',
+        'keyword_name',
+        'name',
+        'named_parameters',
+        'positional_parameters',
+        'returns',
+        'star_name',
+        'variable_by_name',
+        )
     body = None
     body_parsed = False
     keyword_name = None  # Name of "kwargs" in "**kwargs"
@@ -1542,7 +1980,9 @@ class Function(AbstractWrapper):
     def parse(cls, node, container = None, parser = None):
         try:
             children = node.children
-            assert len(children) == 5
+            if len(children) != 5:
+                raise ParseError("Unexpected function definition:\n{}\n\n{}".format(repr(node),
+                    unicode(node).encode('utf-8')))
             assert children[0].type == tokens.NAME and children[0].value == 'def'
             assert children[1].type == tokens.NAME  # Function name
             name = children[1].value
@@ -1601,6 +2041,23 @@ class Function(AbstractWrapper):
 
             self.parse_body()
 
+    def reset_body(self):
+        """Forget the body parsed at the first call of function, to parse it again at its next call.
+
+        The parameters are parsed again too, because their variables are bound to the arguments of the first call.
+        """
+        if not self.body_parsed:
+            return
+        self.body_parsed = False
+        self.body = []
+        self.keyword_name = None
+        self.named_parameters = collections.OrderedDict()
+        self.positional_parameters = []
+        self.returns = []
+        self.star_name = None
+        self.variable_by_name = collections.OrderedDict()
+        self.parse_parameters()
+
     def parse_parameters(self):
         parser = self.parser
         children = self.node.children
@@ -1622,7 +2079,9 @@ class Function(AbstractWrapper):
                 typedargslist_children = [parameters_children[1]]
             else:
                 typedargslist = parameters_children[1]
-                assert typedargslist.type == symbols.typedargslist
+                if typedargslist.type != symbols.typedargslist:
+                    raise ParseError("Unexpected parameters in function definition:\n{}\n\n{}".format(
+                        repr(parameters), unicode(parameters).encode('utf-8')))
                 typedargslist_children = typedargslist.children
 
             typedargslist_child_index = 0
@@ -1631,8 +2090,9 @@ class Function(AbstractWrapper):
                 if typedargslist_child.type == tokens.DOUBLESTAR:
                     typedargslist_child_index += 1
                     typedargslist_child = typedargslist_children[typedargslist_child_index]
-                    assert typedargslist_child.type == tokens.NAME, "Unexpected typedargslist child:\n{}\n\n{}".format(
-                        repr(typedargslist_child), unicode(typedargslist_child).encode('utf-8'))
+                    if typedargslist_child.type != tokens.NAME:
+                        raise ParseError("Unexpected typedargslist child:\n{}\n\n{}".format(
+                            repr(typedargslist_child), unicode(typedargslist_child).encode('utf-8')))
                     self.keyword_name = typedargslist_child.value
                     self.variable_by_name[self.keyword_name] = parser.Variable(container = self,
                         name = self.keyword_name, parser = parser)
@@ -1645,8 +2105,9 @@ class Function(AbstractWrapper):
                 elif typedargslist_child.type == tokens.STAR:
                     typedargslist_child_index += 1
                     typedargslist_child = typedargslist_children[typedargslist_child_index]
-                    assert typedargslist_child.type == tokens.NAME, "Unexpected typedargslist child:\n{}\n\n{}".format(
-                        repr(typedargslist_child), unicode(typedargslist_child).encode('utf-8'))
+                    if typedargslist_child.type != tokens.NAME:
+                        raise ParseError("Unexpected typedargslist child:\n{}\n\n{}".format(
+                            repr(typedargslist_child), unicode(typedargslist_child).encode('utf-8')))
                     self.star_name = typedargslist_child.value
                     self.variable_by_name[self.star_name] = parser.Variable(container = self, name = self.star_name,
                         parser = parser)
@@ -1657,8 +2118,9 @@ class Function(AbstractWrapper):
                     assert typedargslist_child.type == tokens.COMMA
                     typedargslist_child_index += 1
                 else:
-                    assert typedargslist_child.type == tokens.NAME, "Unexpected typedargslist child:\n{}\n\n{}".format(
-                        repr(typedargslist_child), unicode(typedargslist_child).encode('utf-8'))
+                    if typedargslist_child.type != tokens.NAME:
+                        raise ParseError("Unexpected typedargslist child:\n{}\n\n{}".format(
+                            repr(typedargslist_child), unicode(typedargslist_child).encode('utf-8')))
                     parameter_name = typedargslist_child.value
                     typedargslist_child_index += 1
                     if typedargslist_child_index >= len(typedargslist_children):
@@ -1723,34 +2185,53 @@ class FunctionFileInput(AbstractWrapper):
 
     @classmethod
     def parse(cls, function, parser = None):
-        source_lines, line_number = inspect.getsourcelines(function)
-        source = textwrap.dedent(''.join(source_lines))
-        # print source
-        node = parser.driver.parse_string(source)
-        assert node.type == symbols.file_input, "Unexpected file input type:\n{}\n\n{}".format(repr(node),
-            unicode(node).encode('utf-8'))
-        children = node.children
-        assert len(children) == 2 and children[0].type == symbols.funcdef and children[1].type == tokens.ENDMARKER, \
-            "Unexpected node children in:\n{}\n\n{}".format(repr(node), unicode(node).encode('utf-8'))
+        module_node = None
+        if parser.parse_whole_modules:
+            module_node, function_node = parser.get_definition_node(function)
+            node = function_node
+        if module_node is None:
+            source_lines, line_number = inspect.getsourcelines(function)
+            source = textwrap.dedent(''.join(source_lines))
+            # print source
+            node = parser.parse_string(source)
+            assert node.type == symbols.file_input, "Unexpected file input type:\n{}\n\n{}".format(repr(node),
+                unicode(node).encode('utf-8'))
+            children = node.children
+            if not (len(children) == 2 and children[0].type == symbols.funcdef
+                    and children[1].type == tokens.ENDMARKER):
+                raise ParseError("Unexpected node children in:\n{}\n\n{}".format(repr(node),
+                    unicode(node).encode('utf-8')))
+            module_node = node
+            function_node = children[0]
+        if function_node.type != symbols.funcdef:
+            raise ParseError("Unexpected function definition type:\n{}\n\n{}".format(
+                repr(function_node), unicode(function_node).encode('utf-8')))
         python_module = inspect.getmodule(function)
         if parser.country_package is not None:
             assert python_module.__file__.startswith(os.path.dirname(parser.country_package.__file__)), \
-                "Requested class is defined outside country_package:\n{}".format(source)
+                "Requested class is defined outside country_package:\n{}".format(
+                    unicode(function_node).encode('utf-8'))
         module = parser.python_module_by_name.get(python_module.__name__)
         if module is None:
-            parser.python_module_by_name[python_module.__name__] = module = parser.Module(node, python = python_module,
-                parser = parser)
+            parser.python_module_by_name[python_module.__name__] = module = parser.Module(module_node,
+                python = python_module, parser = parser)
         self = cls(parser = parser)
         function_class = self.get_function_class(parser = parser)
+        profiler = parser.profiler
+        if profiler is not None:
+            profiler.start('wrap', column = parser.column)
         try:
-            return function_class.parse(children[0], container = module, parser = parser)
+            return function_class.parse(function_node, container = module, parser = parser)
         except:
-            if node is not None:
-                print "An exception occurred in node:\n{}\n\n{}".format(repr(node), unicode(node).encode('utf-8'))
+            print "An exception occurred in node:\n{}\n\n{}".format(repr(node), unicode(node).encode('utf-8'))
             raise
+        finally:
+            if profiler is not None:
+                profiler.stop()
 
 
 class Holder(AbstractWrapper):
+    fields = ('column',)
     column = None
 
     def __init__(self, column = None, container = None, hint = None, node = None, parser = None):
@@ -1760,6 +2241,7 @@ class Holder(AbstractWrapper):
 
 
 class If(AbstractWrapper):
+    fields = ('items',)
     items = None  # List of (test, body) couples
 
     def __init__(self, container = None, hint = None, node = None, items = None, parser = None):
@@ -1808,6 +2290,7 @@ class Instant(AbstractWrapper):
 
 
 class Key(AbstractWrapper):
+    fields = ('subject', 'value')
     subject = None
     value = None  # Value of the key
 
@@ -1818,8 +2301,8 @@ class Key(AbstractWrapper):
         assert isinstance(value, AbstractWrapper)
         self.value = value
 
-    def guess(self, expected):
-        guessed = super(Key, self).guess(expected)
+    def guess_uncached(self, expected):
+        guessed = super(Key, self).guess_uncached(expected)
         if guessed is not None:
             return guessed
 
@@ -1847,6 +2330,7 @@ class Key(AbstractWrapper):
 
 
 class Lambda(AbstractWrapper):
+    fields = ('expression', 'positional_parameters', 'variable_by_name')
     expression = None
     positional_parameters = None  # List of parameters names
     variable_by_name = None
@@ -1886,8 +2370,8 @@ class Lambda(AbstractWrapper):
             self.variable_by_name[parameter_name] = parser.Variable(container = self, name = parameter_name,
                 parser = parser)
         else:
-            assert False, "Unexpected parameters in lambda definition:\n{}\n\n{}".format(repr(node),
-                unicode(node).encode('utf-8'))
+            raise ParseError("Unexpected parameters in lambda definition:\n{}\n\n{}".format(repr(node),
+                unicode(node).encode('utf-8')))
         assert colon.type == tokens.COLON and colon.value == ':'
         self.expression = parser.parse_value(expression, container = self)
 
@@ -1910,6 +2394,7 @@ class Lambda(AbstractWrapper):
 
 
 class List(AbstractWrapper):
+    fields = ('value',)
     value = None  # list value, as a list
 
     def __init__(self, container = None, hint = None, node = None, parser = None, value = None):
@@ -1941,6 +2426,7 @@ class List(AbstractWrapper):
 
 
 class ListGenerator(AbstractWrapper):
+    fields = ('iterators', 'value', 'variable_by_name')
     iterators = None
     value = None
     variable_by_name = None
@@ -1966,7 +2452,7 @@ class ListGenerator(AbstractWrapper):
                         parser = parser,
                         )
                 else:
-                    assert False, "{} has no iterator".format(iterator)
+                    raise ParseError("{} has no iterator".format(iterator))
             variables_value.extend(guessed_iterator.items)
         if value is not None:
             assert isinstance(value, AbstractWrapper)
@@ -1991,9 +2477,10 @@ class ListGenerator(AbstractWrapper):
         for child_index, child in enumerate(children[1:], 1):
             if child.type == symbols.comp_for:
                 for_node = child
-                assert len(for_node.children) == 4, \
-                    "Unexpected length {} of for children in list generator statement:\n{}\n\n{}".format(
-                        len(for_node.children), repr(for_node), unicode(for_node).encode('utf-8'))
+                if len(for_node.children) != 4:
+                    raise ParseError(
+                        "Unexpected length {} of for children in list generator statement:\n{}\n\n{}".format(
+                            len(for_node.children), repr(for_node), unicode(for_node).encode('utf-8')))
                 for_word, variables, in_word, iterator = for_node.children
                 assert for_word.type == tokens.NAME and for_word.value == 'for'
                 if variables.type == symbols.exprlist:
@@ -2001,7 +2488,9 @@ class ListGenerator(AbstractWrapper):
                     variable_index = 0
                     while variable_index < len(variables):
                         variable = variables[variable_index]
-                        assert variable.type == tokens.NAME
+                        if variable.type != tokens.NAME:
+                            raise ParseError("Unexpected variables in for statement:\n{}\n\n{}".format(repr(node),
+                                unicode(node).encode('utf-8')))
                         variable_name = variable.value
                         variable_by_name[variable_name] = parser.Variable(container = container, name = variable_name,
                             parser = parser)
@@ -2017,14 +2506,14 @@ class ListGenerator(AbstractWrapper):
                     variable_by_name[variable_name] = parser.Variable(container = container, name = variable_name,
                         parser = parser)
                 else:
-                    assert False, "Unexpected variables in for statement:\n{}\n\n{}".format(repr(node),
-                        unicode(node).encode('utf-8'))
+                    raise ParseError("Unexpected variables in for statement:\n{}\n\n{}".format(repr(node),
+                        unicode(node).encode('utf-8')))
                 assert in_word.type == tokens.NAME and in_word.value == 'in'
                 iterator = parser.parse_value(iterator, container = container)
                 iterators.append(iterator)
             else:
-                assert False, "Unexpected item in list generator type:\n{}\n\n{}".format(repr(child),
-                    unicode(child).encode('utf-8'))
+                raise ParseError("Unexpected item in list generator type:\n{}\n\n{}".format(repr(child),
+                    unicode(child).encode('utf-8')))
 
         self = cls(container = container, iterators = iterators, parser = parser, variable_by_name = variable_by_name)
         self.value = parser.parse_value(children[0], container = container)
@@ -2041,6 +2530,7 @@ class Logger(AbstractWrapper):
 
 
 class Module(AbstractWrapper):
+    fields = ('python', 'variable_by_name')
     python = None
     variable_by_name = None
 
@@ -2049,81 +2539,7 @@ class Module(AbstractWrapper):
         if python is not None:
             # Python module
             self.python = python
-        self.variable_by_name = collections.OrderedDict(sorted(dict(
-            and_ = parser.Variable(container = self, name = u'and_', parser = parser),
-            around = parser.Variable(container = self, name = u'around', parser = parser),
-            apply_along_axis = parser.Variable(container = self, name = u'apply_along_axis', parser = parser),
-            array = parser.Variable(container = self, name = u'array', parser = parser),
-            CAT = parser.Variable(container = self, name = u'CAT', parser = parser,
-                value = parser.Enum(parser = parser)),
-            ceil = parser.Variable(container = self, name = u'ceil', parser = parser),
-            CHEF = parser.Variable(container = self, name = u'CHEF', parser = parser,
-                value = parser.Number(parser = parser, value = 0)),
-            # combine_tax_scales = parser.Variable(container = self, name = u'combine_tax_scales', parser = parser),
-            CONJ = parser.Variable(container = self, name = u'CONJ', parser = parser,
-                value = parser.Number(parser = parser, value = 1)),
-            CREF = parser.Variable(container = self, name = u'CREF', parser = parser,
-                value = parser.Number(parser = parser, value = 1)),
-            date = parser.Variable(container = self, name = u'date', parser = parser),
-            datetime64 = parser.Variable(container = self, name = u'datetime64', parser = parser),
-            dict = parser.Variable(container = self, name = u'dict', parser = parser),
-            # ENFS = parser.Variable(container = self, name = u'ENFS', parser = parser,
-            #     value = parser.UniformList(parser = parser, value = parser.Number(parser = parser, value = x))),
-            ENFS = parser.Variable(container = self, name = u'ENFS', parser = parser),
-            floor = parser.Variable(container = self, name = u'floor', parser = parser),
-            fromiter = parser.Variable(container = self, name = u'fromiter', parser = parser),
-            fsolve = parser.Variable(container = self, name = u'fsolve', parser = parser),
-            hasattr = parser.Variable(container = self, name = u'hasattr', parser = parser),
-            holidays = parser.Variable(container = self, name = u'holidays', parser = parser),
-            int16 = parser.Variable(container = self, name = u'int16', parser = parser,
-                value = parser.Type(parser = parser, value = np.int16)),
-            int32 = parser.Variable(container = self, name = u'int32', parser = parser,
-                value = parser.Type(parser = parser, value = np.int32)),
-            izip = parser.Variable(container = self, name = u'izip', parser = parser),
-            law = parser.Variable(container = self, name = u'law', parser = parser,
-                value = parser.CompactNode(parser = parser, value = parser.tax_benefit_system.legislation_json)),
-            len = parser.Variable(container = self, name = u'len', parser = parser),
-            log = parser.Variable(container = self, name = u'log', parser = parser,
-                value = parser.Logger(parser = parser)),
-            MarginalRateTaxScale = parser.Variable(container = self, name = u'MarginalRateTaxScale', parser = parser),
-            max = parser.Variable(container = self, name = u'max', parser = parser),
-            max_ = parser.Variable(container = self, name = u'max_', parser = parser),
-            math = parser.Variable(container = self, name = u'math', parser = parser),
-            min_ = parser.Variable(container = self, name = u'min_', parser = parser),
-            not_ = parser.Variable(container = self, name = u'not_', parser = parser),
-            ones = parser.Variable(container = self, name = u'ones', parser = parser),
-            or_ = parser.Variable(container = self, name = u'or_', parser = parser),
-            original_busday_count = parser.Variable(container = self, name = u'original_busday_count', parser = parser),
-            PAC1 = parser.Variable(container = self, name = u'PAC1', parser = parser,
-                value = parser.Number(parser = parser, value = 2)),
-            PAC2 = parser.Variable(container = self, name = u'PAC2', parser = parser,
-                value = parser.Number(parser = parser, value = 3)),
-            PAC3 = parser.Variable(container = self, name = u'PAC3', parser = parser,
-                value = parser.Number(parser = parser, value = 4)),
-            PART = parser.Variable(container = self, name = u'PART', parser = parser,
-                value = parser.Number(parser = parser, value = 1)),
-            partial = parser.Variable(container = self, name = u'partial', parser = parser),
-            PREF = parser.Variable(container = self, name = u'PREF', parser = parser,
-                value = parser.Number(parser = parser, value = 0)),
-            round = parser.Variable(container = self, name = u'round', parser = parser),
-            round_ = parser.Variable(container = self, name = u'round_', parser = parser),
-            # scale_tax_scales = parser.Variable(container = self, name = u'scale_tax_scales', parser = parser),
-            SCOLARITE_COLLEGE = parser.Variable(container = self, name = u'SCOLARITE_COLLEGE', parser = parser,
-                value = parser.Number(parser = parser, value = 1)),
-            sorted = parser.Variable(container = self, name = u'sorted', parser = parser),
-            startswith = parser.Variable(container = self, name = u'startswith', parser = parser),
-            TAUX_DE_PRIME = parser.Variable(container = self, name = u'TAUX_DE_PRIME', parser = parser,
-                value = parser.Number(parser = parser, value = 1 / 4)),
-            # TaxScalesTree = parser.Variable(container = self, name = u'TaxScalesTree', parser = parser),
-            timedelta64 = parser.Variable(container = self, name = u'timedelta64', parser = parser),
-            ValueError = parser.Variable(container = self, name = u'ValueError', parser = parser),
-            VOUS = parser.Variable(container = self, name = u'VOUS', parser = parser,
-                value = parser.Number(parser = parser, value = 0)),
-            where = parser.Variable(container = self, name = u'where', parser = parser),
-            xor_ = parser.Variable(container = self, name = u'xor_', parser = parser),
-            zeros = parser.Variable(container = self, name = u'zeros', parser = parser),
-            zone_apl_by_depcom = parser.Variable(container = self, name = u'zone_apl_by_depcom', parser = parser),
-            ).iteritems()))
+        self.variable_by_name = collections.OrderedDict()  # Functions of this module, in order of first call
 
     @property
     def containing_module(self):
@@ -2132,6 +2548,9 @@ class Module(AbstractWrapper):
     def get_variable(self, name, default = UnboundLocalError, parser = None):
         variable = self.variable_by_name.get(name, None)
         if variable is None:
+            variable = self.parser.get_builtin_variable(name)
+            if variable is not None:
+                return variable
             value = getattr(self.python, name, UnboundLocalError)
             if value is UnboundLocalError:
                 if default is UnboundLocalError:
@@ -2145,17 +2564,30 @@ class Module(AbstractWrapper):
             # Declare function before parsing if to avoid infinite parsing when it is recursive.
             self.variable_by_name[name] = variable = parser.Variable(container = self, name = name,
                 parser = parser)
-            function = parser.FunctionFileInput.parse(value, parser = parser)
+            try:
+                function = parser.FunctionFileInput.parse(value, parser = parser)
+            except:
+                # Don't keep a half-declared function in a module that may be retained.
+                del self.variable_by_name[name]
+                raise
             assert isinstance(function, parser.Function), function
             variable.value = function
         return variable
 
+    def reset_functions(self):
+        """Forget the bodies of the functions called from this module, since they depend on the calling formula."""
+        parser = self.parser
+        for variable in self.variable_by_name.itervalues():
+            if isinstance(variable.value, parser.Function):
+                variable.value.reset_body()
+
 
 class NoneWrapper(AbstractWrapper):
     pass
 
 
 class NotTest(AbstractWrapper):
+    fields = ('value',)
     value = None
 
     def __init__(self, container = None, hint = None, node = None, parser = None, value = None):
@@ -2164,8 +2596,8 @@ class NotTest(AbstractWrapper):
         assert isinstance(value, AbstractWrapper)
         self.value = value
 
-    def guess(self, expected):
-        guessed = super(NotTest, self).guess(expected)
+    def guess_uncached(self, expected):
+        guessed = super(NotTest, self).guess_uncached(expected)
         if guessed is not None:
             return guessed
 
@@ -2201,6 +2633,7 @@ class NotTest(AbstractWrapper):
 
 
 class Number(AbstractWrapper):
+    fields = ('type', 'value')
     type = None
     value = None
 
@@ -2225,6 +2658,7 @@ class Number(AbstractWrapper):
 
 
 class ParentheticalExpression(AbstractWrapper):
+    fields = ('value',)
     value = None
 
     def __init__(self, container = None, hint = None, node = None, parser = None, value = None):
@@ -2233,8 +2667,8 @@ class ParentheticalExpression(AbstractWrapper):
         assert isinstance(value, AbstractWrapper)
         self.value = value
 
-    def guess(self, expected):
-        guessed = super(ParentheticalExpression, self).guess(expected)
+    def guess_uncached(self, expected):
+        guessed = super(ParentheticalExpression, self).guess_uncached(expected)
         if guessed is not None:
             return guessed
 
@@ -2247,6 +2681,7 @@ class ParentheticalExpression(AbstractWrapper):
 
 
 class Period(AbstractWrapper):
+    fields = ('unit',)
     unit = None
 
     def __init__(self, container = None, hint = None, node = None, parser = None, unit = None):
@@ -2257,6 +2692,7 @@ class Period(AbstractWrapper):
 
 
 class Raise(AbstractWrapper):
+    fields = ('exception',)
     exception = None
 
     def __init__(self, container = None, exception = None, hint = None, node = None, parser = None):
@@ -2269,8 +2705,9 @@ class Raise(AbstractWrapper):
         assert node.type == symbols.raise_stmt, "Unexpected raise type:\n{}\n\n{}".format(repr(node),
             unicode(node).encode('utf-8'))
         children = node.children
-        assert len(children) == 2, "Unexpected length {} of children in raise:\n{}\n\n{}".format(
-            len(children), repr(node), unicode(node).encode('utf-8'))
+        if len(children) != 2:
+            raise ParseError("Unexpected length {} of children in raise:\n{}\n\n{}".format(
+                len(children), repr(node), unicode(node).encode('utf-8')))
         raise_word = children[0]
         assert raise_word.type == tokens.NAME and raise_word.value == 'raise'
         exception = parser.parse_value(children[1], container = container)
@@ -2279,6 +2716,7 @@ class Raise(AbstractWrapper):
 
 
 class Return(AbstractWrapper):
+    fields = ('value',)
     value = None
 
     def __init__(self, container = None, hint = None, node = None, parser = None, value = None):
@@ -2286,8 +2724,8 @@ class Return(AbstractWrapper):
         assert isinstance(value, AbstractWrapper)
         self.value = value
 
-    def guess(self, expected):
-        guessed = super(Return, self).guess(expected)
+    def guess_uncached(self, expected):
+        guessed = super(Return, self).guess_uncached(expected)
         if guessed is not None:
             return guessed
 
@@ -2303,7 +2741,9 @@ class Return(AbstractWrapper):
         assert node.type == symbols.return_stmt, "Unexpected return type:\n{}\n\n{}".format(repr(node),
             unicode(node).encode('utf-8'))
         children = node.children
-        assert len(children) == 2, len(children)
+        if len(children) != 2:
+            raise ParseError("Unexpected length {} of children in return:\n{}\n\n{}".format(
+                len(children), repr(node), unicode(node).encode('utf-8')))
         assert children[0].type == tokens.NAME and children[0].value == 'return'
         value = parser.parse_value(children[1], container = container)
 
@@ -2311,6 +2751,8 @@ class Return(AbstractWrapper):
 
         containing_function = self.containing_function
         containing_function.returns.append(self)
+        # The guessed type of a call depends on the returns of the called function.
+        parser.guess_generation += 1
 
         return self
 
@@ -2325,6 +2767,7 @@ class Simulation(AbstractWrapper):
 
 class StemNode(AbstractWrapper):
     """An indifferentiated CompactNode or Parameter or TaxScale"""
+    fields = ('is_reference', 'parent')
     is_reference = True
     parent = None  # Parent CompactNode wrapper
 
@@ -2351,6 +2794,7 @@ class StemNode(AbstractWrapper):
 
 
 class String(AbstractWrapper):
+    fields = ('value',)
     value = None  # String value, as a string
 
     def __init__(self, container = None, node = None, parser = None, value = None):
@@ -2362,6 +2806,11 @@ class String(AbstractWrapper):
 
     @classmethod
     def parse(cls, node, container = None, parser = None):
+        return cls(container = container, node = node, parser = parser, value = cls.parse_value(node))
+
+    @staticmethod
+    def parse_value(node):
+        """Return the value of a string node, without wrapping it."""
         assert node.type == tokens.STRING, "Unexpected string type:\n{}\n\n{}".format(repr(node),
             unicode(node).encode('utf-8'))
         value = node.value
@@ -2371,11 +2820,8 @@ class String(AbstractWrapper):
             value = value[1:]
         for delimiter in (u'"""', u"'''", u'"', u"'"):
             if value.startswith(delimiter) and value.endswith(delimiter):
-                value = value[len(delimiter):-len(delimiter)]
-                break
-        else:
-            assert False, "Unknow delimiters for: {}".format(value)
-        return cls(container = container, node = node, parser = parser, value = value)
+                return value[len(delimiter):-len(delimiter)]
+        raise ParseError("Unknow delimiters for: {}".format(value))
 
 
 # class Structure(AbstractWrapper):
@@ -2397,6 +2843,7 @@ class TaxScale(AbstractWrapper):
 
 
 class Term(AbstractWrapper):
+    fields = ('items',)
     items = None
 
     def __init__(self, container = None, hint = None, items = None, node = None, parser = None):
@@ -2405,8 +2852,8 @@ class Term(AbstractWrapper):
         assert len(items) >= 3 and (len(items) & 1)
         self.items = items
 
-    def guess(self, expected):
-        guessed = super(Term, self).guess(expected)
+    def guess_uncached(self, expected):
+        guessed = super(Term, self).guess_uncached(expected)
         if guessed is not None:
             return guessed
 
@@ -2458,6 +2905,7 @@ class Term(AbstractWrapper):
 
 
 class Test(AbstractWrapper):
+    fields = ('false_value', 'test', 'true_value')
     false_value = None
     test = None
     true_value = None
@@ -2491,6 +2939,7 @@ class Test(AbstractWrapper):
 
 
 class Tuple(AbstractWrapper):
+    fields = ('value',)
     value = None  # Tuple value, as a tuple
 
     def __init__(self, container = None, hint = None, node = None, parser = None, value = None):
@@ -2535,6 +2984,7 @@ class TupleGenerator(AbstractWrapper):
 
 
 class Type(AbstractWrapper):
+    fields = ('value',)
     value = None
 
     def __init__(self, container = None, node = None, parser = None, value = None):
@@ -2544,6 +2994,7 @@ class Type(AbstractWrapper):
 
 
 class UniformDictionary(AbstractWrapper):
+    fields = ('key', 'value')
     key = None
     value = None
 
@@ -2554,8 +3005,8 @@ class UniformDictionary(AbstractWrapper):
         assert isinstance(value, AbstractWrapper)
         self.value = value
 
-    def guess(self, expected):
-        guessed = super(UniformDictionary, self).guess(expected)
+    def guess_uncached(self, expected):
+        guessed = super(UniformDictionary, self).guess_uncached(expected)
         if guessed is not None:
             return guessed
 
@@ -2570,6 +3021,7 @@ class UniformDictionary(AbstractWrapper):
 
 
 class UniformIterator(AbstractWrapper):
+    fields = ('items',)
     items = None  # A list of values (one for iterkeys & itervalues, 2 for iteritems) that iterate.
 
     def __init__(self, container = None, items = None, node = None, parser = None):
@@ -2588,8 +3040,9 @@ class UniformIterator(AbstractWrapper):
 
 
 class Variable(AbstractWrapper):
+    fields = ('_value', 'name')
+    _value = None  # A value wrapper
     name = None
-    value = None  # A value wrapper
 
     def __init__(self, container = None, hint = None, name = None, node = None, parser = None, value = None):
         super(Variable, self).__init__(container = container, hint = hint, node = node, parser = parser)
@@ -2597,13 +3050,14 @@ class Variable(AbstractWrapper):
         self.name = name
         if value is not None:
             assert isinstance(value, AbstractWrapper)
-            self.value = value
+            # No guess can depend yet on this new variable, so there is no need to invalidate memoized guesses.
+            self._value = value
 
     def __repr__(self):
         return u'<Variable {}>'.format(self.name)
 
-    def guess(self, expected):
-        guessed = super(Variable, self).guess(expected)
+    def guess_uncached(self, expected):
+        guessed = super(Variable, self).guess_uncached(expected)
         if guessed is not None:
             return guessed
 
@@ -2614,6 +3068,17 @@ class Variable(AbstractWrapper):
 
         return None
 
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        if value is not self._value:
+            # Binding a variable to another value invalidates the memoized guesses.
+            self.parser.guess_generation += 1
+            self._value = value
+
     @classmethod
     def parse(cls, node, container = None, parser = None, value = None):
         assert node.type == tokens.NAME, "Unexpected variable type:\n{}\n\n{}".format(repr(node),
@@ -2622,6 +3087,7 @@ class Variable(AbstractWrapper):
 
 
 class XorExpression(AbstractWrapper):
+    fields = ('operands', 'operator')
     operands = None
     operator = None
 
@@ -2632,8 +3098,8 @@ class XorExpression(AbstractWrapper):
         assert isinstance(operator, basestring)
         self.operator = operator
 
-    def guess(self, expected):
-        guessed = super(XorExpression, self).guess(expected)
+    def guess_uncached(self, expected):
+        guessed = super(XorExpression, self).guess_uncached(expected)
         if guessed is not None:
             return guessed
 
@@ -2664,6 +3130,7 @@ class Boolean(Number):
 
 
 class Formula(AbstractWrapper):
+    fields = ('column', 'formula_class')
     column = None
     formula_class = None
 
@@ -2682,7 +3149,8 @@ class FormulaClass(Class):
 
 
 class FormulaClassFileInput(ClassFileInput):
-    # Caution: This is not the whole module, but only a dummy "module" containing only the formula.
+    # Caution: Unless parser.parse_whole_modules is set, this is not the whole module, but only a dummy "module"
+    # containing only the formula.
     @classmethod
     def get_class_class(cls, parser = None):
         return parser.FormulaClass
@@ -2693,7 +3161,9 @@ class FormulaFunction(Function):
     def parse(cls, node, container = None, parser = None):
         try:
             children = node.children
-            assert len(children) == 5
+            if len(children) != 5:
+                raise ParseError("Unexpected function definition:\n{}\n\n{}".format(repr(node),
+                    unicode(node).encode('utf-8')))
             assert children[0].type == tokens.NAME and children[0].value == 'def'
             assert children[1].type == tokens.NAME  # Function name
             name = children[1].value
@@ -2710,8 +3180,9 @@ class FormulaFunction(Function):
     def parse_parameters(self):
         super(FormulaFunction, self).parse_parameters()
         parser = self.parser
-        assert self.positional_parameters == ['self', 'simulation', 'period'], self.positional_arguments
-        assert not self.named_parameters, self.named_arguments
+        if self.positional_parameters != ['self', 'simulation', 'period'] or self.named_parameters:
+            raise ParseError("Unexpected parameters in formula function {}:\n{}\n\n{}".format(self.name,
+                repr(self.node), unicode(self.node).encode('utf-8')))
         formula_variable = self.variable_by_name['self']
         assert formula_variable.value is None, formula_variable.value
         formula_variable.value = parser.Formula(container = self.container.container, formula_class = self.container,
@@ -2744,6 +3215,7 @@ class Parser(conv.State):
     Assignment = Assignment
     Attribute = Attribute
     Boolean = Boolean
+    builtin_variable_by_name = None  # Variables of the builtins of modules, created on first use
     Call = Call
     Class = Class
     ClassFileInput = ClassFileInput
@@ -2756,6 +3228,8 @@ class Parser(conv.State):
     DateTime64 = DateTime64
     DatedHolder = DatedHolder
     Decorator = Decorator
+    definition_node_by_line_number_by_module_name = None
+    definition_node_by_name_by_module_name = None
     Dictionary = Dictionary
     driver = None
     Entity = Entity
@@ -2772,6 +3246,9 @@ class Parser(conv.State):
     Function = Function
     # FunctionCall = FunctionCall
     FunctionFileInput = FunctionFileInput
+    guess_generation = 0  # Incremented each time a change may invalidate memoized guesses
+    guess_hit_count = 0
+    guess_miss_count = 0
     Holder = Holder
     If = If
     Instant = Instant
@@ -2780,18 +3257,47 @@ class Parser(conv.State):
     List = List
     ListGenerator = ListGenerator
     Logger = Logger
+    memoize_guesses = True
     # Math = Math
     Module = Module
+    module_node_by_name = None  # Parse trees of whole modules, when parse_whole_modules is set
+    node_arena = None  # Optional node_arenas.NodeArena storing the parse trees as NumPy arrays
     NoneWrapper = NoneWrapper
     NotTest = NotTest
     Number = Number
     ParentheticalExpression = ParentheticalExpression
+    parse_trees_cache = None  # Optional persistent cache of parse trees
+    parse_whole_modules = False  # When True, parse each module once, instead of once per class or function
     Period = Period
+    profiler = None  # Optional profilers.Profiler timing the phases of parsing
     python_module_by_name = None
     Raise = Raise
+    retain_modules = False  # When True, keep module wrappers & their helper functions from one column to the next
     Return = Return
     Role = Role
+    # Name of the wrapper class or parser method parsing each type of simple statement (None to skip it)
+    simple_statement_handler_name_by_type = {
+        symbols.assert_stmt: 'Assert',
+        symbols.expr_stmt: 'Assignment',
+        symbols.global_stmt: None,  # TODO: Used only by zone_apl.
+        symbols.power: 'parse_power',
+        symbols.raise_stmt: 'Raise',
+        symbols.return_stmt: 'Return',
+        tokens.NAME: 'parse_continue',
+        tokens.STRING: 'String',  # Docstring
+        }
     Simulation = Simulation
+    # Name of the wrapper class or parser method parsing each type of statement of a suite (None to skip it)
+    statement_handler_name_by_type = {
+        symbols.for_stmt: 'For',
+        symbols.funcdef: 'parse_function_definition',
+        symbols.if_stmt: 'If',
+        symbols.simple_stmt: 'parse_simple_statement',
+        symbols.with_stmt: None,  # TODO: Used only by zone_apl.
+        tokens.DEDENT: None,
+        tokens.INDENT: None,
+        tokens.NEWLINE: None,
+        }
     StemNode = StemNode
     String = String
     # Structure = Structure
@@ -2806,15 +3312,54 @@ class Parser(conv.State):
     UniformDictionary = UniformDictionary
     UniformIterator = UniformIterator
     # UniformList = UniformList
+    validate = True  # When False, skip the validation of the wrappers & nodes created for each node
+    # Name of the wrapper class or parser method parsing each type of value node
+    value_handler_name_by_type = {
+        symbols.and_expr: 'AndExpression',
+        symbols.and_test: 'AndTest',
+        symbols.arith_expr: 'ArithmeticExpression',
+        symbols.atom: 'parse_atom',
+        symbols.comparison: 'Comparison',
+        symbols.expr: 'Expression',
+        symbols.factor: 'Factor',
+        symbols.lambdef: 'Lambda',
+        symbols.not_test: 'NotTest',
+        symbols.power: 'parse_power',
+        symbols.term: 'Term',
+        symbols.test: 'Test',
+        symbols.testlist: 'Tuple',
+        symbols.testlist_gexp: 'TupleGenerator',
+        tokens.NAME: 'parse_name',
+        tokens.NUMBER: 'Number',
+        tokens.STRING: 'String',
+        }
     Variable = Variable
     XorExpression = XorExpression
 
-    def __init__(self, country_package = None, driver = None, tax_benefit_system = None):
+    def __init__(self, country_package = None, driver = None, node_arena = None, parse_trees_cache = None,
+            parse_whole_modules = False, profiler = None, retain_modules = False, tax_benefit_system = None,
+            validate = True):
+        self.builtin_variable_by_name = {}
         if country_package is not None:
             self.country_package = country_package
+        self.definition_node_by_line_number_by_module_name = {}
+        self.definition_node_by_name_by_module_name = {}
         self.driver = driver
+        self.module_node_by_name = {}
+        if node_arena is not None:
+            self.node_arena = node_arena
+        if parse_trees_cache is not None:
+            self.parse_trees_cache = parse_trees_cache
+        if parse_whole_modules:
+            self.parse_whole_modules = True
+        if profiler is not None:
+            self.profiler = profiler
         self.python_module_by_name = {}
+        if retain_modules:
+            self.retain_modules = True
         self.tax_benefit_system = tax_benefit_system
+        if not validate:
+            self.validate = False
 
     @property
     def entity_class(self):
@@ -2822,6 +3367,17 @@ class Parser(conv.State):
             return None
         return self.tax_benefit_system.entity_class_by_key_plural[self.column.entity_key_plural]
 
+    def get_builtin_variable(self, name):
+        """Return the variable of a builtin shared by all modules, or None when name is not a builtin."""
+        variable = self.builtin_variable_by_name.get(name)
+        if variable is None:
+            value_factory = builtin_value_factory_by_name.get(name, UnboundLocalError)
+            if value_factory is UnboundLocalError:
+                return None
+            self.builtin_variable_by_name[name] = variable = self.Variable(name = name, parser = self,
+                value = value_factory(self) if value_factory is not None else None)
+        return variable
+
     def get_cell_wrapper(self, container = None, type = None):
         wrapper_class = {
             None: self.Number,
@@ -2835,11 +3391,178 @@ class Parser(conv.State):
             return wrapper_class(container = container, parser = self, type = type)
         return wrapper_class(container = container, parser = self)
 
+    @property
+    def legislation_paths_index(self):
+        return legislation_paths.get_index(self.tax_benefit_system)
+
+    def reset_modules(self):
+        """Forget the module wrappers state that depends on the column being parsed.
+
+        Unless retain_modules is set, module wrappers are simply dropped. Otherwise they are kept, with their builtins
+        and their helper functions, but the bodies of these functions are forgotten, because they have been parsed
+        using the arguments given by the formula of the column.
+        """
+        if self.retain_modules:
+            for module in self.python_module_by_name.itervalues():
+                module.reset_functions()
+        else:
+            self.python_module_by_name.clear()
+
+    def parse_string(self, source):
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start('parse_string', column = self.column)
+            try:
+                return self.parse_string_unprofiled(source)
+            finally:
+                profiler.stop()
+        return self.parse_string_unprofiled(source)
+
+    def parse_string_unprofiled(self, source):
+        parse_trees_cache = self.parse_trees_cache
+        if parse_trees_cache is None:
+            node = self.driver.parse_string(source)
+        else:
+            node = parse_trees_cache.parse_string(source, driver = self.driver)
+        node_arena = self.node_arena
+        if node_arena is None:
+            return node
+        # Wrap the arena copy of the tree, so that the lib2to3 tree can be freed.
+        return node_arena.add_tree(node, source = source)
+
+    def get_definition_node(self, definition):
+        """Return the parse tree of the module defining a class or a function, and the node of this definition.
+
+        Each module is parsed only once and its top-level class & function definitions are indexed by line number and
+        by name. Return (None, None) when the definition is not found at the top level of its module.
+        """
+        python_module = inspect.getmodule(definition)
+        module_name = python_module.__name__
+        module_node = self.module_node_by_name.get(module_name)
+        if module_node is None:
+            source = inspect.getsource(python_module)
+            if not source.endswith('\n'):
+                source += '\n'
+            # The tree of a whole module is made of many objects, each allocation counting towards a collection of
+            # the cyclic garbage collector, which would traverse the trees of the modules already parsed.
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                module_node = self.parse_string(source)
+            finally:
+                if gc_enabled:
+                    gc.enable()
+            assert module_node.type == symbols.file_input, "Unexpected file input type:\n{}".format(repr(module_node))
+            definition_node_by_line_number = {}
+            definition_node_by_name = {}
+            for child in module_node.children:
+                line_number = child.get_lineno()
+                if child.type == symbols.decorated:
+                    child = child.children[-1]
+                if child.type not in (symbols.classdef, symbols.funcdef):
+                    continue
+                definition_node_by_line_number[line_number] = child
+                definition_node_by_line_number[child.get_lineno()] = child
+                # Like inspect.getsourcelines, use the first definition of a name.
+                definition_node_by_name.setdefault(child.children[1].value, child)
+            self.definition_node_by_line_number_by_module_name[module_name] = definition_node_by_line_number
+            self.definition_node_by_name_by_module_name[module_name] = definition_node_by_name
+            self.module_node_by_name[module_name] = module_node
+
+        definition_node = None
+        if inspect.isfunction(definition):
+            definition_node = self.definition_node_by_line_number_by_module_name[module_name].get(
+                definition.func_code.co_firstlineno)
+            if definition_node is not None and definition_node.children[1].value != definition.__name__:
+                definition_node = None
+        if definition_node is None:
+            definition_node = self.definition_node_by_name_by_module_name[module_name].get(definition.__name__)
+        if definition_node is None:
+            return None, None
+        return module_node, definition_node
+
+    def parse_atom(self, node, container = None):
+        children = node.children
+        if len(children) != 3:
+            raise ParseError("Unexpected length {} of children in atom:\n{}\n\n{}".format(len(children),
+                repr(node), unicode(node).encode('utf-8')))
+        left_parenthesis, value, right_parenthesis = children
+        if left_parenthesis.type not in (tokens.LBRACE, tokens.LPAR, tokens.LSQB):
+            raise ParseError("Unexpected left parenthesis {} in atom:\n{}\n\n{}".format(left_parenthesis.value,
+                repr(node), unicode(node).encode('utf-8')))
+        if right_parenthesis.type not in (tokens.RBRACE, tokens.RPAR, tokens.RSQB):
+            raise ParseError("Unexpected right parenthesis {} in atom:\n{}\n\n{}".format(right_parenthesis.value,
+                repr(node), unicode(node).encode('utf-8')))
+        if left_parenthesis.type == tokens.LPAR:
+            value = self.parse_value(value, container = container)
+            return self.ParentheticalExpression(container = container, node = node, parser = self, value = value)
+        if value.type == symbols.dictsetmaker:
+            dict_children = value.children
+            child_index = 0
+            while child_index < len(dict_children):
+                item_key = self.parse_value(dict_children[child_index], container = container)
+                if dict_children[child_index + 1].type != tokens.COLON:
+                    raise ParseError("Unexpected colon {} in atom:\n{}\n\n{}".format(
+                        dict_children[child_index + 1], repr(value), unicode(value).encode('utf-8')))
+                item_value = self.parse_value(dict_children[child_index + 2], container = container)
+                child_index += 3
+                if dict_children[child_index].type == tokens.COMMA:
+                    child_index += 1
+                elif child_index != len(dict_children):
+                    raise ParseError("Missing comma after dictionary item {} in atom:\n{}\n\n{}".format(
+                        child_index, repr(value), unicode(value).encode('utf-8')))
+            # TODO: Currently it is assumed that dictionary is uniform.
+            return self.UniformDictionary(
+                container = container,
+                key = item_key,
+                parser = self,
+                value = item_value,
+                )
+        if value.type == symbols.listmaker:
+            if any(child.type == symbols.comp_for for child in value.children):
+                return self.ListGenerator.parse(value, container = container, parser = self)
+            return self.List.parse(value, container = container, parser = self)
+        singleton = self.parse_value(value, container = container)
+        return self.List(container = container, node = value, parser = self, value = [singleton])
+
+    def parse_continue(self, node, container = None):
+        if node.value != 'continue':
+            raise ParseError("Unexpected name statement in suite:\n{}\n\n{}".format(repr(node),
+                unicode(node).encode('utf-8')))
+        return self.Continue(container = container, node = node, parser = self)
+
+    def parse_function_definition(self, node, container = None):
+        function = container.get_function_class(parser = self).parse(node, container = container, parser = self)
+        container.variable_by_name[function.name] = self.Variable(container = container, name = function.name,
+            parser = self, value = function)
+        return function
+
+    def parse_name(self, node, container = None):
+        name = node.value
+        if name == u'False':
+            return self.Boolean(container = container, parser = self, value = False)
+        elif name == u'None':
+            return self.NoneWrapper(container = container, parser = self)
+        elif name == u'True':
+            return self.Boolean(container = container, parser = self, value = True)
+        variable = container.get_variable(name, default = None, parser = self)
+        if variable is None:
+            raise ParseError("Undefined variable: {}".format(name))
+        return variable
+
+    def parse_node(self, handler_name, node, container = None):
+        """Parse node with the handler named handler_name: either a wrapper class or a method of the parser."""
+        handler = getattr(self, handler_name)
+        if isinstance(handler, type):
+            return handler.parse(node, container = container, parser = self)
+        return handler(node, container = container)
+
     def parse_power(self, node, container = None):
-        assert isinstance(node, lib2to3.pytree.Base), "Invalid node:\n{}\n\n{}".format(repr(node),
-            unicode(node).encode('utf-8'))
-        assert isinstance(container, AbstractWrapper), "Invalid container {} for node:\n{}\n\n{}".format(container,
-            repr(node), unicode(node).encode('utf-8'))
+        if self.validate:
+            assert isinstance(node, lib2to3.pytree.Base), "Invalid node:\n{}\n\n{}".format(repr(node),
+                unicode(node).encode('utf-8'))
+            assert isinstance(container, AbstractWrapper), "Invalid container {} for node:\n{}\n\n{}".format(
+                container, repr(node), unicode(node).encode('utf-8'))
 
         assert node.type == symbols.power, "Unexpected power type:\n{}\n\n{}".format(repr(node),
             unicode(node).encode('utf-8'))
@@ -2872,184 +3595,58 @@ class Parser(conv.State):
                 subject = self.Key.parse(subject, trailer, container = container, parser = self)
         return subject
 
+    def parse_simple_statement(self, node, container = None):
+        if len(node.children) != 2:
+            raise ParseError("Unexpected length {} for simple statement in function definition:\n{}\n\n{}".format(
+                len(node.children), repr(node), unicode(node).encode('utf-8')))
+        statement = node.children[0]
+        try:
+            handler_name = self.simple_statement_handler_name_by_type[statement.type]
+        except KeyError:
+            raise ParseError("Unexpected simple statement in suite:\n{}\n\n{}".format(repr(node),
+                unicode(node).encode('utf-8')))
+        wrapper = self.parse_node(handler_name, statement, container = container) \
+            if handler_name is not None else None
+        assert node.children[1].type == tokens.NEWLINE and node.children[1].value == '\n'
+        return wrapper
+
     def parse_suite(self, node, container = None):
-        assert isinstance(node, lib2to3.pytree.Base), "Invalid node:\n{}\n\n{}".format(repr(node),
-            unicode(node).encode('utf-8'))
-        assert isinstance(container, AbstractWrapper), "Invalid container {} for node:\n{}\n\n{}".format(container,
-            repr(node), unicode(node).encode('utf-8'))
+        if self.validate:
+            assert isinstance(node, lib2to3.pytree.Base), "Invalid node:\n{}\n\n{}".format(repr(node),
+                unicode(node).encode('utf-8'))
+            assert isinstance(container, AbstractWrapper), "Invalid container {} for node:\n{}\n\n{}".format(
+                container, repr(node), unicode(node).encode('utf-8'))
 
         if node.type == symbols.suite:
             children = node.children
         else:
             children = [node]  # Suite is only a single statement.
         body = []
+        statement_handler_name_by_type = self.statement_handler_name_by_type
         for child in children:
-            if child.type == symbols.for_stmt:
-                for_wrapper = self.For.parse(child, container = container, parser = self)
-                body.append(for_wrapper)
-            elif child.type == symbols.funcdef:
-                function = container.get_function_class(parser = self).parse(child, container = container,
-                    parser = self)
-                body.append(function)
-                container.variable_by_name[function.name] = self.Variable(container = container, name = function.name,
-                    parser = self, value = function)
-            elif child.type == symbols.if_stmt:
-                if_wrapper = self.If.parse(child, container = container, parser = self)
-                body.append(if_wrapper)
-            elif child.type == symbols.simple_stmt:
-                assert len(child.children) == 2, \
-                    "Unexpected length {} for simple statement in function definition:\n{}\n\n{}".format(
-                        len(child.children), repr(child), unicode(child).encode('utf-8'))
-                statement = child.children[0]
-                if statement.type == symbols.assert_stmt:
-                    assert_statement = self.Assert.parse(statement, container = container, parser = self)
-                    body.append(assert_statement)
-                elif statement.type == symbols.expr_stmt:
-                    assignment = self.Assignment.parse(statement, container = container, parser = self)
-                    body.append(assignment)
-                elif statement.type == symbols.global_stmt:
-                    # TODO: Used only by zone_apl.
-                    pass
-                elif statement.type == symbols.power:
-                    power = self.parse_power(statement, container = container)
-                    body.append(power)
-                elif statement.type == symbols.raise_stmt:
-                    raise_statement = self.Raise.parse(statement, container = container, parser = self)
-                    body.append(raise_statement)
-                elif statement.type == symbols.return_stmt:
-                    return_wrapper = self.Return.parse(statement, container = container, parser = self)
-                    body.append(return_wrapper)
-                elif statement.type == tokens.NAME and statement.value == 'continue':
-                    continue_statement = self.Continue(container = container, node = statement, parser = self)
-                    body.append(continue_statement)
-                elif statement.type == tokens.STRING:
-                    # Docstring
-                    string = self.String.parse(statement, container = container, parser = self)
-                    body.append(string)
-                else:
-                    assert False, "Unexpected simple statement in suite:\n{}\n\n{}".format(repr(child),
-                        unicode(child).encode('utf-8'))
-                assert child.children[1].type == tokens.NEWLINE and child.children[1].value == '\n'
-            elif child.type == symbols.with_stmt:
-                # TODO: Used only by zone_apl.
-                pass
-            elif child.type in (tokens.DEDENT, tokens.INDENT, tokens.NEWLINE):
-                pass
-            else:
-                assert False, "Unexpected statement in suite:\n{}\n\n{}".format(repr(child),
-                    unicode(child).encode('utf-8'))
+            try:
+                handler_name = statement_handler_name_by_type[child.type]
+            except KeyError:
+                raise ParseError("Unexpected statement in suite:\n{}\n\n{}".format(repr(child),
+                    unicode(child).encode('utf-8')))
+            if handler_name is None:
+                continue
+            wrapper = self.parse_node(handler_name, child, container = container)
+            if wrapper is not None:
+                body.append(wrapper)
         return body
 
     def parse_value(self, node, container = None):
-        assert isinstance(node, lib2to3.pytree.Base), "Invalid node:\n{}\n\n{}".format(repr(node),
-            unicode(node).encode('utf-8'))
-        assert isinstance(container, AbstractWrapper), "Invalid container {} for node:\n{}\n\n{}".format(container,
-            repr(node), unicode(node).encode('utf-8'))
-
-        if node.type == symbols.and_expr:
-            return self.AndExpression.parse(node, container = container, parser = self)
-
-        if node.type == symbols.and_test:
-            return self.AndTest.parse(node, container = container, parser = self)
-
-        if node.type == symbols.arith_expr:
-            return self.ArithmeticExpression.parse(node, container = container, parser = self)
-
-        if node.type == symbols.atom:
-            assert node.type == symbols.atom, "Unexpected atom type:\n{}\n\n{}".format(repr(node),
+        if self.validate:
+            assert isinstance(node, lib2to3.pytree.Base), "Invalid node:\n{}\n\n{}".format(repr(node),
                 unicode(node).encode('utf-8'))
-            children = node.children
-            assert len(children) == 3, "Unexpected length {} of children in atom:\n{}\n\n{}".format(len(children),
-                repr(node), unicode(node).encode('utf-8'))
-            left_parenthesis, value, right_parenthesis = children
-            assert left_parenthesis.type in (tokens.LBRACE, tokens.LPAR, tokens.LSQB), \
-                "Unexpected left parenthesis {} in atom:\n{}\n\n{}".format(left_parenthesis.value, repr(node),
-                    unicode(node).encode('utf-8'))
-            assert right_parenthesis.type in (tokens.RBRACE, tokens.RPAR, tokens.RSQB), \
-                "Unexpected right parenthesis {} in atom:\n{}\n\n{}".format(right_parenthesis.value, repr(node),
-                    unicode(node).encode('utf-8'))
-            if left_parenthesis.type == tokens.LPAR:
-                value = self.parse_value(value, container = container)
-                return self.ParentheticalExpression(container = container, node = node, parser = self, value = value)
-            if value.type == symbols.dictsetmaker:
-                dict_children = value.children
-                child_index = 0
-                while child_index < len(dict_children):
-                    item_key = self.parse_value(dict_children[child_index], container = container)
-                    assert dict_children[child_index + 1].type == tokens.COLON, \
-                        "Unexpected colon {} in atom:\n{}\n\n{}".format(dict_children[child_index + 1], repr(value),
-                            unicode(value).encode('utf-8'))
-                    item_value = self.parse_value(dict_children[child_index + 2], container = container)
-                    child_index += 3
-                    if dict_children[child_index].type == tokens.COMMA:
-                        child_index += 1
-                    else:
-                        assert child_index == len(dict_children), \
-                            "Missing comma after dictionary item {} in atom:\n{}\n\n{}".format(child_index, repr(value),
-                                unicode(value).encode('utf-8'))
-                # TODO: Currently it is assumed that dictionary is uniform.
-                return self.UniformDictionary(
-                    container = container,
-                    key = item_key,
-                    parser = self,
-                    value = item_value,
-                    )
-            if value.type == symbols.listmaker:
-                if any(child.type == symbols.comp_for for child in value.children):
-                    return self.ListGenerator.parse(value, container = container, parser = self)
-                return self.List.parse(value, container = container, parser = self)
-            singleton = self.parse_value(value, container = container)
-            return self.List(container = container, node = value, parser = self, value = [singleton])
-
-        if node.type == symbols.comparison:
-            return self.Comparison.parse(node, container = container, parser = self)
-
-        if node.type == symbols.expr:
-            return self.Expression.parse(node, container = container, parser = self)
-
-        if node.type == symbols.factor:
-            return self.Factor.parse(node, container = container, parser = self)
-
-        if node.type == symbols.lambdef:
-            return self.Lambda.parse(node, container = container, parser = self)
-
-        if node.type == symbols.not_test:
-            return self.NotTest.parse(node, container = container, parser = self)
-
-        if node.type == symbols.power:
-            return self.parse_power(node, container = container)
-
-        if node.type == symbols.term:
-            return self.Term.parse(node, container = container, parser = self)
-
-        if node.type == symbols.test:
-            return self.Test.parse(node, container = container, parser = self)
-
-        if node.type == symbols.testlist:
-            return self.Tuple.parse(node, container = container, parser = self)
-
-        if node.type == symbols.testlist_gexp:
-            return self.TupleGenerator.parse(node, container = container, parser = self)
-
-        if node.type == tokens.NAME:
-            name = node.value
-            if name == u'False':
-                return self.Boolean(container = container, parser = self, value = False)
-            elif name == u'None':
-                return self.NoneWrapper(container = container, parser = self)
-            elif name == u'True':
-                return self.Boolean(container = container, parser = self, value = True)
-            variable = container.get_variable(name, default = None, parser = self)
-            assert variable is not None, "Undefined variable: {}".format(name)
-            return variable
-
-        if node.type == tokens.NUMBER:
-            return self.Number.parse(node, container = container, parser = self)
-
-        if node.type == tokens.STRING:
-            return self.String.parse(node, container = container, parser = self)
+            assert isinstance(container, AbstractWrapper), "Invalid container {} for node:\n{}\n\n{}".format(
+                container, repr(node), unicode(node).encode('utf-8'))
 
-        assert False, "Unexpected value:\n{}\n\n{}".format(repr(node), unicode(node).encode('utf-8'))
+        handler_name = self.value_handler_name_by_type.get(node.type)
+        if handler_name is None:
+            raise ParseError("Unexpected value:\n{}\n\n{}".format(repr(node), unicode(node).encode('utf-8')))
+        return self.parse_node(handler_name, node, container = container)
 
     @property
     def person_class(self):
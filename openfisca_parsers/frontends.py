@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""Frontends building the lib2to3 parse trees wrapped by formulas parsers
+
+A frontend is a driver: an object with a grammar and a parse_string method returning the lib2to3 tree of a source.
+Each parser is given its own driver, so parsers of a same process may use different frontends.
+
+The "lib2to3" frontend is the pure Python tokenizer & parser of lib2to3. The "native" frontend uses the C parser of
+Python (module parser) and converts its concrete syntax tree to the tree lib2to3 would have built: same nodes, same
+leaves, same prefixes & positions.
+"""
+
+
+import gc
+import lib2to3.pgen2.driver
+import lib2to3.pygram
+import lib2to3.pytree
+import logging
+import parser as python_parser
+import re
+import symbol
+import token
+
+
+frontends_name = ('lib2to3', 'native')
+lib2to3_symbol_name_by_python_symbol_name = dict(
+    dictorsetmaker = 'dictsetmaker',
+    list_for = 'comp_for',
+    list_if = 'comp_if',
+    list_iter = 'comp_iter',
+    testlist_comp = 'testlist_gexp',
+    )
+log = logging.getLogger(__name__)
+newline_region_re = re.compile(r'(?:[ \t\f]+|#[^\r\n]*|\\\n)*')
+region_re = re.compile(r'(?:[ \t\f]+|#[^\r\n]*|\\?\n)*')  # Text between two tokens: spaces, comments & newlines
+special_python_types = set(
+    getattr(symbol, name)
+    for name in ('arglist', 'classdef', 'expr_stmt', 'file_input', 'fpdef', 'fplist', 'lambdef', 'old_lambdef',
+        'parameters', 'subscript', 'varargslist')
+    )
+symbols = lib2to3.pygram.python_symbols
+utf8_encodings_name = ('ascii', 'utf-8', 'utf8')
+
+
+class NativeDriver(object):
+    """Driver building lib2to3 trees from the concrete syntax trees of the C parser of Python
+
+    Sources that the C parser handles differently from the lib2to3 grammar (print function, encodings other than
+    UTF-8, carriage returns, no final newline) or rejects are parsed by lib2to3.
+    """
+    fallback_count = 0  # Number of sources parsed by lib2to3
+    fallback_driver = None
+    grammar = None
+    lib2to3_type_by_python_type = None
+
+    def __init__(self, grammar = None, logger = None):
+        if grammar is None:
+            grammar = lib2to3.pygram.python_grammar
+        assert grammar is lib2to3.pygram.python_grammar, "Native frontend supports only the Python 2 grammar"
+        self.fallback_driver = lib2to3.pgen2.driver.Driver(grammar, convert = lib2to3.pytree.convert,
+            logger = logger)
+        self.grammar = grammar
+        self.lib2to3_type_by_python_type = dict(
+            (python_type, grammar.symbol2number[lib2to3_symbol_name_by_python_symbol_name.get(name, name)])
+            for python_type, name in symbol.sym_name.iteritems()
+            if lib2to3_symbol_name_by_python_symbol_name.get(name, name) in grammar.symbol2number
+            )
+
+    def parse_string(self, source):
+        if not source.endswith('\n') or '\r' in source or 'print_function' in source:
+            return self.parse_string_fallback(source)
+        # Building a tree creates millions of tuples & nodes: Don't let the cyclic garbage collector scan all the
+        # objects of the process again and again while they are created.
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return self.parse_string_native(source)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def parse_string_native(self, source):
+        try:
+            python_tree = python_parser.suite(source.encode('utf-8') if isinstance(source, unicode) else source
+                ).totuple()
+        except SyntaxError:
+            return self.parse_string_fallback(source)
+        if python_tree[0] == symbol.encoding_decl:
+            python_tree, encoding = python_tree[1:]
+            if encoding.lower() not in utf8_encodings_name:
+                return self.parse_string_fallback(source)
+        try:
+            return TreeBuilder(self, source).convert(python_tree)
+        except RuntimeError:
+            # Maximum recursion depth exceeded
+            return self.parse_string_fallback(source)
+
+    def parse_string_fallback(self, source):
+        self.fallback_count += 1
+        return self.fallback_driver.parse_string(source)
+
+
+class TreeBuilder(object):
+    """Converter of the concrete syntax tree of a source, given by the C parser of Python, to a lib2to3 tree"""
+    driver = None
+    line_number = 1
+    position = 0  # Index in source of the end of the last converted leaf
+    source = None
+
+    def __init__(self, driver, source):
+        self.driver = driver
+        self.source = source
+
+    def convert(self, python_node, parameters_prefix = None):
+        """Convert a node of the C parser.
+
+        parameters_prefix is "t" for the parameters of a function and "v" for the ones of a lambda, because lib2to3
+        uses distinct symbols for them (typedargslist & tfpdef vs varargslist & vfpdef).
+        """
+        # Like lib2to3, skip the nodes having a single child, except the expression statements whose testlist becomes a
+        # testlist_star_expr.
+        while len(python_node) == 2 and python_node[0] >= token.NT_OFFSET and not (
+                python_node[0] == symbol.expr_stmt and python_node[1][0] == symbol.testlist):
+            python_node = python_node[1]
+        python_type = python_node[0]
+        if python_type < token.NT_OFFSET:
+            return self.convert_leaf(python_type, python_node[1])
+        if python_type not in special_python_types:
+            convert = self.convert
+            return lib2to3.pytree.Node(self.driver.lib2to3_type_by_python_type[python_type], [
+                convert(python_child)
+                for python_child in python_node[1:]
+                ])
+        name = symbol.sym_name[python_type]
+        if name == 'parameters':
+            children = self.convert_children(python_node, parameters_prefix = 't')
+        elif name in ('lambdef', 'old_lambdef'):
+            children = self.convert_children(python_node, parameters_prefix = 'v')
+        elif name in ('fpdef', 'fplist', 'varargslist'):
+            children = self.convert_children(python_node, parameters_prefix = parameters_prefix)
+            if name != 'varargslist':
+                name = parameters_prefix + name
+            elif parameters_prefix == 't':
+                name = 'typedargslist'
+            return lib2to3.pytree.Node(self.driver.grammar.symbol2number[name], children)
+        elif name == 'arglist':
+            # In lib2to3, "*args" is a star_expr and "**kwargs" an argument.
+            children = []
+            python_children = iter(python_node[1:])
+            for python_child in python_children:
+                if python_child[0] in (token.STAR, token.DOUBLESTAR):
+                    star = self.convert(python_child)
+                    children.append(lib2to3.pytree.Node(
+                        symbols.star_expr if python_child[0] == token.STAR else symbols.argument,
+                        [star, self.convert(next(python_children))],
+                        ))
+                else:
+                    children.append(self.convert(python_child))
+            if len(children) == 1:
+                return children[0]
+        elif name == 'classdef':
+            # In lib2to3, the base classes are an arglist.
+            children = self.convert_children(python_node)
+            for child in children:
+                if child.type == symbols.testlist:
+                    child.type = symbols.arglist
+        elif name == 'expr_stmt':
+            # In lib2to3, the targets & the values of assignments are testlist_star_expr, but not augmented values.
+            children = self.convert_children(python_node)
+            for index, child in enumerate(children):
+                if child.type == symbols.testlist and (index == 0 or children[index - 1].type != symbols.augassign):
+                    child.type = symbols.testlist_star_expr
+            if len(children) == 1:
+                return children[0]
+        elif name == 'subscript':
+            children = self.convert_children(python_node)
+            if children[0].type == token.DOT:
+                # In lib2to3, the ellipsis is an atom.
+                return lib2to3.pytree.Node(symbols.atom, children)
+        else:
+            assert name == 'file_input', name
+            # The C parser ends modules with a NEWLINE token that lib2to3 doesn't have.
+            children = [
+                self.convert(python_child)
+                for python_child in python_node[1:]
+                if python_child[0] != token.NEWLINE
+                ]
+        return lib2to3.pytree.Node(self.driver.lib2to3_type_by_python_type[python_type], children)
+
+    def convert_children(self, python_node, parameters_prefix = None):
+        return [
+            self.convert(python_child, parameters_prefix = parameters_prefix)
+            for python_child in python_node[1:]
+            ]
+
+    def convert_leaf(self, type, value):
+        source = self.source
+        position = self.position
+        if type == token.NEWLINE:
+            start = newline_region_re.match(source, position).end()
+            assert source[start] == '\n', "Expected a newline at index {} of:\n{}".format(start, source)
+            value = '\n'
+        else:
+            start = region_re.match(source, position).end()
+            if type == token.INDENT:
+                # Like the lib2to3 tokenizer, the indentation is the value of the INDENT leaf, not its prefix.
+                end = start
+                start = source.rfind('\n', 0, end) + 1
+                value = source[start:end]
+            elif value:
+                try:
+                    found = source.startswith(value, start)
+                except UnicodeDecodeError:
+                    # Non ASCII string in a unicode source
+                    value = value.decode('utf-8')
+                    found = source.startswith(value, start)
+                assert found, "Expected {!r} at index {} of:\n{}".format(value, start, source)
+        prefix = source[position:start]
+        line_number = self.line_number + prefix.count('\n')
+        self.line_number = line_number + value.count('\n')
+        self.position = start + len(value)
+        return lib2to3.pytree.Leaf(type, value, context = (prefix, (line_number,
+            start - source.rfind('\n', 0, start) - 1)))
+
+
+def create_driver(frontend = 'lib2to3', logger = None):
+    """Return the driver of a frontend, to give to a parser."""
+    assert frontend in frontends_name, "Unknown frontend: {}".format(frontend)
+    if frontend == 'native':
+        return NativeDriver(logger = logger)
+    return lib2to3.pgen2.driver.Driver(lib2to3.pygram.python_grammar, convert = lib2to3.pytree.convert,
+        logger = logger)
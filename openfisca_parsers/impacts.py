@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""Reverse dependencies of formulas: which formulas are impacted by a change of a parameter or a variable"""
+
+
+from . import input_variables_extractors, source_formulas_extractors
+
+
+class ImpactIndex(object):
+    """Inverted indexes of the input variables & parameters used by the formulas of a tax-benefit system
+
+    The indexes are built from the answers of an extractor of input variables (a parser or a serialized index of
+    input_variables_indexes).
+    """
+    dependency_graph = None  # source_formulas_extractors.DependencyGraph of the variables used by each formula
+    dependents_name_by_parameter_prefix = None  # Formulas using each parameter or node, or a parameter inside it
+    dependents_name_by_parameter = None  # Formulas directly using each parameter or node
+    tax_benefit_system = None
+
+    def __init__(self, tax_benefit_system, extractor = None):
+        self.tax_benefit_system = tax_benefit_system
+        if extractor is None:
+            extractor = input_variables_extractors.setup(tax_benefit_system)
+        dependents_name_by_parameter = {}
+        dependents_name_by_parameter_prefix = {}
+        source_formulas_by_name = {}
+        for column in tax_benefit_system.column_by_name.itervalues():
+            input_variables, parameters = extractor.get_input_variables_and_parameters(column)
+            if input_variables is None:
+                # Input variable
+                source_formulas_by_name[column.name] = None
+                continue
+            source_formulas_by_name[column.name] = frozenset(input_variables)
+            for parameter in parameters:
+                dependents_name_by_parameter.setdefault(parameter, set()).add(column.name)
+                names = parameter.split(u'.')
+                for index in xrange(1, len(names) + 1):
+                    dependents_name_by_parameter_prefix.setdefault(u'.'.join(names[:index]), set()).add(column.name)
+        self.dependency_graph = source_formulas_extractors.DependencyGraph(tax_benefit_system,
+            source_formulas_by_name = source_formulas_by_name).build()
+        self.dependents_name_by_parameter = freeze_values(dependents_name_by_parameter)
+        self.dependents_name_by_parameter_prefix = freeze_values(dependents_name_by_parameter_prefix)
+
+    def get_dependents(self, name):
+        """Return the names of the formulas directly using a variable."""
+        return self.dependency_graph.get_dependents(name)
+
+    def get_parameter_dependents(self, parameter):
+        """Return the names of the formulas directly using a parameter, a node containing it or a parameter inside it.
+
+        parameter is a dotted path of the legislation (a parameter, a scale or a node).
+        """
+        dependents_name = set(self.dependents_name_by_parameter_prefix.get(parameter, ()))
+        names = parameter.split(u'.')
+        for index in xrange(1, len(names)):
+            dependents_name.update(self.dependents_name_by_parameter.get(u'.'.join(names[:index]), ()))
+        return dependents_name
+
+    def get_impacted_formulas(self, parameters = None, variables = None):
+        """Return the names of the formulas that must be computed again when parameters or variables change.
+
+        The impacted formulas are the formulas that use these parameters or variables, directly or not. The changed
+        variables are not included, unless they are themselves impacted by another change (or by a cycle).
+        """
+        impacted_names = set()
+        if parameters is not None:
+            for parameter in parameters:
+                for dependent_name in self.get_parameter_dependents(parameter):
+                    if dependent_name not in impacted_names:
+                        impacted_names.add(dependent_name)
+                        impacted_names.update(self.get_transitive_dependents(dependent_name))
+        if variables is not None:
+            for name in variables:
+                impacted_names.update(self.get_transitive_dependents(name))
+        return impacted_names
+
+    def get_transitive_dependents(self, name):
+        """Return the names of the formulas that use a variable, directly or not."""
+        return self.dependency_graph.get_transitive_dependents(name)
+
+
+def freeze_values(items_by_key):
+    return dict(
+        (key, frozenset(items))
+        for key, items in items_by_key.iteritems()
+        )
@@ -26,17 +26,32 @@
 """Extract input variables from Python formulas using lib2to3."""
 
 
-import lib2to3.pgen2.driver
-import lib2to3.pygram
-import lib2to3.pytree
+import inspect
 import logging
+import os
+import sys
+import textwrap
 
 from openfisca_core import formulas
 
-from . import formulas_parsers_2to3
+from . import formulas_parsers_2to3, frontends
 
 
+# Names of the methods whose first argument is the name of an input variable
+input_variable_methods_name = frozenset([
+    'calculate',
+    'calculate_add',
+    'calculate_add_divide',
+    'calculate_divide',
+    'compute',
+    'compute_add',
+    'compute_add_divide',
+    'compute_divide',
+    'get_array',
+    ])
 log = logging.getLogger(__name__)
+symbols = formulas_parsers_2to3.symbols
+tokens = formulas_parsers_2to3.tokens
 
 
 class Attribute(formulas_parsers_2to3.Attribute):
@@ -46,7 +61,7 @@ class Attribute(formulas_parsers_2to3.Attribute):
 
         compact_node = self.subject.guess(parser.CompactNode)
         if compact_node is not None:
-            parser.parameters.add(tuple(compact_node.iter_names()) + (self.name,))
+            parser.parameters.add(compact_node.names + (self.name,))
 
 
 class Call(formulas_parsers_2to3.Call):
@@ -56,8 +71,7 @@ class Call(formulas_parsers_2to3.Call):
             named_arguments = named_arguments, node = node, parser = parser,
             positional_arguments = positional_arguments, star_argument = star_argument, subject = subject)
 
-        if self.subject.name in ('calculate', 'calculate_add', 'calculate_add_divide', 'calculate_divide', 'compute',
-                'compute_add', 'compute_add_divide', 'compute_divide', 'get_array'):
+        if self.subject.name in input_variable_methods_name:
             # TODO: Guess input_variable instead of assuming that it is a string with a "value" attribute.
             input_variable = self.positional_arguments[0]
             while isinstance(input_variable, parser.Variable):
@@ -78,14 +92,422 @@ class Call(formulas_parsers_2to3.Call):
                 if input_variable_name is not None:
                     parser.input_variables.add(input_variable_name)
                     return
-            assert False, "Unexpected class for input variable: {}".format(input_variable)
+            raise formulas_parsers_2to3.ParseError("Unexpected class for input variable: {}".format(input_variable))
+
+
+class FastExtractor(object):
+    """Extractor of the input variables & parameters of a formula, walking its parse tree without wrapping it
+
+    Only the names needed by the extraction are resolved: the string arguments of calculate* / compute* / get_array,
+    "self.__class__.__name__" and the attribute chains of "law" & "simulation.legislation_at(period.start)". Any
+    construct whose meaning would require the type inference of wrappers (helper functions, legislation nodes used
+    out of attribute chains, ambiguous bindings...) raises UnresolvedFormula, so that the formula is parsed instead.
+    """
+    called_names = None  # Names called by the current function, checked for helper functions before walking it
+    column = None
+    input_variables = None
+    law_path_by_name = None  # Legislation node bound to each name of the current function (None when not a node)
+    parameters = None  # Tuples of names of the legislation paths
+    parser = None
+    python_module = None
+    source_node = None  # Parse tree of the source of the formula class, when it has been parsed alone
+    values_by_name = None  # Assigned value nodes of each name of the current function (None for unknown values)
+
+    def __init__(self, column, parser = None):
+        self.column = column
+        self.input_variables = set()
+        self.parameters = set()
+        self.parser = parser
+
+    def evaluate(self, node):
+        """Visit an expression and return the legislation node it evaluates to, or None."""
+        if node.type == tokens.NAME:
+            return self.evaluate_name(node.value)
+        if node.type == symbols.power:
+            return self.visit_power(node)
+        if node.type == symbols.atom:
+            children = node.children
+            if len(children) == 3 and children[0].type == tokens.LPAR and children[1].type != symbols.testlist_gexp:
+                # Parenthetical expression
+                return self.evaluate(children[1])
+        self.visit_children(node)
+        return None
+
+    def evaluate_name(self, name):
+        law_path_by_name = self.law_path_by_name
+        if name in law_path_by_name:
+            return law_path_by_name[name]
+        if self.is_helper_function(name):
+            raise UnresolvedFormula(u'helper function')
+        return self.get_law_path(name)
+
+    def extract(self, formula_class):
+        """Extract the input variables & parameters of a formula class into input_variables & parameters."""
+        parser = self.parser
+        self.python_module = python_module = sys.modules[formula_class.__module__]
+        if parser.country_package is not None and not python_module.__file__.startswith(
+                os.path.dirname(parser.country_package.__file__)):
+            raise UnresolvedFormula(u'class defined outside country package')
+        class_node = self.get_class_node(formula_class)
+        children = class_node.children
+        if len(children) != 7 or children[2].type != tokens.LPAR or children[3].type != tokens.NAME:
+            raise UnresolvedFormula(u'class definition')
+        if children[6].type != symbols.suite:
+            raise UnresolvedFormula(u'class definition')
+        for suite_child in children[6].children[2:]:
+            if suite_child.type == symbols.funcdef:
+                self.extract_function(suite_child)
+            elif suite_child.type == symbols.decorated:
+                decorator, funcdef = suite_child.children
+                if decorator.type != symbols.decorator or len(decorator.children) != 6 \
+                        or funcdef.type != symbols.funcdef:
+                    raise UnresolvedFormula(u'decorator')
+                self.extract_function(funcdef)
+            elif suite_child.type == symbols.simple_stmt:
+                if len(suite_child.children) != 2 \
+                        or suite_child.children[0].type not in (symbols.expr_stmt, tokens.STRING):
+                    raise UnresolvedFormula(u'statement in class definition')
+            elif suite_child.type != tokens.DEDENT:
+                raise UnresolvedFormula(u'statement in class definition')
+
+    def extract_function(self, node):
+        children = node.children
+        parameters = children[2].children
+        if len(parameters) != 3 or parameters[1].type != symbols.typedargslist or [
+                parameter.value if parameter.type == tokens.NAME else None
+                for parameter in parameters[1].children
+                if parameter.type != tokens.COMMA
+                ] != ['self', 'simulation', 'period']:
+            raise UnresolvedFormula(u'function parameters')
+        self.called_names = called_names = set()
+        self.law_path_by_name = {}
+        self.values_by_name = values_by_name = {}
+        self.index_values(children[4])
+        if 'self' in values_by_name or 'simulation' in values_by_name:
+            raise UnresolvedFormula(u'assignment of self or simulation')
+        # Most formulas that can't be extracted call a helper function: Don't walk them before falling back.
+        if any(self.is_helper_function(name) for name in called_names):
+            raise UnresolvedFormula(u'helper function')
+        self.visit(children[4])
+        del self.called_names
+        del self.law_path_by_name
+        del self.values_by_name
+
+    def extract_input_variable(self, node):
+        """Extract the input variable named by the first argument of a call trailer."""
+        if len(node.children) != 3:
+            raise UnresolvedFormula(u'input variable name')
+        argument = node.children[1]
+        if argument.type == symbols.arglist:
+            argument = argument.children[0]
+        self.input_variables.add(self.get_variable_name(argument))
+
+    def get_class_node(self, formula_class):
+        parser = self.parser
+        if parser.parse_whole_modules:
+            module_node, class_node = parser.get_definition_node(formula_class)
+            if class_node is not None:
+                return class_node
+        source_lines, line_number = inspect.getsourcelines(formula_class)
+        self.source_node = node = parser.parse_string(textwrap.dedent(''.join(source_lines)))
+        children = node.children
+        if len(children) != 2 or children[0].type != symbols.classdef:
+            raise UnresolvedFormula(u'class definition')
+        return children[0]
+
+    def get_law_path(self, name):
+        """Return the legislation node bound to a name of the current function, or None."""
+        law_path_by_name = self.law_path_by_name
+        if name in law_path_by_name:
+            return law_path_by_name[name]
+        values = self.values_by_name.get(name)
+        if values is None:
+            law_path = self.parser.legislation_paths_index.root if name == 'law' else None
+        elif name == 'period':
+            law_path = None
+        else:
+            # A name whose value refers to itself is not a legislation node, unless another value is one.
+            law_path_by_name[name] = None
+            law_paths = [
+                self.evaluate(value) if value is not None else None
+                for value in values
+                ]
+            law_path = law_paths[0]
+            if len(law_paths) > 1 and any(value_law_path is not None for value_law_path in law_paths):
+                raise UnresolvedFormula(u'legislation node assigned several times')
+        law_path_by_name[name] = law_path
+        return law_path
+
+    def get_variable_name(self, node):
+        """Return the name of the input variable given by an argument node."""
+        if node.type == tokens.STRING:
+            try:
+                return self.parser.String.parse_value(node)
+            except formulas_parsers_2to3.ParseError:
+                raise UnresolvedFormula(u'input variable name')
+        if node.type == tokens.NAME:
+            values = self.values_by_name.get(node.value)
+            if values is not None and len(values) == 1 and values[0] is not None \
+                    and values[0].type != tokens.NAME:
+                return self.get_variable_name(values[0])
+        elif node.type == symbols.power:
+            children = node.children
+            if len(children) == 3 and children[0].type == tokens.NAME and children[0].value == 'self' \
+                    and is_attribute_trailer(children[1], '__class__') \
+                    and is_attribute_trailer(children[2], '__name__'):
+                return self.column.name
+        raise UnresolvedFormula(u'input variable name')
+
+    def index_target(self, node, value = None):
+        """Index the values assigned to the names of an assignment target."""
+        if node.type == tokens.NAME:
+            self.values_by_name.setdefault(node.value, []).append(value)
+        elif node.type in (symbols.atom, symbols.exprlist, symbols.testlist_gexp, symbols.testlist_star_expr):
+            for child in node.children:
+                self.index_target(child)
+
+    def index_values(self, node):
+        """Index the values assigned to each name of a function body, and the names it calls."""
+        called_names = self.called_names
+        pending_nodes = [node]
+        while pending_nodes:
+            node = pending_nodes.pop()
+            node_type = node.type
+            if node_type == symbols.power:
+                children = node.children
+                if children[0].type == tokens.NAME and children[1].type == symbols.trailer \
+                        and children[1].children[0].type == tokens.LPAR:
+                    called_names.add(children[0].value)
+            elif node_type == symbols.expr_stmt:
+                children = node.children
+                if len(children) == 3 and children[1].type == tokens.EQUAL:
+                    target, value = children[0], children[2]
+                    if target.type == value.type == symbols.testlist_star_expr \
+                            and len(target.children) == len(value.children):
+                        for target_child, value_child in zip(target.children, value.children):
+                            self.index_target(target_child, value = value_child)
+                    else:
+                        self.index_target(target, value = value)
+                else:
+                    for target in children[:-1:2]:
+                        self.index_target(target)
+            elif node_type in (symbols.comp_for, symbols.for_stmt):
+                self.index_target(node.children[1])
+            elif node_type in (symbols.lambdef, symbols.old_lambdef):
+                if len(node.children) == 4:
+                    for parameter in node.children[1].pre_order():
+                        if parameter.type == tokens.NAME:
+                            self.index_target(parameter)
+            elif node_type in (symbols.except_clause, symbols.with_item, symbols.with_stmt, symbols.with_var):
+                children = node.children
+                for index, child in enumerate(children[1:], 1):
+                    if children[index - 1].type in (tokens.COMMA, tokens.NAME) \
+                            and children[index - 1].value in (u',', u'as'):
+                        self.index_target(child)
+            elif node_type in (symbols.classdef, symbols.funcdef, symbols.global_stmt, symbols.import_from,
+                    symbols.import_name, symbols.exec_stmt):
+                raise UnresolvedFormula(u'unsupported statement')
+            # Leaves assign no value: Don't queue them.
+            pending_nodes.extend(child for child in node.children if child.children)
+
+    def is_helper_function(self, name):
+        """Return whether a name of the current function refers to a function of its module."""
+        return name not in self.values_by_name and name not in formulas_parsers_2to3.builtin_value_factory_by_name \
+            and inspect.isfunction(getattr(self.python_module, name, None))
+
+    def is_period_preserved(self):
+        """Return whether every value assigned to period is guessed to be a period by the parsing into wrappers."""
+        values = self.values_by_name.get('period')
+        return values is None or all(
+            value is not None and self.is_period_value(value)
+            for value in values
+            )
+
+    def is_period_value(self, node):
+        """Return whether an expression is a period derived from period by offset() & start.period(<string>)."""
+        if node.type == tokens.NAME:
+            return node.value == 'period'
+        if node.type != symbols.power:
+            return False
+        children = node.children
+        if children[0].type != tokens.NAME or children[0].value != 'period':
+            return False
+        is_period = True
+        trailer_index = 1
+        while trailer_index < len(children):
+            trailer = children[trailer_index]
+            if trailer.type != symbols.trailer or trailer.children[0].type != tokens.DOT:
+                return False
+            name = trailer.children[1].value
+            if name == 'start' and is_period:
+                is_period = False
+                trailer_index += 1
+                continue
+            if trailer_index + 1 >= len(children):
+                return False
+            arguments = children[trailer_index + 1]
+            if arguments.type != symbols.trailer or arguments.children[0].type != tokens.LPAR:
+                return False
+            if name == 'period' and not is_period:
+                argument = arguments.children[1]
+                if argument.type == symbols.arglist:
+                    argument = argument.children[0]
+                if argument.type != tokens.STRING:
+                    return False
+                is_period = True
+            elif name != 'offset':
+                return False
+            trailer_index += 2
+        return is_period
+
+    def visit(self, node):
+        """Visit a node whose value must not be a legislation node."""
+        if node.type == tokens.NAME or node.children:
+            if self.evaluate(node) is not None:
+                raise UnresolvedFormula(u'legislation node used out of attribute chains')
+
+    def visit_children(self, node):
+        node_type = node.type
+        children = node.children
+        if node_type == symbols.expr_stmt:
+            if len(children) == 3 and children[1].type == tokens.EQUAL:
+                target, value = children[0], children[2]
+                self.visit_target(target)
+                if target.type == tokens.NAME:
+                    self.evaluate(value)
+                elif target.type == value.type == symbols.testlist_star_expr \
+                        and len(target.children) == len(value.children):
+                    for value_child in value.children:
+                        self.evaluate(value_child)
+                else:
+                    self.visit(value)
+                return
+            for target in children[:-1:2]:
+                self.visit_target(target)
+            self.visit(children[-1])
+        elif node_type in (symbols.comp_for, symbols.for_stmt):
+            self.visit_target(children[1])
+            for child in children[2:]:
+                self.visit(child)
+        elif node_type in (symbols.lambdef, symbols.old_lambdef):
+            self.visit(children[-1])
+        elif node_type == symbols.argument:
+            if len(children) == 3 and children[1].type == tokens.EQUAL:
+                # Named argument
+                self.visit(children[2])
+            else:
+                for child in children:
+                    self.visit(child)
+        elif node_type in (symbols.except_clause, symbols.with_item, symbols.with_stmt, symbols.with_var):
+            for index, child in enumerate(children):
+                if index > 0 and children[index - 1].type in (tokens.COMMA, tokens.NAME) \
+                        and children[index - 1].value in (u',', u'as'):
+                    self.visit_target(child)
+                else:
+                    self.visit(child)
+        else:
+            for child in children:
+                if child.children or child.type == tokens.NAME:
+                    self.visit(child)
+
+    def visit_power(self, node):
+        """Visit a power node (an atom followed by trailers) and return the legislation node it evaluates to."""
+        children = node.children
+        head = children[0]
+        children_count = len(children)
+        law_path = None
+        trailer_index = 1
+        if head.type == tokens.NAME and head.value == 'simulation' \
+                and is_attribute_trailer(children[1], 'legislation_at'):
+            if children_count < 3 or not is_period_start_arguments_trailer(children[2]) \
+                    or not self.is_period_preserved():
+                raise UnresolvedFormula(u'legislation_at arguments')
+            law_path = self.parser.legislation_paths_index.root
+            trailer_index = 3
+        else:
+            law_path = self.evaluate(head)
+            if head.type == tokens.NAME and head.value in input_variable_methods_name \
+                    and children[1].type == symbols.trailer and children[1].children[0].type == tokens.LPAR:
+                self.extract_input_variable(children[1])
+        while trailer_index < children_count:
+            trailer = children[trailer_index]
+            trailer_index += 1
+            if trailer.type != symbols.trailer:
+                # Exponent
+                if law_path is not None:
+                    raise UnresolvedFormula(u'legislation node used out of attribute chains')
+                self.visit(trailer)
+                continue
+            trailer_children = trailer.children
+            if trailer_children[0].type == tokens.DOT:
+                name = trailer_children[1].value
+                if law_path is not None:
+                    self.parameters.add(law_path.names + (name,))
+                    law_path = law_path.get_child(name)
+                    if law_path is not None and law_path.type != u'Node':
+                        law_path = None
+                elif name in input_variable_methods_name and trailer_index < children_count:
+                    next_trailer = children[trailer_index]
+                    if next_trailer.type == symbols.trailer and next_trailer.children[0].type == tokens.LPAR:
+                        self.extract_input_variable(next_trailer)
+                continue
+            if law_path is not None:
+                raise UnresolvedFormula(u'call or subscript of legislation node')
+            for trailer_child in trailer_children:
+                self.visit(trailer_child)
+        return law_path
+
+    def visit_target(self, node):
+        """Visit an assignment target, whose names are not evaluated."""
+        if node.type in (symbols.atom, symbols.exprlist, symbols.testlist_gexp, symbols.testlist_star_expr):
+            for child in node.children:
+                self.visit_target(child)
+        elif node.type != tokens.NAME:
+            self.visit(node)
 
 
 class Parser(formulas_parsers_2to3.Parser):
     Attribute = Attribute
     Call = Call
+    fast = False  # When True, try FastExtractor before parsing the formulas into wrappers (implies parse_whole_modules)
+    fast_extracted = False  # True when the last formula has been extracted by FastExtractor
+    fast_fallback_reason = None  # Why FastExtractor couldn't extract the last formula, which has been parsed instead
+    parse_failed = False  # True when the parsing of the last formula failed, so its results may be incomplete
+
+    def __init__(self, country_package = None, driver = None, fast = False, node_arena = None,
+            parse_trees_cache = None, parse_whole_modules = False, profiler = None, retain_modules = False,
+            tax_benefit_system = None, validate = True):
+        if fast:
+            # Getting & parsing the source of each formula costs more than walking it: Parse each module once instead.
+            parse_whole_modules = True
+        super(Parser, self).__init__(country_package = country_package, driver = driver, node_arena = node_arena,
+            parse_trees_cache = parse_trees_cache, parse_whole_modules = parse_whole_modules, profiler = profiler,
+            retain_modules = retain_modules, tax_benefit_system = tax_benefit_system, validate = validate)
+        if fast:
+            self.fast = True
+
+    def extract_fast(self, fast_extractor):
+        """Extract the input variables & parameters of the current formula with a FastExtractor.
+
+        Return False when the formula can't be extracted without parsing it into wrappers.
+        """
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start('fast_extract', column = self.column)
+        try:
+            fast_extractor.extract(self.column.formula_class)
+        except UnresolvedFormula as exception:
+            self.fast_fallback_reason = exception.reason
+            return False
+        finally:
+            if profiler is not None:
+                profiler.stop()
+        return True
 
     def get_input_variables_and_parameters(self, column):
+        self.fast_extracted = False
+        self.fast_fallback_reason = None
+        self.parse_failed = False
         formula_class = column.formula_class
         assert formula_class is not None, "Column {} has no formula".format(column.name)
         if issubclass(formula_class, formulas.AbstractEntityToEntity):
@@ -94,30 +516,71 @@ class Parser(formulas_parsers_2to3.Parser):
             # Input variable
             return None, None
         self.column = column
-        self.input_variables = input_variables = set()
-        self.parameters = parameters = set()
-        try:
-            self.FormulaClassFileInput.parse(formula_class, parser = self)
-        except AssertionError:
-            # When parsing fails, assume that all input variables have already been parsed.
-            pass
-        for names_tuple in parameters.copy():
-            for i in range(len(names_tuple)):
-                parameters.discard(names_tuple[:i])
+        fast_extractor = FastExtractor(column, parser = self) if self.fast else None
+        if fast_extractor is not None and self.extract_fast(fast_extractor):
+            self.fast_extracted = True
+            input_variables = fast_extractor.input_variables
+            parameters = fast_extractor.parameters
+        else:
+            self.input_variables = input_variables = set()
+            self.parameters = parameters = set()
+            try:
+                # Reuse the parse tree of the formula, when the fast extractor has already parsed it.
+                self.FormulaClassFileInput.parse(formula_class,
+                    node = fast_extractor.source_node if fast_extractor is not None else None, parser = self)
+            except formulas_parsers_2to3.ParseError:
+                # When parsing fails, assume that all input variables have already been parsed.
+                self.parse_failed = True
+            del self.input_variables
+            del self.parameters
         parameters = set(
             u'.'.join(names_tuple)
-            for names_tuple in parameters
+            for names_tuple in self.legislation_paths_index.prune_prefixes(parameters)
             )
         del self.column
-        del self.input_variables
-        del self.parameters
-        self.python_module_by_name.clear()
+        self.reset_modules()
         return input_variables, parameters
 
 
-def setup(tax_benefit_system):
+class UnresolvedFormula(Exception):
+    """Raised by FastExtractor when a formula uses a construct that only the parsing into wrappers can resolve"""
+    reason = None
+
+    def __init__(self, reason):
+        super(UnresolvedFormula, self).__init__(reason)
+        self.reason = reason
+
+
+def is_attribute_trailer(node, name):
+    """Return whether a node is the trailer ".<name>"."""
+    if node.type != symbols.trailer:
+        return False
+    children = node.children
+    return children[0].type == tokens.DOT and children[1].value == name
+
+
+def is_period_start_arguments_trailer(node):
+    """Return whether a node is the trailer "(period.start)"."""
+    if node.type != symbols.trailer:
+        return False
+    children = node.children
+    if len(children) != 3 or children[0].type != tokens.LPAR:
+        return False
+    argument = children[1]
+    return argument.type == symbols.power and len(argument.children) == 2 and argument.children[0].type == tokens.NAME \
+        and argument.children[0].value == 'period' and is_attribute_trailer(argument.children[1], 'start')
+
+
+def setup(tax_benefit_system, fast = False, frontend = 'lib2to3', node_arena = None, parse_trees_cache = None,
+        parse_whole_modules = False, profiler = None, retain_modules = False, validate = True):
     return Parser(
-        driver = lib2to3.pgen2.driver.Driver(lib2to3.pygram.python_grammar, convert = lib2to3.pytree.convert,
-            logger = log),
+        driver = frontends.create_driver(frontend, logger = log),
+        fast = fast,
+        node_arena = node_arena,
+        parse_trees_cache = parse_trees_cache,
+        parse_whole_modules = parse_whole_modules,
+        profiler = profiler,
+        retain_modules = retain_modules,
         tax_benefit_system = tax_benefit_system,
+        validate = validate,
         )
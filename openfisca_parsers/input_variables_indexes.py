@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Serialized index of the input variables & parameters of formulas, to answer without parsing them"""
+
+
+import hashlib
+import inspect
+import json
+import logging
+import os
+import sys
+import types
+
+from . import (formulas_parsers_2to3, frontends, input_variables_extractors, legislation_paths, node_arenas,
+    parse_trees_caches)
+
+
+index_format_version = 1  # Increment when the content of index files changes.
+log = logging.getLogger(__name__)
+# Modules of the parsers whose changes may change the extracted input variables & parameters
+parser_modules = (
+    formulas_parsers_2to3,
+    frontends,
+    input_variables_extractors,
+    legislation_paths,
+    node_arenas,
+    parse_trees_caches,
+    sys.modules[__name__],
+    )
+
+
+class InputVariablesIndex(object):
+    """Input variables & parameters used by the formula of each variable of a tax-benefit system
+
+    An index answers get_input_variables_and_parameters like the parser of input_variables_extractors, but from the
+    results stored in a file at build time.
+    """
+    entry_by_name = None  # For each variable: input_variables, parameters, module & line_number
+    fingerprint = None
+    tax_benefit_system = None
+
+    def __init__(self, entry_by_name, fingerprint = None, tax_benefit_system = None):
+        self.entry_by_name = entry_by_name
+        self.fingerprint = fingerprint
+        self.tax_benefit_system = tax_benefit_system
+
+    def dump(self, file_path):
+        data = json.dumps(
+            dict(
+                entry_by_name = self.entry_by_name,
+                fingerprint = self.fingerprint,
+                format_version = index_format_version,
+                ),
+            separators = (',', ':'),
+            sort_keys = True,
+            )
+        # Write to a temporary file first, so that API workers never load a partially written index.
+        temporary_path = file_path + '.tmp'
+        try:
+            with open(temporary_path, 'wb') as index_file:
+                index_file.write(data)
+            os.rename(temporary_path, file_path)
+        except:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+    def get_entry(self, name):
+        return self.entry_by_name.get(name)
+
+    def get_input_variables_and_parameters(self, column):
+        entry = self.entry_by_name.get(column.name)
+        assert entry is not None, "Column {} is missing from index".format(column.name)
+        input_variables = entry['input_variables']
+        if input_variables is None:
+            # Input variable
+            return None, None
+        return set(input_variables), set(entry['parameters'])
+
+
+def build(tax_benefit_system, extractor = None):
+    """Extract the input variables & parameters of every formula of a tax-benefit system and return their index."""
+    if extractor is None:
+        extractor = input_variables_extractors.setup(tax_benefit_system)
+    entry_by_name = {}
+    for column in tax_benefit_system.column_by_name.itervalues():
+        input_variables, parameters = extractor.get_input_variables_and_parameters(column)
+        formula_class = column.formula_class
+        entry_by_name[column.name] = dict(
+            input_variables = sorted(input_variables) if input_variables is not None else None,
+            line_number = formula_class.line_number,
+            module = formula_class.__module__,
+            parameters = sorted(parameters) if parameters is not None else None,
+            )
+    return InputVariablesIndex(entry_by_name, fingerprint = get_fingerprint(tax_benefit_system),
+        tax_benefit_system = tax_benefit_system)
+
+
+def get_fingerprint(tax_benefit_system):
+    """Return a string that changes whenever the formulas of the tax-benefit system or the parsers change.
+
+    The fingerprint covers the sources of the modules defining formulas and of the modules of the country package that
+    they depend on (transitively, like the helper functions the parser reads), the legislation (whose nodes decide
+    which attributes are parameters or scales), the names of the columns and the sources of the parser modules.
+    """
+    formula_modules_name = set(
+        column.formula_class.__module__
+        for column in tax_benefit_system.column_by_name.itervalues()
+        )
+    packages_name = set(
+        module_name.split('.', 1)[0]
+        for module_name in formula_modules_name
+        )
+    modules_name = set()
+    remaining_modules_name = list(formula_modules_name)
+    while remaining_modules_name:
+        module_name = remaining_modules_name.pop()
+        if module_name in modules_name:
+            continue
+        modules_name.add(module_name)
+        module = sys.modules.get(module_name)
+        if module is None:
+            continue
+        for value in vars(module).itervalues():
+            if isinstance(value, types.ModuleType):
+                dependency_name = value.__name__
+            else:
+                dependency_name = getattr(value, '__module__', None)
+                if not isinstance(dependency_name, basestring):
+                    continue
+            if dependency_name not in modules_name and dependency_name in sys.modules \
+                    and dependency_name.split('.', 1)[0] in packages_name:
+                remaining_modules_name.append(dependency_name)
+    modules_name.update(
+        module.__name__
+        for module in parser_modules
+        )
+
+    fingerprint_hash = hashlib.sha1(str(index_format_version))
+    for module_name in sorted(modules_name):
+        fingerprint_hash.update('\0{}\0'.format(module_name))
+        module = sys.modules.get(module_name)
+        source_path = inspect.getsourcefile(module) if module is not None else None
+        if source_path is not None:
+            with open(source_path, 'rb') as source_file:
+                fingerprint_hash.update(source_file.read())
+    fingerprint_hash.update('\0')
+    fingerprint_hash.update(json.dumps(tax_benefit_system.legislation_json, separators = (',', ':'), sort_keys = True))
+    for name in sorted(tax_benefit_system.column_by_name):
+        fingerprint_hash.update('\0{}'.format(name))
+    return fingerprint_hash.hexdigest()
+
+
+def load(file_path, tax_benefit_system = None):
+    """Load an index file.
+
+    Return None when the file is missing, obsolete or (when a tax-benefit system is given) built from other formulas.
+    """
+    try:
+        with open(file_path, 'rb') as index_file:
+            data = json.load(index_file)
+    except (IOError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get('format_version') != index_format_version:
+        return None
+    if tax_benefit_system is not None and data['fingerprint'] != get_fingerprint(tax_benefit_system):
+        return None
+    return InputVariablesIndex(data['entry_by_name'], fingerprint = data['fingerprint'],
+        tax_benefit_system = tax_benefit_system)
+
+
+def setup(tax_benefit_system, file_path, **extractor_options):
+    """Return the index stored in file_path when it is up to date, or else a parser extracting the same answers."""
+    index = load(file_path, tax_benefit_system = tax_benefit_system)
+    if index is not None:
+        return index
+    log.warning(u'Index file {} is missing or outdated: Formulas will be parsed'.format(file_path))
+    return input_variables_extractors.setup(tax_benefit_system, **extractor_options)
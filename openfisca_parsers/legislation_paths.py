@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""Flat index of the paths of the nodes, parameters & scales of a legislation"""
+
+
+import weakref
+
+
+index_by_tax_benefit_system = weakref.WeakKeyDictionary()
+
+
+class LegislationPath(object):
+    """A node, a parameter or a scale of a legislation, interned by its index"""
+    child_by_name = None  # Only for nodes
+    format = None  # Only for parameters
+    json = None  # Legislation JSON of the node, parameter or scale
+    name = None  # None for the root of the legislation
+    names = None  # Tuple of the names from the root of the legislation
+    parent = None
+    path = None  # Dotted names
+    type = None  # u'Node', u'Parameter' or u'Scale'
+
+    def __init__(self, json, name = None, parent = None):
+        self.json = json
+        self.type = json['@type']
+        if self.type == u'Node':
+            self.child_by_name = {}
+        elif self.type == u'Parameter':
+            self.format = json.get('format')
+        if name is not None:
+            self.name = name
+            self.names = parent.names + (name,)
+            self.parent = parent
+            parent.child_by_name[name] = self
+        else:
+            self.names = ()
+        self.path = u'.'.join(self.names)
+
+    def __repr__(self):
+        return u'<LegislationPath {}>'.format(self.path)
+
+    def get_child(self, name):
+        if self.child_by_name is None:
+            return None
+        return self.child_by_name.get(name)
+
+
+class LegislationPathsIndex(object):
+    path_by_json_id = None  # The JSON of each path is kept by the path, so its id can't be reused.
+    path_by_names = None
+    root = None
+
+    def __init__(self, legislation_json):
+        self.root = root = LegislationPath(legislation_json)
+        self.path_by_json_id = {id(legislation_json): root}
+        self.path_by_names = {(): root}
+        pending_paths = [root]
+        while pending_paths:
+            path = pending_paths.pop()
+            if path.child_by_name is None:
+                continue
+            for child_name, child_json in path.json['children'].iteritems():
+                child = LegislationPath(child_json, name = child_name, parent = path)
+                self.path_by_json_id[id(child_json)] = child
+                self.path_by_names[child.names] = child
+                pending_paths.append(child)
+
+    def get_path(self, names):
+        """Return the path with the given tuple of names, or None."""
+        return self.path_by_names.get(names)
+
+    def get_path_of_json(self, json):
+        """Return the path of a JSON node, parameter or scale of the indexed legislation, or None."""
+        return self.path_by_json_id.get(id(json))
+
+    def prune_prefixes(self, names_tuples):
+        """Return the tuples of names that are not a prefix of another one."""
+        prefixes = set()
+        for names in names_tuples:
+            path = self.path_by_names.get(names[:-1])
+            if path is None:
+                # Not a legislation path: Compute its prefixes.
+                prefixes.update(names[:index] for index in xrange(len(names)))
+                continue
+            while path is not None and path.names not in prefixes:
+                prefixes.add(path.names)
+                path = path.parent
+        return set(names_tuples).difference(prefixes)
+
+
+def get_index(tax_benefit_system):
+    """Return the paths index of the legislation of a tax-benefit system, building it on first use."""
+    index = index_by_tax_benefit_system.get(tax_benefit_system)
+    if index is None:
+        index_by_tax_benefit_system[tax_benefit_system] = index = LegislationPathsIndex(
+            tax_benefit_system.legislation_json)
+    return index
@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""Parse trees stored as parallel NumPy arrays, to hold many formulas in memory and query them with vectorized masks"""
+
+
+import hashlib
+import lib2to3.pgen2.token
+import lib2to3.pygram
+import lib2to3.pytree
+
+import numpy as np
+
+
+array_dtype_by_name = dict(
+    columns = np.int32,
+    first_children = np.int32,
+    line_numbers = np.int32,
+    next_siblings = np.int32,
+    parents = np.int32,
+    prefix_ids = np.int32,
+    subtree_ends = np.int32,
+    tree_ids = np.int32,
+    types = np.int16,
+    value_ids = np.int32,
+    )
+symbols = lib2to3.pygram.python_symbols
+tokens = lib2to3.pgen2.token
+
+
+class ArenaNode(lib2to3.pytree.Base):
+    """A node or a leaf of a NodeArena, with the read-only API of lib2to3 nodes & leaves used by wrappers
+
+    Accessors are created on demand and hold only their arena & index: Two accessors of the same node are equal.
+    """
+    __slots__ = ('arena', 'index')
+
+    def __init__(self, arena, index):
+        self.arena = arena
+        self.index = index
+
+    def __hash__(self):
+        return hash((id(self.arena), self.index))
+
+    def __repr__(self):
+        if self.is_leaf:
+            return '{}({!r}, {!r})'.format('Leaf', self.type, self.value)
+        return '{}({}, {!r})'.format('Node', lib2to3.pytree.type_repr(self.type), self.children)
+
+    def __str__(self):
+        return unicode(self).encode('utf-8')
+
+    def __unicode__(self):
+        return self.arena.get_source(self.index)
+
+    def _eq(self, other):
+        return isinstance(other, ArenaNode) and self.arena is other.arena and self.index == other.index
+
+    @property
+    def children(self):
+        arena = self.arena
+        first_children = arena.array_by_name['first_children']
+        next_siblings = arena.array_by_name['next_siblings']
+        children = []
+        child_index = first_children[self.index]
+        while child_index >= 0:
+            children.append(ArenaNode(arena, int(child_index)))
+            child_index = next_siblings[child_index]
+        return children
+
+    @property
+    def column(self):
+        return int(self.arena.array_by_name['columns'][self.index])
+
+    def get_lineno(self):
+        return self.lineno
+
+    @property
+    def is_leaf(self):
+        return self.arena.array_by_name['value_ids'][self.index] >= 0
+
+    def leaves(self):
+        for index in self.arena.iter_leaves_index(self.index):
+            yield ArenaNode(self.arena, index)
+
+    @property
+    def lineno(self):
+        return int(self.arena.array_by_name['line_numbers'][self.index])
+
+    @property
+    def next_sibling(self):
+        next_sibling_index = self.arena.array_by_name['next_siblings'][self.index]
+        return ArenaNode(self.arena, int(next_sibling_index)) if next_sibling_index >= 0 else None
+
+    @property
+    def parent(self):
+        parent_index = self.arena.array_by_name['parents'][self.index]
+        return ArenaNode(self.arena, int(parent_index)) if parent_index >= 0 else None
+
+    def post_order(self):
+        for child in self.children:
+            for node in child.post_order():
+                yield node
+        yield self
+
+    def pre_order(self):
+        arena = self.arena
+        for index in xrange(self.index, arena.array_by_name['subtree_ends'][self.index]):
+            yield ArenaNode(arena, index)
+
+    @property
+    def prefix(self):
+        arena = self.arena
+        leaves_index = arena.iter_leaves_index(self.index)
+        for index in leaves_index:
+            return arena.strings[arena.array_by_name['prefix_ids'][index]]
+        return ''
+
+    @property
+    def prev_sibling(self):
+        parent = self.parent
+        if parent is None:
+            return None
+        previous_child = None
+        for child in parent.children:
+            if child.index == self.index:
+                return previous_child
+            previous_child = child
+
+    def to_pytree(self):
+        """Return a lib2to3 copy of this node (and of its descendants)."""
+        if self.is_leaf:
+            return lib2to3.pytree.Leaf(self.type, self.value, context = (self.prefix, (self.lineno, self.column)))
+        return lib2to3.pytree.Node(self.type, [
+            child.to_pytree()
+            for child in self.children
+            ])
+
+    @property
+    def type(self):
+        return int(self.arena.array_by_name['types'][self.index])
+
+    @property
+    def value(self):
+        value_id = self.arena.array_by_name['value_ids'][self.index]
+        if value_id < 0:
+            raise AttributeError("Node {} has no value".format(lib2to3.pytree.type_repr(self.type)))
+        return self.arena.strings[value_id]
+
+
+class NodeArena(object):
+    """Parse trees stored as parallel NumPy arrays, indexed by node
+
+    Nodes are numbered in pre-order, tree after tree, so the descendants of a node are the nodes from its index to its
+    subtree end. For each node, the arrays give its type (token or symbol number), the indexes of its parent, of its
+    first child & of its next sibling (-1 when missing), the end of its subtree, the index of its tree, the interned ids
+    of its value & prefix (-1 for non-leaf nodes) and the line & column of its first leaf.
+    """
+    array_by_name = None  # Arrays, with a capacity greater than node_count
+    node_count = 0
+    root_index_by_source_digest = None  # To add the trees of sources parsed several times only once
+    string_id_by_key = None
+    strings = None  # Interned values & prefixes of leaves
+    tree_keys = None  # Optional key of each tree (for example the name of its module)
+    tree_roots = None  # Index of the root node of each tree
+
+    def __init__(self, capacity = 1024):
+        self.array_by_name = dict(
+            (name, np.empty(capacity, dtype = dtype))
+            for name, dtype in array_dtype_by_name.iteritems()
+            )
+        self.root_index_by_source_digest = {}
+        self.string_id_by_key = {}
+        self.strings = []
+        self.tree_keys = []
+        self.tree_roots = []
+
+    def __getattr__(self, name):
+        # Give access to the used part of each array, for example arena.types.
+        if name in array_dtype_by_name:
+            return self.array_by_name[name][:self.node_count]
+        raise AttributeError(name)
+
+    def add_tree(self, node, key = None, source = None):
+        """Copy a lib2to3 tree into the arena and return the accessor of its root.
+
+        When the source of the tree is given, a tree of the same source is added only once.
+        """
+        if source is not None:
+            if isinstance(source, unicode):
+                source = source.encode('utf-8')
+            source_digest = hashlib.sha1(source).digest()
+            root_index = self.root_index_by_source_digest.get(source_digest)
+            if root_index is not None:
+                return ArenaNode(self, root_index)
+        start = self.node_count
+        tree_id = len(self.tree_roots)
+        columns = []
+        line_numbers = []
+        parents = []
+        prefix_ids = []
+        types = []
+        value_ids = []
+        pending_nodes = [(node, -1)]
+        while pending_nodes:
+            node, parent_index = pending_nodes.pop()
+            parents.append(parent_index)
+            types.append(node.type)
+            if isinstance(node, lib2to3.pytree.Leaf):
+                columns.append(node.column)
+                line_numbers.append(node.lineno)
+                prefix_ids.append(self.intern(node.prefix))
+                value_ids.append(self.intern(node.value))
+            else:
+                columns.append(-1)
+                line_numbers.append(-1)
+                prefix_ids.append(-1)
+                value_ids.append(-1)
+                index = start + len(types) - 1
+                pending_nodes.extend(
+                    (child, index)
+                    for child in reversed(node.children)
+                    )
+        tree_node_count = len(types)
+        end = start + tree_node_count
+        first_children = [-1] * tree_node_count
+        next_siblings = [-1] * tree_node_count
+        subtree_ends = range(start + 1, end + 1)
+        last_child_by_parent_index = {}
+        for offset, parent_index in enumerate(parents):
+            if parent_index < 0:
+                continue
+            parent_offset = parent_index - start
+            if first_children[parent_offset] < 0:
+                first_children[parent_offset] = start + offset
+            else:
+                next_siblings[last_child_by_parent_index[parent_index] - start] = start + offset
+            last_child_by_parent_index[parent_index] = start + offset
+        next_column = next_line_number = -1
+        for offset in xrange(tree_node_count - 1, -1, -1):
+            # Non-leaf nodes are positioned at their first leaf & end with their last descendant.
+            if value_ids[offset] >= 0:
+                next_column = columns[offset]
+                next_line_number = line_numbers[offset]
+            else:
+                columns[offset] = next_column
+                line_numbers[offset] = next_line_number
+            parent_index = parents[offset]
+            if parent_index >= 0 and subtree_ends[parent_index - start] < subtree_ends[offset]:
+                subtree_ends[parent_index - start] = subtree_ends[offset]
+
+        self.reserve(end)
+        for name, values in (
+                ('columns', columns),
+                ('first_children', first_children),
+                ('line_numbers', line_numbers),
+                ('next_siblings', next_siblings),
+                ('parents', parents),
+                ('prefix_ids', prefix_ids),
+                ('subtree_ends', subtree_ends),
+                ('types', types),
+                ('value_ids', value_ids),
+                ):
+            self.array_by_name[name][start:end] = values
+        self.array_by_name['tree_ids'][start:end] = tree_id
+        self.node_count = end
+        self.tree_keys.append(key)
+        self.tree_roots.append(start)
+        if source is not None:
+            self.root_index_by_source_digest[source_digest] = start
+        return ArenaNode(self, start)
+
+    def find_attribute_calls(self, names):
+        """Return the indexes of the trailers calling an attribute with one of the given names (like "x.name(...)")."""
+        types = self.types
+        value_ids = self.value_ids
+        first_children = self.first_children
+        next_siblings = self.next_siblings
+        names_id = [
+            string_id
+            for string_id in (
+                self.string_id_by_key.get((type(name), name))
+                for name in names
+                )
+            if string_id is not None
+            ]
+        names_index = np.nonzero((types == tokens.NAME) & np.in1d(value_ids, names_id))[0]
+        # The name must follow a dot in a trailer...
+        trailers_index = self.parents[names_index]
+        names_index = names_index[(trailers_index >= 0) & (types[trailers_index] == symbols.trailer)
+            & (first_children[trailers_index] != names_index)]
+        trailers_index = self.parents[names_index]
+        # ... followed by a trailer of arguments.
+        calls_index = next_siblings[trailers_index]
+        calls_index = calls_index[calls_index >= 0]
+        return calls_index[(types[calls_index] == symbols.trailer)
+            & (types[first_children[calls_index]] == tokens.LPAR)]
+
+    def get_enclosing(self, indexes, type):
+        """Return the indexes of the innermost nodes of the given type that contain the given nodes (-1 when none)."""
+        candidates_index = np.nonzero(self.types == type)[0]
+        subtree_ends = self.subtree_ends
+        positions = np.searchsorted(candidates_index, indexes, side = 'right') - 1
+        enclosing_indexes = np.full(len(indexes), -1, dtype = np.int32)
+        pending = positions >= 0
+        while pending.any():
+            candidates = candidates_index[positions[pending]]
+            found = subtree_ends[candidates] > indexes[pending]
+            pending_indexes = np.nonzero(pending)[0]
+            enclosing_indexes[pending_indexes[found]] = candidates[found]
+            positions[pending_indexes] -= 1
+            pending[pending_indexes[found]] = False
+            pending &= positions >= 0
+        return enclosing_indexes
+
+    def get_first_arguments(self, calls_index):
+        """Return the indexes of the first argument of call trailers (-1 for calls without arguments)."""
+        types = self.types
+        arguments_index = self.next_siblings[self.first_children[calls_index]]
+        arguments_index[types[arguments_index] == tokens.RPAR] = -1
+        arglists = arguments_index >= 0
+        arglists[arglists] = types[arguments_index[arglists]] == symbols.arglist
+        arguments_index[arglists] = self.first_children[arguments_index[arglists]]
+        return arguments_index
+
+    def get_node(self, index):
+        return ArenaNode(self, index)
+
+    def get_source(self, index):
+        """Return the source code of a node, with the prefix of its first leaf."""
+        return u''.join(
+            string.decode('utf-8') if isinstance(string, str) else string
+            for leaf_index in self.iter_leaves_index(index)
+            for string in (
+                self.strings[self.array_by_name['prefix_ids'][leaf_index]],
+                self.strings[self.array_by_name['value_ids'][leaf_index]],
+                )
+            )
+
+    def intern(self, string):
+        # Keep str & unicode strings apart, to give back values of the same type.
+        key = (type(string), string)
+        string_id = self.string_id_by_key.get(key)
+        if string_id is None:
+            self.string_id_by_key[key] = string_id = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def iter_leaves_index(self, index):
+        start = index
+        end = self.array_by_name['subtree_ends'][index]
+        value_ids = self.array_by_name['value_ids'][start:end]
+        for offset in np.nonzero(value_ids >= 0)[0]:
+            yield start + int(offset)
+
+    @property
+    def nbytes(self):
+        """Return the size of the used part of the arrays, in bytes (without the interned strings)."""
+        return sum(
+            array[:self.node_count].nbytes
+            for array in self.array_by_name.itervalues()
+            )
+
+    def reserve(self, node_count):
+        """Grow the arrays, doubling their capacity, until they can hold node_count nodes."""
+        capacity = len(self.array_by_name['types'])
+        if node_count <= capacity:
+            return
+        while capacity < node_count:
+            capacity *= 2
+        for name, array in self.array_by_name.items():
+            grown_array = np.empty(capacity, dtype = array.dtype)
+            grown_array[:self.node_count] = array[:self.node_count]
+            self.array_by_name[name] = grown_array
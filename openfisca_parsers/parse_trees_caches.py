@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Persistent on-disk cache of lib2to3 parse trees, keyed by a hash of their source code"""
+
+
+import errno
+import hashlib
+import lib2to3.pytree
+import marshal
+import os
+import sys
+import tempfile
+
+
+cache_format_version = 1  # Increment when the serialized form of trees changes.
+file_extension = '.marshal'
+grammar_fingerprint_by_grammar = {}
+
+
+class ParseTreesCache(object):
+    """Content-addressed cache of parse trees
+
+    Each tree is stored in its own file, named after the SHA-1 of the grammar fingerprint and of the parsed source.
+    Trees are serialized as nested tuples (using marshal), and files are evicted, least recently used first, when the
+    total size of the cache exceeds max_size.
+    """
+    directory = None
+    hit_count = 0
+    max_size = None  # Maximum total size of cache files in bytes (None = unbounded)
+    miss_count = 0
+    size = None  # Current total size of cache files in bytes
+
+    def __init__(self, directory, max_size = 256 * 1024 * 1024):
+        assert isinstance(directory, basestring), directory
+        self.directory = directory
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        if max_size is not None:
+            assert max_size > 0, max_size
+            self.max_size = max_size
+        self.size = sum(
+            size
+            for file_path, size, mtime in self.iter_files()
+            )
+
+    def get_key(self, source, grammar = None):
+        if isinstance(source, unicode):
+            source = source.encode('utf-8')
+        key_hash = hashlib.sha1(get_grammar_fingerprint(grammar))
+        key_hash.update('\0')
+        key_hash.update(source)
+        return key_hash.hexdigest()
+
+    def get_file_path(self, key):
+        return os.path.join(self.directory, key + file_extension)
+
+    def evict(self):
+        if self.max_size is None or self.size <= self.max_size:
+            return
+        # Evict until the cache fills no more than 90% of its maximum size, to avoid evicting at every store.
+        target_size = self.max_size * 9 // 10
+        for file_path, size, mtime in sorted(self.iter_files(), key = lambda file_item: file_item[2]):
+            if self.size <= target_size:
+                break
+            try:
+                os.remove(file_path)
+            except OSError as exception:
+                if exception.errno != errno.ENOENT:
+                    raise
+            self.size -= size
+
+    def iter_files(self):
+        for filename in os.listdir(self.directory):
+            if not filename.endswith(file_extension):
+                continue
+            file_path = os.path.join(self.directory, filename)
+            try:
+                file_stat = os.stat(file_path)
+            except OSError as exception:
+                if exception.errno != errno.ENOENT:
+                    raise
+                continue
+            yield file_path, file_stat.st_size, file_stat.st_mtime
+
+    def load(self, key):
+        file_path = self.get_file_path(key)
+        try:
+            with open(file_path, 'rb') as cache_file:
+                data = marshal.load(cache_file)
+        except (EOFError, IOError, TypeError, ValueError):
+            # Missing or corrupted file
+            return None
+        # Touch file to keep track of least recently used trees.
+        try:
+            os.utime(file_path, None)
+        except OSError:
+            pass
+        return data_to_node(data)
+
+    def parse_string(self, source, driver = None):
+        key = self.get_key(source, grammar = driver.grammar)
+        node = self.load(key)
+        if node is not None:
+            self.hit_count += 1
+            return node
+        self.miss_count += 1
+        node = driver.parse_string(source)
+        self.store(key, node)
+        return node
+
+    def store(self, key, node):
+        data = marshal.dumps(node_to_data(node))
+        file_descriptor, temporary_path = tempfile.mkstemp(dir = self.directory, suffix = '.tmp')
+        try:
+            with os.fdopen(file_descriptor, 'wb') as cache_file:
+                cache_file.write(data)
+            os.rename(temporary_path, self.get_file_path(key))
+        except:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        self.size += len(data)
+        self.evict()
+
+
+def data_to_node(data):
+    if len(data) == 2:
+        type, children_data = data
+        return lib2to3.pytree.Node(type, [
+            data_to_node(child_data)
+            for child_data in children_data
+            ])
+    type, value, prefix, line_number, column = data
+    return lib2to3.pytree.Leaf(type, value, context = (prefix, (line_number, column)))
+
+
+def get_grammar_fingerprint(grammar):
+    """Return a string that changes whenever the grammar or the Python version changes."""
+    fingerprint = grammar_fingerprint_by_grammar.get(grammar)
+    if fingerprint is None:
+        fingerprint_hash = hashlib.sha1('{}:{}'.format(cache_format_version, sys.version_info[:2]))
+        if grammar is not None:
+            fingerprint_hash.update(repr(sorted(grammar.symbol2number.iteritems())))
+            fingerprint_hash.update(repr(sorted(grammar.keywords.iteritems())))
+        grammar_fingerprint_by_grammar[grammar] = fingerprint = fingerprint_hash.hexdigest()
+    return fingerprint
+
+
+def node_to_data(node):
+    if isinstance(node, lib2to3.pytree.Leaf):
+        return (node.type, node.value, node.prefix, node.lineno, node.column)
+    return (node.type, tuple(
+        node_to_data(child)
+        for child in node.children
+        ))
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""Opt-in instrumentation of parsers: wall time & call counts by phase, by column, by wrapper class and by guess rule"""
+
+
+import collections
+import json
+import sys
+import time
+
+
+class Profiler(object):
+    """Accumulator of the wall time & call count of nested phases
+
+    The time of a phase excludes the time of the phases nested in it (for example the guesses made while wrapping a
+    formula), so that the times of all the phases add up to the profiled time.
+    """
+    count_by_phase_name = None
+    guess_hit_count_by_class_name = None
+    guess_miss_count_by_class_name = None
+    guess_seconds_by_class_name = None
+    rule_count_by_name = None
+    rule_seconds_by_name = None
+    seconds_by_phase_name = None
+    seconds_by_phase_name_by_column_name = None
+    # Running phases: [phase name, column name, wrapper class name, rule name, start time of the current slice]
+    stack = None
+
+    def __init__(self):
+        self.count_by_phase_name = collections.defaultdict(int)
+        self.guess_hit_count_by_class_name = collections.defaultdict(int)
+        self.guess_miss_count_by_class_name = collections.defaultdict(int)
+        self.guess_seconds_by_class_name = collections.defaultdict(float)
+        self.rule_count_by_name = collections.defaultdict(int)
+        self.rule_seconds_by_name = collections.defaultdict(float)
+        self.seconds_by_phase_name = collections.defaultdict(float)
+        self.seconds_by_phase_name_by_column_name = collections.defaultdict(lambda: collections.defaultdict(float))
+        self.stack = []
+
+    def add_slice(self, phase, stop_time):
+        phase_name, column_name, class_name, rule_name, start_time = phase
+        seconds = stop_time - start_time
+        self.seconds_by_phase_name[phase_name] += seconds
+        if column_name is not None:
+            self.seconds_by_phase_name_by_column_name[column_name][phase_name] += seconds
+        if class_name is not None:
+            # The time of a guess rule is also counted in the guesses of its wrapper class.
+            self.guess_seconds_by_class_name[class_name] += seconds
+        if rule_name is not None:
+            self.rule_seconds_by_name[rule_name] += seconds
+
+    def count_guess_hit(self, class_name):
+        self.guess_hit_count_by_class_name[class_name] += 1
+
+    def format_report(self, rows_count = 20):
+        """Return a human-readable summary of the report, limited to the rows_count slowest columns, classes & rules."""
+        report = self.get_report()
+        lines = [u'Total: {:.3f} s'.format(report['seconds'])]
+        lines.append(u'{:<56} {:>10} {:>12}'.format(u'Phase', u'Calls', u'Seconds'))
+        for phase_name, phase in sorted(report['phases'].iteritems(), key = lambda item: -item[1]['seconds']):
+            lines.append(u'{:<56} {:>10} {:>12.3f}'.format(phase_name, phase['count'], phase['seconds']))
+        lines.append(u'')
+        lines.append(u'{:<56} {:>10} {:>12}'.format(u'Column', u'', u'Seconds'))
+        for column_name, seconds_by_phase_name in sorted(report['columns'].iteritems(),
+                key = lambda item: -sum(item[1].itervalues()))[:rows_count]:
+            lines.append(u'{:<56} {:>10} {:>12.3f}'.format(column_name, u'', sum(seconds_by_phase_name.itervalues())))
+        lines.append(u'')
+        lines.append(u'{:<56} {:>10} {:>10} {:>12}'.format(u'Guessing class', u'Hits', u'Misses', u'Seconds'))
+        for class_name, guess in sorted(report['guesses'].iteritems(), key = lambda item: -item[1]['seconds'])[
+                :rows_count]:
+            lines.append(u'{:<56} {:>10} {:>10} {:>12.3f}'.format(class_name, guess['hits'], guess['misses'],
+                guess['seconds']))
+        lines.append(u'')
+        lines.append(u'{:<56} {:>10} {:>12}'.format(u'Guess rule', u'Calls', u'Seconds'))
+        for rule_name, rule in sorted(report['rules'].iteritems(), key = lambda item: -item[1]['seconds'])[:rows_count]:
+            lines.append(u'{:<56} {:>10} {:>12.3f}'.format(rule_name, rule['count'], rule['seconds']))
+        return u'\n'.join(lines) + u'\n'
+
+    def get_report(self):
+        """Return the accumulated times & counts as a JSON-compatible structure."""
+        return collections.OrderedDict((
+            ('seconds', sum(self.seconds_by_phase_name.itervalues())),
+            ('phases', dict(
+                (phase_name, dict(count = self.count_by_phase_name[phase_name], seconds = seconds))
+                for phase_name, seconds in self.seconds_by_phase_name.iteritems()
+                )),
+            ('columns', dict(
+                (column_name, dict(seconds_by_phase_name))
+                for column_name, seconds_by_phase_name in self.seconds_by_phase_name_by_column_name.iteritems()
+                )),
+            ('guesses', dict(
+                (class_name, dict(
+                    hits = self.guess_hit_count_by_class_name[class_name],
+                    misses = self.guess_miss_count_by_class_name[class_name],
+                    seconds = self.guess_seconds_by_class_name[class_name],
+                    ))
+                for class_name in set(self.guess_hit_count_by_class_name).union(self.guess_miss_count_by_class_name)
+                )),
+            ('rules', dict(
+                (rule_name, dict(count = count, seconds = self.rule_seconds_by_name[rule_name]))
+                for rule_name, count in self.rule_count_by_name.iteritems()
+                )),
+            ))
+
+    def start(self, phase_name, column = None, rule_name = None, wrapper_class_name = None):
+        """Start a phase, pausing the running one.
+
+        When wrapper_class_name is given, the phase is a guess made by a wrapper of this class, or when rule_name is
+        also given, a guess rule (named like "Call.guess_array_from_calculate") applied by this wrapper.
+        """
+        now = time.time()
+        stack = self.stack
+        if stack:
+            self.add_slice(stack[-1], now)
+        stack.append([phase_name, column.name if column is not None else None, wrapper_class_name, rule_name, now])
+
+    def stop(self):
+        """Stop the current phase and resume the phase it was nested in."""
+        now = time.time()
+        stack = self.stack
+        phase = stack.pop()
+        self.add_slice(phase, now)
+        self.count_by_phase_name[phase[0]] += 1
+        if phase[0] == 'guess':
+            self.guess_miss_count_by_class_name[phase[2]] += 1
+        if phase[3] is not None:
+            self.rule_count_by_name[phase[3]] += 1
+        if stack:
+            stack[-1][4] = now
+
+    def write_report(self, file_path):
+        """Write the report as JSON to file_path, or as text to standard error when file_path is "-"."""
+        if file_path == '-':
+            sys.stderr.write(self.format_report().encode('utf-8'))
+            return
+        with open(file_path, 'w') as report_file:
+            json.dump(self.get_report(), report_file, indent = 2, sort_keys = True)
+            report_file.write('\n')
@@ -0,0 +1,352 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Benchmark the parser, the extractors and the Julia compiler, on a synthetic or a real country package."""
+
+
+import argparse
+import contextlib
+import importlib
+import inspect
+import json
+import logging
+import os
+import platform
+import shutil
+import StringIO
+import sys
+import tempfile
+import time
+
+from openfisca_core import formulas
+
+from openfisca_parsers import formulas_parsers_2to3, frontends, input_variables_extractors, synthetic_countries
+from openfisca_parsers.scripts import formulas_to_julia, measure_wrappers_memory
+
+
+app_name = os.path.splitext(os.path.basename(__file__))[0]
+benchmark_format_version = 1  # Increment when the structure of results changes.
+log = logging.getLogger(app_name)
+
+
+class GuessTimer(object):
+    """Measure the time spent in (outermost) calls of AbstractWrapper.guess"""
+    count = 0
+    depth = 0
+    seconds = 0.0
+
+    @contextlib.contextmanager
+    def installed(self):
+        guess = formulas_parsers_2to3.AbstractWrapper.__dict__['guess']
+        timer = self
+
+        def timed_guess(wrapper, expected):
+            if timer.depth:
+                return guess(wrapper, expected)
+            timer.depth += 1
+            start = time.time()
+            try:
+                return guess(wrapper, expected)
+            finally:
+                timer.seconds += time.time() - start
+                timer.count += 1
+                timer.depth -= 1
+
+        formulas_parsers_2to3.AbstractWrapper.guess = timed_guess
+        try:
+            yield self
+        finally:
+            formulas_parsers_2to3.AbstractWrapper.guess = guess
+
+
+def benchmark_extract_input_variables(tax_benefit_system, frontend = 'lib2to3'):
+    """Time the extraction of input variables, parsing each formula, each module once, or walking them (fast mode).
+
+    The fast mode parses each module once, so compare it with the extract_input_variables_modules phase.
+    """
+    results = {}
+    for phase_name, fast, parse_whole_modules in (
+            ('extract_input_variables', False, False),
+            ('extract_input_variables_fast', True, True),
+            ('extract_input_variables_modules', False, True),
+            ):
+        extractor = input_variables_extractors.setup(tax_benefit_system, fast = fast, frontend = frontend,
+            parse_whole_modules = parse_whole_modules)
+        start = time.time()
+        for column in tax_benefit_system.column_by_name.itervalues():
+            extractor.get_input_variables_and_parameters(column)
+        results[phase_name] = (time.time() - start, len(tax_benefit_system.column_by_name))
+    return results
+
+
+def benchmark_julia(country_package, tax_benefit_system, columns, frontend = 'lib2to3'):
+    parser = formulas_to_julia.Parser(country_package = country_package, driver = create_driver(frontend),
+        tax_benefit_system = tax_benefit_system)
+    parse_seconds = juliaize_seconds = 0.0
+    converted_count = 0
+    for column in columns:
+        parser.column = column
+        start = time.time()
+        try:
+            formula_class_wrapper = parser.FormulaClassFileInput.parse(column.formula_class, parser = parser)
+            parse_seconds += time.time() - start
+            # The functions of a formula class are juliaized while generating its source: Time both together.
+            start = time.time()
+            formula_class_wrapper.juliaize().source_julia(depth = 0)
+            juliaize_seconds += time.time() - start
+        except Exception:
+            # Formula that can't be converted to Julia
+            continue
+        converted_count += 1
+    return dict(
+        julia_parse = (parse_seconds, converted_count),
+        juliaize = (juliaize_seconds, converted_count),
+        )
+
+
+def benchmark_julia_emit(country_package, tax_benefit_system, columns, frontend = 'lib2to3'):
+    """Time the writing of the Julia source of formula functions, once they are juliaized."""
+    parser = formulas_to_julia.Parser(country_package = country_package, driver = create_driver(frontend),
+        tax_benefit_system = tax_benefit_system)
+    emit_seconds = 0.0
+    emitted_count = 0
+    for column in columns:
+        parser.column = column
+        try:
+            formula_class_wrapper = parser.FormulaClassFileInput.parse(column.formula_class, parser = parser)
+            julia_functions = []
+            for variable in formula_class_wrapper.variable_by_name.itervalues():
+                function = variable.value
+                if isinstance(function, parser.Decorator):
+                    function = function.decorated
+                if isinstance(function, parser.FormulaFunction):
+                    julia_functions.append(function.juliaize())
+            start = time.time()
+            for function in julia_functions:
+                function.source_julia(depth = 0)
+            emit_seconds += time.time() - start
+        except Exception:
+            # Formula that can't be converted to Julia
+            continue
+        emitted_count += len(julia_functions)
+    return dict(julia_emit = (emit_seconds, emitted_count))
+
+
+def benchmark_parse(tax_benefit_system, columns, frontend = 'lib2to3'):
+    """Time the parsing of formulas into wrappers, with and without the validation of the wrappers & nodes."""
+    guess_timer = GuessTimer()
+    with guess_timer.installed():
+        parse_seconds = time_parse(formulas_parsers_2to3.Parser(driver = create_driver(frontend),
+            tax_benefit_system = tax_benefit_system), columns)
+    unvalidated_parse_seconds = time_parse(formulas_parsers_2to3.Parser(driver = create_driver(frontend),
+        tax_benefit_system = tax_benefit_system, validate = False), columns)
+    return dict(
+        guess = (guess_timer.seconds, guess_timer.count),
+        parse_formulas = (parse_seconds, len(columns)),
+        parse_formulas_unvalidated = (unvalidated_parse_seconds, len(columns)),
+        )
+
+
+def benchmark_parse_trees(modules_source, frontend = 'lib2to3'):
+    driver = create_driver(frontend)
+    start = time.time()
+    for source in modules_source:
+        driver.parse_string(source)
+    return dict(parse_trees = (time.time() - start, len(modules_source)))
+
+
+def compare_results(results, reference_results, max_slowdown = None):
+    """Print the ratio of the time of each phase to its reference time and return the phases slower than allowed."""
+    slow_phases_name = []
+    for phase_name, phase in sorted(results['phases'].iteritems()):
+        reference_phase = reference_results['phases'].get(phase_name)
+        if reference_phase is None or not reference_phase['best_seconds']:
+            continue
+        ratio = phase['best_seconds'] / reference_phase['best_seconds']
+        print >> sys.stderr, u'{:<32} {:>10.4f} s {:>10.4f} s {:>7.2f}x'.format(phase_name,
+            reference_phase['best_seconds'], phase['best_seconds'], ratio)
+        if max_slowdown is not None and ratio > max_slowdown:
+            slow_phases_name.append(phase_name)
+    return slow_phases_name
+
+
+def create_driver(frontend = 'lib2to3'):
+    return frontends.create_driver(frontend, logger = log)
+
+
+def time_parse(parser, columns):
+    """Return the time spent parsing formulas into wrappers, skipping the formulas that can't be parsed."""
+    start = time.time()
+    for column in columns:
+        parser.column = column
+        try:
+            parser.FormulaClassFileInput.parse(column.formula_class, parser = parser)
+        except formulas_parsers_2to3.ParseError:
+            pass
+        parser.reset_modules()
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument('-c', '--country-package', default = None,
+        help = u'name of the OpenFisca package to benchmark (default: a generated synthetic country package)')
+    parser.add_argument('--compare', default = None,
+        help = u'path of a JSON file of previous results, to compare with')
+    parser.add_argument('-F', '--frontend', choices = frontends.frontends_name, default = 'lib2to3',
+        help = u'parser building the parse trees of formulas (default: lib2to3)')
+    parser.add_argument('--formulas', default = 200, type = int,
+        help = u'number of formulas of the synthetic country package (default: 200)')
+    parser.add_argument('--helpers', default = 20, type = int,
+        help = u'number of helper functions of the synthetic country package (default: 20)')
+    parser.add_argument('--input-variables', default = 50, type = int,
+        help = u'number of input variables of the synthetic country package (default: 50)')
+    parser.add_argument('--max-slowdown', default = None, type = float,
+        help = u'with --compare, fail when a phase is slower than its previous time by more than this ratio')
+    parser.add_argument('--modules', default = 10, type = int,
+        help = u'number of formula modules of the synthetic country package (default: 10)')
+    parser.add_argument('-o', '--output', default = None,
+        help = u'path of the JSON file where results are written (default: standard output)')
+    parser.add_argument('--parameters', default = 100, type = int,
+        help = u'number of legislation parameters of the synthetic country package (default: 100)')
+    parser.add_argument('-r', '--repeat', default = 3, type = int,
+        help = u'number of runs of each phase, the best one being kept (default: 3)')
+    parser.add_argument('-s', '--seed', default = 0, type = int,
+        help = u'seed of the generator of the synthetic country package (default: 0)')
+    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
+    args = parser.parse_args()
+    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.WARNING, stream = sys.stderr)
+
+    fixture = None
+    fixture_dir = None
+    try:
+        if args.country_package is None:
+            fixture = dict(
+                formulas_count = args.formulas,
+                helpers_count = args.helpers,
+                input_variables_count = args.input_variables,
+                modules_count = args.modules,
+                parameters_count = args.parameters,
+                seed = args.seed,
+                )
+            fixture_dir = tempfile.mkdtemp(prefix = 'openfisca_parsers_benchmark_')
+            synthetic_countries.generate_country_package(fixture_dir, **fixture)
+            sys.path.insert(0, fixture_dir)
+            country_package_name = 'openfisca_synthetic'
+        else:
+            country_package_name = args.country_package
+        country_package = importlib.import_module(country_package_name)
+        TaxBenefitSystem = country_package.init_country()
+        tax_benefit_system = TaxBenefitSystem()
+
+        formula_columns = [
+            column
+            for column in tax_benefit_system.column_by_name.itervalues()
+            if not issubclass(column.formula_class, formulas.AbstractEntityToEntity)
+                and not (issubclass(column.formula_class, formulas.SimpleFormula)
+                    and column.formula_class.function is None)
+            ]
+        modules_source = []
+        for module in sorted(set(inspect.getmodule(column.formula_class) for column in formula_columns),
+                key = lambda module: module.__name__):
+            source = inspect.getsource(module)
+            if not source.endswith('\n'):
+                source += '\n'
+            modules_source.append(source)
+
+        phases_runs = dict(
+            (phase_name, [])
+            for phase_name in ('extract_input_variables', 'extract_input_variables_fast',
+                'extract_input_variables_modules', 'guess', 'julia_emit', 'julia_parse', 'juliaize', 'parse_formulas',
+                'parse_formulas_unvalidated', 'parse_trees')
+            )
+        for run_index in range(args.repeat):
+            for phase_name, benchmark in (
+                    ('parse_trees', lambda: benchmark_parse_trees(modules_source, frontend = args.frontend)),
+                    ('parse_formulas', lambda: benchmark_parse(tax_benefit_system, formula_columns,
+                        frontend = args.frontend)),
+                    ('extract_input_variables', lambda: benchmark_extract_input_variables(tax_benefit_system,
+                        frontend = args.frontend)),
+                    ('julia', lambda: benchmark_julia(country_package, tax_benefit_system, formula_columns,
+                        frontend = args.frontend)),
+                    ('julia_emit', lambda: benchmark_julia_emit(country_package, tax_benefit_system, formula_columns,
+                        frontend = args.frontend)),
+                    ):
+                log.info(u'Run {} of phase {}'.format(run_index + 1, phase_name))
+                # Formulas that fail to parse print their parse trees: Don't mix them with results.
+                stdout = sys.stdout
+                sys.stdout = StringIO.StringIO()
+                try:
+                    timing_by_phase_name = benchmark()
+                finally:
+                    sys.stdout = stdout
+                for timed_phase_name, timing in timing_by_phase_name.iteritems():
+                    phases_runs[timed_phase_name].append(timing)
+    finally:
+        if fixture_dir is not None:
+            shutil.rmtree(fixture_dir, ignore_errors = True)
+
+    phases = {}
+    for phase_name, runs in phases_runs.iteritems():
+        best_seconds, count = min(runs)
+        phases[phase_name] = dict(
+            best_seconds = best_seconds,
+            count = count,
+            per_second = count / best_seconds if best_seconds else None,
+            seconds = [seconds for seconds, count in runs],
+            )
+    results = dict(
+        country_package = country_package_name,
+        fixture = fixture,
+        format_version = benchmark_format_version,
+        frontend = args.frontend,
+        optimized = bool(sys.flags.optimize),  # True when run with "python -O", without assertions
+        peak_rss_kb = measure_wrappers_memory.get_peak_rss(),  # High-water mark of the whole run, not per phase
+        phases = phases,
+        python_version = platform.python_version(),
+        variables_count = len(tax_benefit_system.column_by_name),
+        )
+    results_json = json.dumps(results, indent = 2, sort_keys = True)
+    if args.output is None:
+        print results_json
+    else:
+        with open(args.output, 'w') as output_file:
+            output_file.write(results_json)
+            output_file.write('\n')
+
+    if args.compare is not None:
+        with open(args.compare) as reference_file:
+            reference_results = json.load(reference_file)
+        slow_phases_name = compare_results(results, reference_results, max_slowdown = args.max_slowdown)
+        if slow_phases_name:
+            log.error(u'Phases slower than allowed: {}'.format(u', '.join(slow_phases_name)))
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Build the index file of the input variables & parameters of formulas, to load them without parsing formulas."""
+
+
+import argparse
+import importlib
+import logging
+import os
+import sys
+
+from openfisca_parsers import input_variables_extractors, input_variables_indexes, parse_trees_caches, profilers
+
+
+app_name = os.path.splitext(os.path.basename(__file__))[0]
+log = logging.getLogger(app_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument('index_path', help = u'path of the index file to write')
+    parser.add_argument('-c', '--country-package', default = 'openfisca_france',
+        help = u'name of the OpenFisca package to use for country-specific variables & formulas')
+    parser.add_argument('-p', '--parse-cache-dir', default = None,
+        help = u'path of a directory where parse trees are cached between runs (default: no cache)')
+    parser.add_argument('-m', '--whole-modules', action = 'store_true', default = False,
+        help = u'parse each module of the country package once, instead of once per formula')
+    parser.add_argument('--profile', const = '-', default = None, metavar = 'REPORT_PATH', nargs = '?',
+        help = u'time the phases of the extraction and write their report as JSON (default: as text to stderr)')
+    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
+    args = parser.parse_args()
+    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.WARNING, stream = sys.stdout)
+
+    country_package = importlib.import_module(args.country_package)
+    TaxBenefitSystem = country_package.init_country()
+    tax_benefit_system = TaxBenefitSystem()
+
+    extractor = input_variables_extractors.setup(tax_benefit_system,
+        parse_trees_cache = parse_trees_caches.ParseTreesCache(args.parse_cache_dir)
+            if args.parse_cache_dir is not None
+            else None,
+        parse_whole_modules = args.whole_modules,
+        profiler = profilers.Profiler() if args.profile is not None else None,
+        )
+    index = input_variables_indexes.build(tax_benefit_system, extractor = extractor)
+    if extractor.profiler is not None:
+        extractor.profiler.write_report(args.profile)
+    index.dump(args.index_path)
+    log.info(u'Wrote index of {} variables to {}'.format(len(index.entry_by_name), args.index_path))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
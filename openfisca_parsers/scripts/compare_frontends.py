@@ -0,0 +1,135 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Check that the frontends of the parsers build the same parse trees and extract the same input variables."""
+
+
+import argparse
+import gc
+import importlib
+import inspect
+import logging
+import os
+import sys
+import time
+
+from openfisca_parsers import frontends, input_variables_extractors, parse_trees_caches
+
+
+app_name = os.path.splitext(os.path.basename(__file__))[0]
+log = logging.getLogger(app_name)
+
+
+def find_first_difference(data, reference_data):
+    """Return the path & the data of the first nodes that differ in two serialized parse trees (or None)."""
+    if len(data) != len(reference_data) or len(data) != 2 or data[0] != reference_data[0] \
+            or len(data[1]) != len(reference_data[1]):
+        return ((), data, reference_data) if data != reference_data else None
+    for index, (child_data, reference_child_data) in enumerate(zip(data[1], reference_data[1])):
+        difference = find_first_difference(child_data, reference_child_data)
+        if difference is not None:
+            path, child_data, reference_child_data = difference
+            return ((index,) + path, child_data, reference_child_data)
+    return None
+
+
+def parse_sources(driver, sources):
+    # Keep the trees of every frontend alive, so that the garbage collector works as much for each of them.
+    gc.collect()
+    start = time.time()
+    trees = [
+        driver.parse_string(source)
+        for source in sources
+        ]
+    return trees, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument('-c', '--country-package', default = 'openfisca_france',
+        help = u'name of the OpenFisca package to use for country-specific variables & formulas')
+    parser.add_argument('-F', '--frontend', choices = frontends.frontends_name, default = 'native',
+        help = u'frontend to compare with lib2to3 (default: native)')
+    parser.add_argument('-t', '--trees-only', action = 'store_true', default = False,
+        help = u'compare only the parse trees of modules, not the input variables extracted from them')
+    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
+    args = parser.parse_args()
+    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.INFO, stream = sys.stdout)
+
+    country_package = importlib.import_module(args.country_package)
+    TaxBenefitSystem = country_package.init_country()
+    tax_benefit_system = TaxBenefitSystem()
+
+    modules = sorted(
+        set(
+            inspect.getmodule(column.formula_class)
+            for column in tax_benefit_system.column_by_name.itervalues()
+            ),
+        key = lambda module: module.__name__,
+        )
+    sources = []
+    for module in modules:
+        source = inspect.getsource(module).decode('utf-8')
+        if not source.endswith(u'\n'):
+            source += u'\n'
+        sources.append(source)
+
+    differences_count = 0
+    reference_trees, reference_seconds = parse_sources(frontends.create_driver('lib2to3', logger = log), sources)
+    trees, seconds = parse_sources(frontends.create_driver(args.frontend, logger = log), sources)
+    for module, tree, reference_tree in zip(modules, trees, reference_trees):
+        difference = find_first_difference(parse_trees_caches.node_to_data(tree),
+            parse_trees_caches.node_to_data(reference_tree))
+        if difference is not None:
+            differences_count += 1
+            path, data, reference_data = difference
+            log.error(u'Parse trees of module {} differ at {}:\n  lib2to3: {!r}\n  {}: {!r}'.format(module.__name__,
+                path, reference_data, args.frontend, data))
+    log.info(u'Parsed {} modules: lib2to3 {:.3f} s, {} {:.3f} s ({:.2f}x)'.format(len(sources), reference_seconds,
+        args.frontend, seconds, reference_seconds / seconds if seconds else 0))
+    del reference_trees, trees
+
+    if not args.trees_only:
+        reference_extractor = input_variables_extractors.setup(tax_benefit_system, frontend = 'lib2to3')
+        extractor = input_variables_extractors.setup(tax_benefit_system, frontend = args.frontend)
+        for column in tax_benefit_system.column_by_name.itervalues():
+            reference_result = reference_extractor.get_input_variables_and_parameters(column)
+            result = extractor.get_input_variables_and_parameters(column)
+            if result != reference_result:
+                differences_count += 1
+                log.error(u'Input variables & parameters of {} differ:\n  lib2to3: {}\n  {}: {}'.format(column.name,
+                    reference_result, args.frontend, result))
+        log.info(u'Compared the input variables & parameters of {} variables'.format(
+            len(tax_benefit_system.column_by_name)))
+
+    if differences_count:
+        log.error(u'{} differences found'.format(differences_count))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
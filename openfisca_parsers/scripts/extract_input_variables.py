@@ -28,50 +28,191 @@
 
 
 import argparse
+import collections
 import importlib
+import json
 import logging
+import multiprocessing
 import os
+import StringIO
 import sys
+import time
 
-from openfisca_parsers import input_variables_extractors
+from openfisca_parsers import frontends, input_variables_extractors, node_arenas, parse_trees_caches, profilers
 
 
 app_name = os.path.splitext(os.path.basename(__file__))[0]
 log = logging.getLogger(app_name)
+worker_extractor = None  # Extractor of a worker process, when extracting with several jobs
+
+
+def extract_column(name):
+    """Extract the input variables & parameters of a column in a worker process, capturing the printed messages."""
+    return extract_column_captured(worker_extractor, worker_extractor.tax_benefit_system.column_by_name[name])
+
+
+def extract_column_captured(extractor, column):
+    """Extract the input variables & parameters of a column, capturing the messages printed during its parsing.
+
+    Return the messages, the input variables, the parameters, whether parsing failed, the elapsed time, whether the
+    fast extraction succeeded and why it failed.
+    """
+    stdout = sys.stdout
+    sys.stdout = output = StringIO.StringIO()
+    start_time = time.time()
+    try:
+        input_variables, parameters = extractor.get_input_variables_and_parameters(column)
+    except:
+        sys.stdout = stdout
+        sys.stdout.write(output.getvalue())
+        raise
+    finally:
+        sys.stdout = stdout
+    return (output.getvalue(), input_variables, parameters, extractor.parse_failed, time.time() - start_time,
+        extractor.fast_extracted, extractor.fast_fallback_reason)
+
+
+def setup_worker(tax_benefit_system, setup_options):
+    global worker_extractor
+    worker_extractor = input_variables_extractors.setup(tax_benefit_system, **setup_options)
+
+
+def write_column_result(column, output, input_variables, parameters, parse_failed, elapsed, fast_extracted,
+        fast_fallback_reason, output_format = 'text'):
+    if output_format == 'ndjson':
+        # Keep standard output for JSON lines only.
+        sys.stderr.write(output)
+        result = collections.OrderedDict((
+            ('name', column.name),
+            ('entity', column.entity_key_plural),
+            ('input_variables', sorted(input_variables) if input_variables is not None else None),
+            ('parameters', sorted(parameters) if parameters is not None else None),
+            ('status', u'input' if input_variables is None else u'failed' if parse_failed else u'ok'),
+            ('elapsed', round(elapsed, 6)),
+            ))
+        if fast_extracted or fast_fallback_reason is not None:
+            result['extraction'] = u'fast' if fast_extracted else u'full'
+            result['fallback_reason'] = fast_fallback_reason
+        sys.stdout.write(json.dumps(result))
+        sys.stdout.write('\n')
+        sys.stdout.flush()
+        return
+    print column.name
+    sys.stdout.write(output)
+    if input_variables is not None:
+        print u' Input variables:', u', '.join(sorted(input_variables))
+    if parameters:
+        print u' Parameters:', u', '.join(sorted(parameters))
+
+
+def write_fast_report(column_results, verbose = False):
+    """Write to stderr the share of the formulas extracted by the fast extraction & the reasons of its fallbacks."""
+    fast_extracted_count = 0
+    fallback_columns_name_by_reason = collections.defaultdict(list)
+    for column_name, fast_extracted, fast_fallback_reason in column_results:
+        if fast_extracted:
+            fast_extracted_count += 1
+        elif fast_fallback_reason is not None:
+            fallback_columns_name_by_reason[fast_fallback_reason].append(column_name)
+    formulas_count = fast_extracted_count + sum(
+        len(columns_name)
+        for columns_name in fallback_columns_name_by_reason.itervalues()
+        )
+    sys.stderr.write(u'Fast extraction: {} formulas out of {} ({:.1f} %)\n'.format(fast_extracted_count,
+        formulas_count, 100.0 * fast_extracted_count / formulas_count if formulas_count else 100.0))
+    for reason, columns_name in sorted(fallback_columns_name_by_reason.iteritems(),
+            key = lambda item: (-len(item[1]), item[0])):
+        sys.stderr.write(u'  {:>5}  {}{}\n'.format(len(columns_name), reason,
+            u': {}'.format(u', '.join(columns_name)) if verbose else u''))
 
 
 def main():
     parser = argparse.ArgumentParser(description = __doc__)
     parser.add_argument('-c', '--country-package', default = 'openfisca_france',
         help = u'name of the OpenFisca package to use for country-specific variables & formulas')
+    parser.add_argument('--fast', action = 'store_true', default = False,
+        help = u'extract formulas by walking their parse trees, parsing into wrappers only those it can\'t resolve, '
+            u'and write a coverage report to stderr (implies --whole-modules)')
+    parser.add_argument('-F', '--frontend', choices = frontends.frontends_name, default = 'lib2to3',
+        help = u'parser building the parse trees of formulas: lib2to3, or the faster C parser of Python (native)')
+    parser.add_argument('-f', '--format', choices = ['ndjson', 'text'], default = 'text',
+        help = u'output format: text, or a JSON object per line and per formula, written as soon as it is extracted')
     parser.add_argument('-n', '--name', default = None,
         help = u'name of the formula to extract variables from (default: all)')
+    parser.add_argument('--no-validate', action = 'store_false', default = True, dest = 'validate',
+        help = u'skip the validation of the wrappers & nodes created while parsing (like running python -O)')
+    parser.add_argument('--node-arena', action = 'store_true', default = False,
+        help = u'store the parse trees of formulas in NumPy arrays instead of lib2to3 nodes')
+    parser.add_argument('-p', '--parse-cache-dir', default = None,
+        help = u'path of a directory where parse trees are cached between runs (default: no cache)')
+    parser.add_argument('-j', '--jobs', default = 1, type = int,
+        help = u'number of worker processes extracting formulas in parallel (default: 1)')
+    parser.add_argument('-m', '--whole-modules', action = 'store_true', default = False,
+        help = u'parse each module of the country package once, instead of once per formula')
+    parser.add_argument('--profile', const = '-', default = None, metavar = 'REPORT_PATH', nargs = '?',
+        help = u'time the phases of the extraction and write their report as JSON (default: as text to stderr)')
+    parser.add_argument('-r', '--retain-modules', action = 'store_true', default = False,
+        help = u'keep parsed modules & helper functions from one formula to the next')
     parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
     args = parser.parse_args()
-    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.WARNING, stream = sys.stdout)
+    if args.profile is not None and args.jobs > 1:
+        parser.error(u'--profile can only be used with a single job')
+    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.WARNING,
+        stream = sys.stderr if args.format == 'ndjson' else sys.stdout)
 
     country_package = importlib.import_module(args.country_package)
     TaxBenefitSystem = country_package.init_country()
     tax_benefit_system = TaxBenefitSystem()
 
-    extractor = input_variables_extractors.setup(tax_benefit_system)
-
-    if args.name is None:
-        for column in tax_benefit_system.column_by_name.itervalues():
-            print column.name
-            input_variables, parameters = extractor.get_input_variables_and_parameters(column)
-            if input_variables is not None:
-                print u' Input variables:', u', '.join(sorted(input_variables))
-            if parameters:
-                print u' Parameters:', u', '.join(sorted(parameters))
-    else:
-        column = tax_benefit_system.column_by_name[args.name]
-        print column.name
-        input_variables, parameters = extractor.get_input_variables_and_parameters(column)
-        if input_variables is not None:
-            print u' Input variables:', u', '.join(sorted(input_variables))
-        if parameters:
-            print u' Parameters:', u', '.join(sorted(parameters))
+    setup_options = dict(
+        fast = args.fast,
+        frontend = args.frontend,
+        node_arena = node_arenas.NodeArena() if args.node_arena else None,
+        parse_trees_cache = parse_trees_caches.ParseTreesCache(args.parse_cache_dir)
+            if args.parse_cache_dir is not None
+            else None,
+        parse_whole_modules = args.whole_modules,
+        profiler = profilers.Profiler() if args.profile is not None else None,
+        retain_modules = args.retain_modules,
+        validate = args.validate,
+        )
+
+    fast_results = []  # Name of column, whether fast extraction succeeded & why it failed, for the report
+    if args.name is None and args.jobs > 1:
+        # Fork workers once the tax-benefit system is loaded, then merge their results in columns order.
+        columns = tax_benefit_system.column_by_name.values()
+        pool = multiprocessing.Pool(args.jobs, initializer = setup_worker,
+            initargs = (tax_benefit_system, setup_options))
+        try:
+            for column, column_result in zip(columns, pool.imap(extract_column,
+                    [column.name for column in columns], chunksize = 8)):
+                write_column_result(column, *column_result, output_format = args.format)
+                fast_results.append((column.name,) + column_result[-2:])
+        finally:
+            pool.terminate()
+            pool.join()
+        if args.fast:
+            write_fast_report(fast_results, verbose = args.verbose)
+        return 0
+
+    extractor = input_variables_extractors.setup(tax_benefit_system, **setup_options)
+
+    columns = tax_benefit_system.column_by_name.values() if args.name is None \
+        else [tax_benefit_system.column_by_name[args.name]]
+    for column in columns:
+        column_result = extract_column_captured(extractor, column)
+        write_column_result(column, *column_result, output_format = args.format)
+        fast_results.append((column.name,) + column_result[-2:])
+    if args.fast:
+        write_fast_report(fast_results, verbose = args.verbose)
+
+    if extractor.profiler is not None:
+        extractor.profiler.write_report(args.profile)
+    log.info(u'Memoized guesses: {} hits, {} misses'.format(extractor.guess_hit_count, extractor.guess_miss_count))
+    node_arena = extractor.node_arena
+    if node_arena is not None:
+        log.info(u'Node arena: {} trees, {} nodes, {} bytes'.format(len(node_arena.tree_roots), node_arena.node_count,
+            node_arena.nbytes))
 
     return 0
 
@@ -33,7 +33,7 @@ import logging
 import os
 import sys
 
-from openfisca_parsers import source_formulas_extractors
+from openfisca_parsers import profilers, source_formulas_extractors
 
 
 app_name = os.path.splitext(os.path.basename(__file__))[0]
@@ -44,8 +44,14 @@ def main():
     parser = argparse.ArgumentParser(description = __doc__)
     parser.add_argument('-c', '--country-package', default = 'openfisca_france',
         help = u'name of the OpenFisca package to use for country-specific variables & formulas')
-    parser.add_argument('-n', '--name', required = True,
-        help = u'name of the formula to extract source formulas from (default: all)')
+    names_group = parser.add_mutually_exclusive_group(required = True)
+    names_group.add_argument('-f', '--names-file', default = None, type = argparse.FileType('r'),
+        help = u'path of a file containing the names of the formulas to extract source formulas from, one per line '
+            u'("-" for standard input)')
+    names_group.add_argument('-n', '--name', default = None,
+        help = u'name of the formula to extract source formulas from')
+    parser.add_argument('--profile', const = '-', default = None, metavar = 'REPORT_PATH', nargs = '?',
+        help = u'time the phases of the extraction and write their report as JSON (default: as text to stderr)')
     parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
     args = parser.parse_args()
     logging.basicConfig(level = logging.DEBUG if args.verbose else logging.WARNING, stream = sys.stdout)
@@ -54,11 +60,40 @@ def main():
     TaxBenefitSystem = country_package.init_country()
     tax_benefit_system = TaxBenefitSystem()
 
-    source_formulas = source_formulas_extractors.extract_source_formulas(tax_benefit_system, args.name)
-    if source_formulas:
-        print u' Source formulas:', u'\n'.join(
-            '  - {}'.format(name)
-            for name in sorted(source_formulas))
+    if args.names_file is None:
+        names = [args.name]
+    else:
+        names = []
+        for line in args.names_file:
+            name = line.strip().decode('utf-8')
+            if name and not name.startswith(u'#') and name not in names:
+                names.append(name)
+        unknown_names = [
+            name
+            for name in names
+            if name not in tax_benefit_system.column_by_name
+            ]
+        if unknown_names:
+            parser.error(u'Unknown variables: {}'.format(u', '.join(unknown_names)).encode('utf-8'))
+
+    if args.profile is None:
+        dependency_graph = source_formulas_extractors.get_dependency_graph(tax_benefit_system)
+    else:
+        profiler = profilers.Profiler()
+        dependency_graph = source_formulas_extractors.DependencyGraph(tax_benefit_system,
+            extractor = source_formulas_extractors.setup(tax_benefit_system, profiler = profiler))
+    source_formulas_by_name = dependency_graph.get_transitive_source_formulas_by_name(names)
+    if args.profile is not None:
+        profiler.write_report(args.profile)
+
+    for name in names:
+        if args.names_file is not None:
+            print name
+        source_formulas = source_formulas_by_name[name]
+        if source_formulas:
+            print u' Source formulas:', u'\n'.join(
+                '  - {}'.format(source_name)
+                for source_name in sorted(source_formulas))
 
     return 0
 
@@ -0,0 +1,91 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Find the formulas impacted by a change of legislation parameters or of variables."""
+
+
+import argparse
+import importlib
+import logging
+import os
+import sys
+
+from openfisca_parsers import impacts, input_variables_extractors, input_variables_indexes, profilers
+
+
+app_name = os.path.splitext(os.path.basename(__file__))[0]
+log = logging.getLogger(app_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument('-c', '--country-package', default = 'openfisca_france',
+        help = u'name of the OpenFisca package to use for country-specific variables & formulas')
+    parser.add_argument('-i', '--index', default = None,
+        help = u'path of an index file of input variables (see build_input_variables_index), to avoid parsing formulas')
+    parser.add_argument('-n', '--name', action = 'append', default = [],
+        help = u'name of a changed variable (may be repeated)')
+    parser.add_argument('-p', '--parameter', action = 'append', default = [],
+        help = u'dotted path of a changed legislation parameter, scale or node (may be repeated)')
+    parser.add_argument('--profile', const = '-', default = None, metavar = 'REPORT_PATH', nargs = '?',
+        help = u'time the phases of the extraction and write their report as JSON (default: as text to stderr)')
+    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
+    args = parser.parse_args()
+    if not args.name and not args.parameter:
+        parser.error(u'At least one changed variable or parameter is required')
+    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.WARNING, stream = sys.stdout)
+
+    country_package = importlib.import_module(args.country_package)
+    TaxBenefitSystem = country_package.init_country()
+    tax_benefit_system = TaxBenefitSystem()
+
+    for name in args.name:
+        if name not in tax_benefit_system.column_by_name:
+            parser.error(u'Unknown variable: {}'.format(name))
+
+    profiler = profilers.Profiler() if args.profile is not None else None
+    if args.index is None:
+        extractor = input_variables_extractors.setup(tax_benefit_system, profiler = profiler)
+    else:
+        # When the index is up to date, no formula is parsed and the report of the profiler is empty.
+        extractor = input_variables_indexes.setup(tax_benefit_system, args.index, profiler = profiler)
+    impact_index = impacts.ImpactIndex(tax_benefit_system, extractor = extractor)
+    for parameter in args.parameter:
+        if not impact_index.get_parameter_dependents(parameter):
+            log.warning(u'No formula uses parameter {}'.format(parameter))
+    impacted_names = impact_index.get_impacted_formulas(parameters = args.parameter, variables = args.name)
+    if profiler is not None:
+        profiler.write_report(args.profile)
+
+    print u'Impacted formulas:', len(impacted_names)
+    for name in sorted(impacted_names):
+        print u'  - {}'.format(name)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
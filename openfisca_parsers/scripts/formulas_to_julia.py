@@ -31,22 +31,29 @@ import argparse
 import codecs
 import collections
 import datetime
+import filecmp
+import hashlib
 import importlib
 import inspect
 import itertools
+import json
 import lib2to3.pgen2.driver  # , tokenize, token
 import lib2to3.pygram
 import lib2to3.pytree
 import logging
+import multiprocessing
 import os
+import re
+import StringIO
 import sys
 import textwrap
 import traceback
+import types
 
 import numpy as np
 from openfisca_core import formulas
 
-from openfisca_parsers import formulas_parsers_2to3
+from openfisca_parsers import formulas_parsers_2to3, parse_trees_caches, profilers
 
 
 app_name = os.path.splitext(os.path.basename(__file__))[0]
@@ -73,6 +80,8 @@ julia_file_header = textwrap.dedent(u"""\
     # along with this program.  If not, see <http://www.gnu.org/licenses/>.
     """)
 log = logging.getLogger(app_name)
+manifest_filename = 'formulas_to_julia_manifest.json'
+manifest_format_version = 2  # Increment when the manifest or the fingerprints change.
 name_by_role_by_entity_key_singular = dict(
     famille = {
         0: u'CHEF',
@@ -81,12 +90,52 @@ name_by_role_by_entity_key_singular = dict(
         0: u'VOUS',
         },
     )
+unconverted_formulas_name = (
+    # 'age',  # custom Julia implementation
+    # 'age_en_mois',  # custom Julia implementation
+    # 'cmu_c_plafond',  # custom Julia implementation
+    'coefficient_proratisation',
+    # 'nombre_jours_calendaires',  # custom Julia implementation
+    # 'remuneration_apprenti',
+    # 'zone_apl',  # custom Julia implementation
+    )
+worker_parser_options = None  # Options of the parsers of worker processes, when converting with several jobs
+
+
+# Julia Writer
+
+
+class JuliaWriter(object):
+    """Buffer where wrappers write their Julia source, fragment by fragment
+
+    A block writes its statements in the buffer of its parent, instead of formatting them into a string that is then
+    formatted into the source of the parent: Each fragment is copied only once, whatever the depth of the block.
+    """
+    fragments = None
+
+    def __init__(self):
+        self.fragments = []
+
+    def getvalue(self):
+        return u''.join(self.fragments)
+
+    def write(self, text):
+        self.fragments.append(text)
+
+    def write_statements(self, statements, depth = 0):
+        indent = u'  ' * depth
+        for statement in statements:
+            self.write(indent)
+            statement.write_julia(self, depth = depth)
+            self.write(u'\n')
 
 
 # Abstract Wrappers
 
 
 class JuliaCompilerMixin(object):
+    __slots__ = ()
+
     def testize(self, allow_array = False):
         container = self.container
         parser = self.parser
@@ -146,8 +195,24 @@ class JuliaCompilerMixin(object):
                             value = 0,
                             ),
                         )
-        assert False, "{} has a non-boolean value: {}\n{}".format(self.__class__.__name__,
-            unicode(self.node).encode('utf-8'), self.__dict__)
+        raise formulas_parsers_2to3.ParseError("{} has a non-boolean value: {}\n{}".format(self.__class__.__name__,
+            unicode(self.node).encode('utf-8'), dict(
+                (field_name, getattr(self, field_name))
+                for field_name in self.default_by_field_name
+                )))
+
+    def write_julia(self, writer, depth = 0):
+        writer.write(self.source_julia(depth = depth))
+
+
+class JuliaBlockCompilerMixin(JuliaCompilerMixin):
+    """Mixin of the wrappers containing statements, whose source is written in a JuliaWriter"""
+    __slots__ = ()
+
+    def source_julia(self, depth = 0):
+        writer = JuliaWriter()
+        self.write_julia(writer, depth = depth)
+        return writer.getvalue()
 
 
 # Concrete Wrappers
@@ -273,10 +338,19 @@ class Assignment(JuliaCompilerMixin, formulas_parsers_2to3.Assignment):
                         #     variable_name = variable_name[:-len(u'_holder')]
                         method_subject = call_subject.subject
                         if method_subject.guess(parser.Simulation):
-                            assert len(call.positional_arguments) >= 1, call.positional_arguments
-                            assert len(call.named_arguments) <= 1, call.named_arguments
+                            if len(call.positional_arguments) < 1:
+                                raise formulas_parsers_2to3.ParseError(
+                                    "Method {} expects at least 1 positional argument, got {}".format(
+                                        method_name, len(call.positional_arguments)))
+                            if len(call.named_arguments) > 1:
+                                raise formulas_parsers_2to3.ParseError(
+                                    "Method {} expects at most 1 named argument, got {}".format(
+                                        method_name, len(call.named_arguments)))
                             if len(call.named_arguments) == 1:
-                                assert u'accept_other_period' in call.named_arguments
+                                if u'accept_other_period' not in call.named_arguments:
+                                    raise formulas_parsers_2to3.ParseError(
+                                        "Method {} only accepts the named argument accept_other_period, got {}".format(
+                                            method_name, u', '.join(call.named_arguments)))
                             requested_variable = call.positional_arguments[0]
                             if isinstance(requested_variable, parser.String):
                                 if requested_variable.value == variable_name:
@@ -327,8 +401,14 @@ class Assignment(JuliaCompilerMixin, formulas_parsers_2to3.Assignment):
                     elif method_name == 'get_array':
                         method_subject = call_subject.subject
                         if method_subject.guess(parser.Simulation):
-                            assert len(call.positional_arguments) >= 1, call.positional_arguments
-                            assert len(call.named_arguments) == 0, call.named_arguments
+                            if len(call.positional_arguments) < 1:
+                                raise formulas_parsers_2to3.ParseError(
+                                    "Method {} expects at least 1 positional argument, got {}".format(
+                                        method_name, len(call.positional_arguments)))
+                            if len(call.named_arguments) != 0:
+                                raise formulas_parsers_2to3.ParseError(
+                                    "Method {} expects no named argument, got {}".format(
+                                        method_name, len(call.named_arguments)))
                             requested_variable = call.positional_arguments[0]
                             if isinstance(requested_variable, parser.String):
                                 if requested_variable.value == variable.name:
@@ -423,7 +503,9 @@ class Attribute(JuliaCompilerMixin, formulas_parsers_2to3.Attribute):
                     if key == u'taux':
                         node_value = parent_node.value['children']['taux_plein']
                     else:
-                        assert key in (u'taux_plein', u'taux_reduit'), key
+                        if key not in (u'taux_plein', u'taux_reduit'):
+                            raise formulas_parsers_2to3.ParseError("Unexpected key {} in legislation node {}".format(
+                                key, parent_node.name))
                         node_value = parent_node.value['children']['taux']
                 node_type = node_value['@type']
                 if node_type == u'Node':
@@ -444,7 +526,9 @@ class Attribute(JuliaCompilerMixin, formulas_parsers_2to3.Attribute):
                             parser = parser,
                             )
                 else:
-                    assert node_type == u'Scale'
+                    if node_type != u'Scale':
+                        raise formulas_parsers_2to3.ParseError("Unexpected type {} of legislation node {}".format(
+                            node_type, key))
                     hint = parser.TaxScale(
                         parser = parser,
                         )
@@ -560,150 +644,93 @@ class Boolean(JuliaCompilerMixin, formulas_parsers_2to3.Boolean):
 
 
 class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
-    def guess(self, expected):
-        guessed = super(Call, self).guess(expected)
-        if guessed is not None:
-            return guessed
+    guess_rule_name_by_expected_name = dict(formulas_parsers_2to3.Call.guess_rule_name_by_expected_name,
+        UniformIterator = 'guess_uniform_iterator_from_dictionary',
+        )
+    guess_rule_name_by_expected_name_and_function_name = \
+        formulas_parsers_2to3.Call.guess_rule_name_by_expected_name_and_function_name.copy()
+    guess_rule_name_by_expected_name_and_function_name.update({
+        ('Array', 'any_person_in_entity'): 'guess_entity_array_from_person_function',
+        ('Array', 'entity_to_person'): 'guess_persons_array_from_entity_function',
+        ('Array', 'max'): 'guess_number_array_from_arguments',
+        ('Array', 'min'): 'guess_number_array_from_arguments',
+        ('Array', 'single_person_in_entity'): 'guess_entity_array_from_person_function',
+        ('Array', 'sum_person_in_entity'): 'guess_entity_array_from_person_function',
+        ('Array', 'zeros'): 'guess_array_from_zeros',
+        ('Boolean', 'all'): 'guess_boolean',
+        ('Boolean', 'any'): 'guess_boolean',
+        ('Boolean', 'isempty'): 'guess_boolean',
+        ('Number', 'length'): 'guess_number',
+        ('UniformDictionary', 'split_person_by_role'): 'guess_uniform_dictionary_from_split_person_by_role',
+        ('UniformIterator', 'keys'): 'guess_uniform_iterator_from_keys_or_values',
+        ('UniformIterator', 'values'): 'guess_uniform_iterator_from_keys_or_values',
+        })
+
+    def guess_array_from_zeros(self, expected, function):
+        parser = self.parser
+        if len(self.positional_arguments) > 2:
+            raise formulas_parsers_2to3.ParseError("Function {} expects at most 2 positional arguments, got {}".format(
+                function.name, len(self.positional_arguments)))
+        if len(self.named_arguments) > 1:
+            raise formulas_parsers_2to3.ParseError("Function {} expects at most 1 named argument, got {}".format(
+                function.name, len(self.named_arguments)))
+        dtype_wrapper = self.named_arguments.get('dtype')
+        if dtype_wrapper is None:
+            cell_type = None
+        else:
+            dtype_wrapper = dtype_wrapper.guess(parser.String) or dtype_wrapper.guess(parser.Type)
+            cell_type = dtype_wrapper.value
+        cell_wrapper = parser.get_cell_wrapper(container = self.container, type = cell_type)
+        return parser.Array(
+            cell = cell_wrapper,
+            parser = parser,
+            )
 
+    def guess_entity_array_from_person_function(self, expected, function):
         parser = self.parser
-        if issubclass(parser.Array, expected):
-            function = self.subject.guess(parser.Variable)
-            if function is not None:
-                if function.name in (u'any_person_in_entity', u'sum_person_in_entity'):
-                    variable = self.positional_arguments[0].guess(parser.Variable)
-                    if variable is None:
-                        cell_wrapper = None
-                    else:
-                        variable_name = variable.name
-                        if variable_name.endswith(u'_holder'):
-                            variable_name = variable_name[:-len(u'_holder')]
-                        tax_benefit_system = parser.tax_benefit_system
-                        column = tax_benefit_system.column_by_name[variable_name]
-                        cell_wrapper = parser.get_cell_wrapper(container = self.container, type = column.dtype)
-                    return parser.Array(
-                        cell = cell_wrapper,
-                        entity_class = parser.entity_class,
-                        parser = parser,
-                        )
-                elif function.name == u'entity_to_person':
-                    variable = self.positional_arguments[0].guess(parser.Variable)
-                    if variable is None:
-                        cell_wrapper = None
-                    else:
-                        variable_name = variable.name
-                        if variable_name.endswith(u'_holder'):
-                            variable_name = variable_name[:-len(u'_holder')]
-                        tax_benefit_system = parser.tax_benefit_system
-                        column = tax_benefit_system.column_by_name[variable_name]
-                        cell_wrapper = parser.get_cell_wrapper(container = self.container, type = column.dtype)
-                    return parser.Array(
-                        cell = cell_wrapper,
-                        entity_class = parser.person_class,
-                        parser = parser,
-                        )
-                elif function.name in (u'max', u'min'):
-                    for argument in self.positional_arguments:
-                        array = argument.guess(parser.Array)
-                        if array is not None:
-                            return parser.Array(
-                                cell = parser.Number(
-                                    parser = parser,
-                                    ),
-                                entity_class = array.entity_class,
-                                parser = parser,
-                                )
-                elif function.name == u'single_person_in_entity':
-                    variable = self.positional_arguments[0].guess(parser.Variable)
-                    if variable is None:
-                        cell_wrapper = None
-                    else:
-                        variable_name = variable.name
-                        if variable_name.endswith(u'_holder'):
-                            variable_name = variable_name[:-len(u'_holder')]
-                        tax_benefit_system = parser.tax_benefit_system
-                        column = tax_benefit_system.column_by_name[variable_name]
-                        cell_wrapper = parser.get_cell_wrapper(container = self.container, type = column.dtype)
-                    return parser.Array(
-                        cell = cell_wrapper,
-                        entity_class = parser.entity_class,
-                        parser = parser,
-                        )
-                elif function.name == u'zeros':
-                    assert len(self.positional_arguments) <= 2, self.positional_arguments
-                    assert len(self.named_arguments) <= 1, self.named_arguments
-                    dtype_wrapper = self.named_arguments.get('dtype')
-                    if dtype_wrapper is None:
-                        cell_type = None
-                    else:
-                        dtype_wrapper = dtype_wrapper.guess(parser.String) or dtype_wrapper.guess(parser.Type)
-                        cell_type = dtype_wrapper.value
-                    cell_wrapper = parser.get_cell_wrapper(container = self.container, type = cell_type)
-                    return parser.Array(
-                        cell = cell_wrapper,
-                        parser = parser,
-                        )
-        elif issubclass(parser.Boolean, expected):
-            function = self.subject.guess(parser.Variable)
-            if function is not None:
-                if function.name in (u'all', u'any', u'isempty'):
-                    return parser.Boolean(
-                        parser = parser,
-                        )
-        elif issubclass(parser.Number, expected):
-            function = self.subject.guess(parser.Variable)
-            if function is not None:
-                if function.name == 'length':
-                    return parser.Number(parser = parser)
-        elif issubclass(parser.UniformDictionary, expected):
-            function = self.subject.guess(parser.Variable)
-            if function is not None:
-                if function.name == u'split_person_by_role':
-                    variable = self.positional_arguments[0].guess(parser.Variable)
-                    if variable is None:
-                        cell_wrapper = None
-                    else:
-                        variable_name = variable.name
-                        if variable_name.endswith(u'_holder'):
-                            variable_name = variable_name[:-len(u'_holder')]
-                        tax_benefit_system = parser.tax_benefit_system
-                        column = tax_benefit_system.column_by_name[variable_name]
-                        cell_wrapper = parser.get_cell_wrapper(container = self.container, type = column.dtype)
-                    return parser.UniformDictionary(
-                        julia = True,
-                        key = parser.Role(
-                            parser = parser,
-                            ),
-                        parser = parser,
-                        value = parser.Array(
-                            cell = cell_wrapper,
-                            entity_class = parser.entity_class,
-                            parser = parser,
-                            ),
-                        )
-        elif issubclass(parser.UniformIterator, expected):
-            function = self.subject.guess(parser.Variable)
-            if function is not None:
-                if function.name == u'keys':
-                    uniform_dictionary = self.positional_arguments[0].guess(parser.UniformDictionary)
-                    if uniform_dictionary is not None:
-                        return parser.UniformIterator(
-                            items = [uniform_dictionary.key],
-                            parser = parser,
-                            )
-                elif function.name == 'values':
-                    uniform_dictionary = self.positional_arguments[0].guess(parser.UniformDictionary)
-                    if uniform_dictionary is not None:
-                        return parser.UniformIterator(
-                            items = [uniform_dictionary.value],
-                            parser = parser,
-                            )
+        return parser.Array(
+            cell = self.get_variable_cell_wrapper(self.positional_arguments[0]),
+            entity_class = parser.entity_class,
+            parser = parser,
+            )
+
+    def guess_persons_array_from_entity_function(self, expected, function):
+        parser = self.parser
+        return parser.Array(
+            cell = self.get_variable_cell_wrapper(self.positional_arguments[0]),
+            entity_class = parser.person_class,
+            parser = parser,
+            )
 
-            uniform_dictionary = self.guess(parser.UniformDictionary)
-            if uniform_dictionary is not None:
-                uniform_iterator = uniform_dictionary.guess(parser.UniformIterator)
-                if uniform_iterator is not None:
-                    return uniform_iterator
+    def guess_uniform_dictionary_from_split_person_by_role(self, expected, function):
+        parser = self.parser
+        return parser.UniformDictionary(
+            julia = True,
+            key = parser.Role(
+                parser = parser,
+                ),
+            parser = parser,
+            value = parser.Array(
+                cell = self.get_variable_cell_wrapper(self.positional_arguments[0]),
+                entity_class = parser.entity_class,
+                parser = parser,
+                ),
+            )
+
+    def guess_uniform_iterator_from_dictionary(self, expected, callee):
+        uniform_dictionary = self.guess(self.parser.UniformDictionary)
+        if uniform_dictionary is not None:
+            return uniform_dictionary.guess(self.parser.UniformIterator)
+        return None
 
+    def guess_uniform_iterator_from_keys_or_values(self, expected, function):
+        parser = self.parser
+        uniform_dictionary = self.positional_arguments[0].guess(parser.UniformDictionary)
+        if uniform_dictionary is not None:
+            return parser.UniformIterator(
+                items = [uniform_dictionary.key if function.name == u'keys' else uniform_dictionary.value],
+                parser = parser,
+                )
         return None
 
     def juliaize(self):
@@ -741,8 +768,12 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
             elif method_name == 'any_by_roles':
                 method_subject = subject.subject
                 if isinstance(method_subject, parser.Variable) and method_subject.name == 'self':
-                    assert len(positional_arguments) == 1, positional_arguments
-                    assert len(named_arguments) == 0, named_arguments
+                    if len(positional_arguments) != 1:
+                        raise formulas_parsers_2to3.ParseError("Method {} expects 1 positional argument, got {}".format(
+                            method_name, len(positional_arguments)))
+                    if len(named_arguments) != 0:
+                        raise formulas_parsers_2to3.ParseError("Method {} expects no named argument, got {}".format(
+                            method_name, len(named_arguments)))
                     requested_variable = positional_arguments[0]
                     # any_person_in_entity(x, get_entity(variable), period)
                     return parser.Call(
@@ -768,7 +799,9 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
                             ),
                         )
             elif method_name == 'astype':
-                assert len(positional_arguments) == 1, positional_arguments
+                if len(positional_arguments) != 1:
+                    raise formulas_parsers_2to3.ParseError("Method {} expects 1 positional argument, got {}".format(
+                        method_name, len(positional_arguments)))
                 argument_string = positional_arguments[0].guess(parser.String)
                 if argument_string is not None:
                     if argument_string.value == u'timedelta64[M]':
@@ -871,10 +904,18 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
             elif method_name in ('cast_from_entity_to_role', 'cast_from_entity_to_roles'):
                 method_subject = subject.subject
                 if isinstance(method_subject, parser.Variable) and method_subject.name == 'self':
-                    assert len(positional_arguments) == 1, positional_arguments
-                    assert len(named_arguments) <= 1, named_arguments
+                    if len(positional_arguments) != 1:
+                        raise formulas_parsers_2to3.ParseError("Method {} expects 1 positional argument, got {}".format(
+                            method_name, len(positional_arguments)))
+                    if len(named_arguments) > 1:
+                        raise formulas_parsers_2to3.ParseError(
+                            "Method {} expects at most 1 named argument, got {}".format(
+                                method_name, len(named_arguments)))
                     if len(named_arguments) == 1:
-                        assert 'role' in named_arguments or 'roles' in named_arguments
+                        if 'role' not in named_arguments and 'roles' not in named_arguments:
+                            raise formulas_parsers_2to3.ParseError(
+                                "Method {} only accepts the named argument role or roles, got {}".format(
+                                    method_name, u', '.join(named_arguments)))
                         roles_arguments = [
                             (named_arguments.get('role') or named_arguments.get('roles')),
                             ]
@@ -902,9 +943,16 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
             elif method_name == 'filter_role':
                 method_subject = subject.subject
                 if isinstance(method_subject, parser.Variable) and method_subject.name == 'self':
-                    assert len(positional_arguments) == 1, positional_arguments
-                    assert len(named_arguments) == 1, named_arguments
-                    assert 'role' in named_arguments
+                    if len(positional_arguments) != 1:
+                        raise formulas_parsers_2to3.ParseError("Method {} expects 1 positional argument, got {}".format(
+                            method_name, len(positional_arguments)))
+                    if len(named_arguments) != 1:
+                        raise formulas_parsers_2to3.ParseError("Method {} expects 1 named argument, got {}".format(
+                            method_name, len(named_arguments)))
+                    if 'role' not in named_arguments:
+                        raise formulas_parsers_2to3.ParseError(
+                            "Method {} expects the named argument role, got {}".format(
+                                method_name, u', '.join(named_arguments)))
                     requested_variable = positional_arguments[0]
                     # single_person_in_entity(x, get_entity(variable), period, role)
                     return parser.Call(
@@ -933,7 +981,9 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
             elif method_name == 'floor':
                 method_subject = subject.subject
                 if isinstance(method_subject, parser.Variable) and method_subject.name == 'math':
-                    assert len(named_arguments) == 0, named_arguments
+                    if len(named_arguments) != 0:
+                        raise formulas_parsers_2to3.ParseError("Method {} expects no named argument, got {}".format(
+                            method_name, len(named_arguments)))
                     return parser.Call(
                         container = container,
                         parser = parser,
@@ -945,8 +995,13 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
                         )
             elif method_name == 'get':
                 method_subject = subject.subject
-                assert len(named_arguments) == 0, named_arguments
-                assert 1 <= len(positional_arguments) <= 2, positional_arguments
+                if len(named_arguments) != 0:
+                    raise formulas_parsers_2to3.ParseError("Method {} expects no named argument, got {}".format(
+                        method_name, len(named_arguments)))
+                if not 1 <= len(positional_arguments) <= None:
+                    raise formulas_parsers_2to3.ParseError(
+                        "Method {} expects 1 to None positional arguments, got {}".format(
+                            method_name, len(positional_arguments)))
                 return parser.Call(
                     container = container,
                     parser = parser,
@@ -963,8 +1018,12 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
                     )
             elif method_name == 'iterkeys':
                 method_subject = subject.subject
-                assert len(named_arguments) == 0, named_arguments
-                assert len(positional_arguments) == 0, positional_arguments
+                if len(named_arguments) != 0:
+                    raise formulas_parsers_2to3.ParseError("Method {} expects no named argument, got {}".format(
+                        method_name, len(named_arguments)))
+                if len(positional_arguments) != 0:
+                    raise formulas_parsers_2to3.ParseError("Method {} expects no positional argument, got {}".format(
+                        method_name, len(positional_arguments)))
                 return parser.Call(
                     container = container,
                     parser = parser,
@@ -976,13 +1035,21 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
                     )
             elif method_name == 'iteritems':
                 method_subject = subject.subject
-                assert len(named_arguments) == 0, named_arguments
-                assert len(positional_arguments) == 0, positional_arguments
+                if len(named_arguments) != 0:
+                    raise formulas_parsers_2to3.ParseError("Method {} expects no named argument, got {}".format(
+                        method_name, len(named_arguments)))
+                if len(positional_arguments) != 0:
+                    raise formulas_parsers_2to3.ParseError("Method {} expects no positional argument, got {}".format(
+                        method_name, len(positional_arguments)))
                 return method_subject
             elif method_name == 'itervalues':
                 method_subject = subject.subject
-                assert len(named_arguments) == 0, named_arguments
-                assert len(positional_arguments) == 0, positional_arguments
+                if len(named_arguments) != 0:
+                    raise formulas_parsers_2to3.ParseError("Method {} expects no named argument, got {}".format(
+                        method_name, len(named_arguments)))
+                if len(positional_arguments) != 0:
+                    raise formulas_parsers_2to3.ParseError("Method {} expects no positional argument, got {}".format(
+                        method_name, len(positional_arguments)))
                 return parser.Call(
                     container = container,
                     parser = parser,
@@ -995,10 +1062,15 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
             elif method_name == 'legislation_at':
                 method_subject = subject.subject
                 if method_subject.guess(parser.Simulation):
-                    assert len(positional_arguments) == 1, positional_arguments
+                    if len(positional_arguments) != 1:
+                        raise formulas_parsers_2to3.ParseError("Method {} expects 1 positional argument, got {}".format(
+                            method_name, len(positional_arguments)))
                     instant = positional_arguments[0].guess(parser.Instant)
                     if instant is not None:
-                        assert len(named_arguments) <= 1, named_arguments
+                        if len(named_arguments) > 1:
+                            raise formulas_parsers_2to3.ParseError(
+                                "Method {} expects at most 1 named argument, got {}".format(
+                                    method_name, len(named_arguments)))
                         reference = named_arguments.get('reference')
                         return parser.Call(
                             container = container,
@@ -1018,12 +1090,18 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
             elif method_name == 'offset':
                 method_subject = subject.subject
                 if method_subject.guess(parser.Instant):
-                    assert len(positional_arguments) == 2, positional_arguments
+                    if len(positional_arguments) != 2:
+                        raise formulas_parsers_2to3.ParseError(
+                            "Method {} expects 2 positional arguments, got {}".format(
+                                method_name, len(positional_arguments)))
                     delta, unit = positional_arguments
                     if isinstance(delta, (parser.Factor, parser.Number)) and isinstance(unit, parser.String) \
                             and unit.value is not None:
                         if isinstance(delta, parser.Factor):
-                            assert delta.operator == u'-'
+                            if delta.operator != u'-':
+                                raise formulas_parsers_2to3.ParseError(
+                                    "Unexpected operator {} in delta of method offset".format(
+                                        delta.operator))
                             delta = -int(delta.operand.value)
                         else:
                             delta = int(delta.value)
@@ -1083,11 +1161,16 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
                                 )
                 elif method_subject.guess(parser.Period):
                     unit = method_subject.guess(parser.Period).unit
-                    assert len(positional_arguments) == 1, positional_arguments
+                    if len(positional_arguments) != 1:
+                        raise formulas_parsers_2to3.ParseError("Method {} expects 1 positional argument, got {}".format(
+                            method_name, len(positional_arguments)))
                     delta = positional_arguments[0]
                     if isinstance(delta, (parser.Factor, parser.Number)):
                         if isinstance(delta, parser.Factor):
-                            assert delta.operator == u'-'
+                            if delta.operator != u'-':
+                                raise formulas_parsers_2to3.ParseError(
+                                    "Unexpected operator {} in delta of method offset".format(
+                                        delta.operator))
                             delta = -int(delta.operand.value)
                         else:
                             delta = int(delta.value)
@@ -1132,7 +1215,10 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
             elif method_name == 'period':
                 method_subject = subject.subject
                 if method_subject.guess(parser.Instant):
-                    assert len(positional_arguments) >= 1, positional_arguments
+                    if len(positional_arguments) < 1:
+                        raise formulas_parsers_2to3.ParseError(
+                            "Method {} expects at least 1 positional argument, got {}".format(
+                                method_name, len(positional_arguments)))
                     unit = positional_arguments[0]
                     if isinstance(unit, parser.String) and unit.value == 'month':
                         return parser.Call(
@@ -1159,11 +1245,19 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
             elif method_name == 'split_by_roles':
                 method_subject = subject.subject
                 if isinstance(method_subject, parser.Variable) and method_subject.name == 'self':
-                    assert len(positional_arguments) == 1, positional_arguments
+                    if len(positional_arguments) != 1:
+                        raise formulas_parsers_2to3.ParseError("Method {} expects 1 positional argument, got {}".format(
+                            method_name, len(positional_arguments)))
                     requested_variable = positional_arguments[0]
-                    assert len(named_arguments) <= 1, named_arguments
+                    if len(named_arguments) > 1:
+                        raise formulas_parsers_2to3.ParseError(
+                            "Method {} expects at most 1 named argument, got {}".format(
+                                method_name, len(named_arguments)))
                     if len(named_arguments) == 1:
-                        assert 'roles' in named_arguments
+                        if 'roles' not in named_arguments:
+                            raise formulas_parsers_2to3.ParseError(
+                                "Method {} only accepts the named argument roles, got {}".format(
+                                    method_name, u', '.join(named_arguments)))
                         roles_arguments = [named_arguments['roles']]
                     else:
                         roles_arguments = []
@@ -1193,11 +1287,19 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
             elif method_name == 'sum_by_entity':
                 method_subject = subject.subject
                 if isinstance(method_subject, parser.Variable) and method_subject.name == 'self':
-                    assert len(positional_arguments) == 1, positional_arguments
-                    assert len(named_arguments) <= 1, named_arguments
+                    if len(positional_arguments) != 1:
+                        raise formulas_parsers_2to3.ParseError("Method {} expects 1 positional argument, got {}".format(
+                            method_name, len(positional_arguments)))
+                    if len(named_arguments) > 1:
+                        raise formulas_parsers_2to3.ParseError(
+                            "Method {} expects at most 1 named argument, got {}".format(
+                                method_name, len(named_arguments)))
                     if len(named_arguments) == 1:
                         roles = named_arguments.get('roles')
-                        assert roles is not None, named_arguments
+                        if roles is None:
+                            raise formulas_parsers_2to3.ParseError(
+                                "Method {} only accepts the named argument roles, got {}".format(
+                                    method_name, u', '.join(named_arguments)))
                     else:
                         roles = None
                     requested_variable = positional_arguments[0]
@@ -1227,7 +1329,9 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
         elif isinstance(subject, parser.Variable):
             function_name = subject.name
             if function_name == 'and_':
-                assert len(positional_arguments) == 2, positional_arguments
+                if len(positional_arguments) != 2:
+                    raise formulas_parsers_2to3.ParseError("Function {} expects 2 positional arguments, got {}".format(
+                        function_name, len(positional_arguments)))
                 left, right = positional_arguments
                 return parser.ParentheticalExpression(
                     container = container,
@@ -1251,7 +1355,9 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
                         ),
                     )
             elif function_name == 'around':
-                assert len(positional_arguments) == 1, positional_arguments
+                if len(positional_arguments) != 1:
+                    raise formulas_parsers_2to3.ParseError("Function {} expects 1 positional argument, got {}".format(
+                        function_name, len(positional_arguments)))
                 return parser.Call(
                     container = container,
                     hint = positional_arguments[0].hint,
@@ -1263,7 +1369,9 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
                         ),
                     )
             elif function_name == 'date':
-                assert len(positional_arguments) == 3, positional_arguments
+                if len(positional_arguments) != 3:
+                    raise formulas_parsers_2to3.ParseError("Function {} expects 3 positional arguments, got {}".format(
+                        function_name, len(positional_arguments)))
                 return parser.Call(
                     container = container,
                     hint = parser.Date(parser = parser),
@@ -1275,12 +1383,19 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
                         ),
                     )
             elif function_name == 'datetime64':
-                assert len(positional_arguments) == 1, positional_arguments
+                if len(positional_arguments) != 1:
+                    raise formulas_parsers_2to3.ParseError("Function {} expects 1 positional argument, got {}".format(
+                        function_name, len(positional_arguments)))
                 argument = positional_arguments[0]
-                assert argument.guess(parser.Date) is not None or argument.guess(parser.Instant) is not None, argument
+                if argument.guess(parser.Date) is None and argument.guess(parser.Instant) is None:
+                    raise formulas_parsers_2to3.ParseError(
+                        "Function datetime64 expects a date or an instant, got {}".format(
+                            argument.__class__.__name__))
                 return argument
             elif function_name == 'len':
-                assert len(positional_arguments) == 1, positional_arguments
+                if len(positional_arguments) != 1:
+                    raise formulas_parsers_2to3.ParseError("Function {} expects 1 positional argument, got {}".format(
+                        function_name, len(positional_arguments)))
                 return parser.Call(
                     container = container,
                     hint = self.hint,
@@ -1314,7 +1429,9 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
                         ),
                     )
             elif function_name == 'not_':
-                assert len(positional_arguments) == 1, positional_arguments
+                if len(positional_arguments) != 1:
+                    raise formulas_parsers_2to3.ParseError("Function {} expects 1 positional argument, got {}".format(
+                        function_name, len(positional_arguments)))
                 value = positional_arguments[0]
                 return parser.NotTest(
                     container = container,
@@ -1326,7 +1443,9 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
                     parser = parser,
                     )
             elif function_name == 'or_':
-                assert len(positional_arguments) == 2, positional_arguments
+                if len(positional_arguments) != 2:
+                    raise formulas_parsers_2to3.ParseError("Function {} expects 2 positional arguments, got {}".format(
+                        function_name, len(positional_arguments)))
                 left, right = positional_arguments
                 return parser.ParentheticalExpression(
                     container = container,
@@ -1350,7 +1469,10 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
                         ),
                     )
             elif function_name == 'round_':
-                assert 1 <= len(positional_arguments) <= 2, positional_arguments
+                if not 1 <= len(positional_arguments) <= None:
+                    raise formulas_parsers_2to3.ParseError(
+                        "Function {} expects 1 to None positional arguments, got {}".format(
+                            function_name, len(positional_arguments)))
                 return parser.Call(
                     container = container,
                     hint = positional_arguments[0].hint,
@@ -1362,8 +1484,12 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
                         ),
                     )
             elif function_name == 'startswith':
-                assert len(positional_arguments) == 2, positional_arguments
-                assert len(named_arguments) == 0, named_arguments
+                if len(positional_arguments) != 2:
+                    raise formulas_parsers_2to3.ParseError("Function {} expects 2 positional arguments, got {}".format(
+                        function_name, len(positional_arguments)))
+                if len(named_arguments) != 0:
+                    raise formulas_parsers_2to3.ParseError("Function {} expects no named argument, got {}".format(
+                        function_name, len(named_arguments)))
                 return parser.Call(
                     container = container,
                     hint = self.hint,
@@ -1375,7 +1501,9 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
                         ),
                     )
             elif function_name == 'xor_':
-                assert len(positional_arguments) == 2, positional_arguments
+                if len(positional_arguments) != 2:
+                    raise formulas_parsers_2to3.ParseError("Function {} expects 2 positional arguments, got {}".format(
+                        function_name, len(positional_arguments)))
                 left, right = positional_arguments
                 return parser.ParentheticalExpression(
                     container = container,
@@ -1399,9 +1527,14 @@ class Call(JuliaCompilerMixin, formulas_parsers_2to3.Call):
                         ),
                     )
             elif function_name == u'zeros':
-                assert len(positional_arguments) == 1, positional_arguments
+                if len(positional_arguments) != 1:
+                    raise formulas_parsers_2to3.ParseError("Function {} expects 1 positional argument, got {}".format(
+                        function_name, len(positional_arguments)))
                 length = positional_arguments[0].juliaize()
-                assert len(named_arguments) <= 1, named_arguments
+                if len(named_arguments) > 1:
+                    raise formulas_parsers_2to3.ParseError(
+                        "Function {} expects at most 1 named argument, got {}".format(
+                            function_name, len(named_arguments)))
                 dtype_wrapper = named_arguments.get('dtype')
                 if dtype_wrapper is None:
                     cell_type = None
@@ -1545,7 +1678,7 @@ class Factor(JuliaCompilerMixin, formulas_parsers_2to3.Factor):
         return u'{}{}'.format(self.operator, self.operand.source_julia(depth = depth))
 
 
-class For(JuliaCompilerMixin, formulas_parsers_2to3.For):
+class For(JuliaBlockCompilerMixin, formulas_parsers_2to3.For):
     def juliaize(self):
         parser = self.parser
 
@@ -1565,17 +1698,14 @@ class For(JuliaCompilerMixin, formulas_parsers_2to3.For):
             variable_by_name = self.variable_by_name,
             )
 
-    def source_julia(self, depth = 0):
+    def write_julia(self, writer, depth = 0):
         variables_name = list(self.variable_by_name.iterkeys())
-        return u'for {variables} in {iterator}\n{body}{indent}end'.format(
-            body = u''.join(
-                u'{}{}\n'.format(u'  ' * (depth + 1), statement.source_julia(depth = depth + 1))
-                for statement in self.body
-                ),
-            indent = u'  ' * depth,
+        writer.write(u'for {variables} in {iterator}\n'.format(
             iterator = self.iterator.source_julia(depth = depth + 1),
             variables = u'({})'.format(u', '.join(variables_name)) if len(variables_name) > 1 else variables_name[0],
-            )
+            ))
+        writer.write_statements(self.body, depth = depth + 1)
+        writer.write(u'{}end'.format(u'  ' * depth))
 
 
 class Formula(JuliaCompilerMixin, formulas_parsers_2to3.Formula):
@@ -1584,8 +1714,18 @@ class Formula(JuliaCompilerMixin, formulas_parsers_2to3.Formula):
         return self
 
 
-class Function(JuliaCompilerMixin, formulas_parsers_2to3.Function):
+class Function(JuliaBlockCompilerMixin, formulas_parsers_2to3.Function):
     def juliaize(self):
+        profiler = self.parser.profiler
+        if profiler is None:
+            return self.juliaize_unprofiled()
+        profiler.start('juliaize', column = self.parser.column)
+        try:
+            return self.juliaize_unprofiled()
+        finally:
+            profiler.stop()
+
+    def juliaize_unprofiled(self):
         parser = self.parser
 
         for variable in self.variable_by_name.itervalues():
@@ -1615,7 +1755,12 @@ class Function(JuliaCompilerMixin, formulas_parsers_2to3.Function):
             variable_by_name = self.variable_by_name,
             )
 
-    def source_julia(self, depth = 0):
+    def source_julia_statements(self, depth = 0):
+        writer = JuliaWriter()
+        self.write_julia_statements(writer, depth = depth)
+        return writer.getvalue()
+
+    def write_julia(self, writer, depth = 0):
         positional_parameters = []
         if self.positional_parameters:
             positional_parameters.extend(self.positional_parameters)
@@ -1629,17 +1774,18 @@ class Function(JuliaCompilerMixin, formulas_parsers_2to3.Function):
                 )
         if self.keyword_name:
             named_parameters.append(u'{}...'.format(self.keyword_name))
-        return u'\n{indent}function {name}({positional_parameters}{named_parameters})\n{body}{indent}end\n'.format(
-            body = self.source_julia_statements(depth = depth + 1),
-            indent = u'  ' * depth,
+        indent = u'  ' * depth
+        writer.write(u'\n{indent}function {name}({positional_parameters}{named_parameters})\n'.format(
+            indent = indent,
             name = self.name,
             named_parameters = u'; {}'.format(u', '.join(named_parameters)) if named_parameters else u'',
             positional_parameters = u', '.join(positional_parameters),
-            )
+            ))
+        self.write_julia_statements(writer, depth = depth + 1)
+        writer.write(u'{}end\n'.format(indent))
 
-    def source_julia_statements(self, depth = 0):
+    def write_julia_statements(self, writer, depth = 0):
         parser = self.parser
-        statements = []
         for statement in self.body:
             if isinstance(statement, parser.String):
                 # Strip and reindent docstring.
@@ -1661,8 +1807,7 @@ class Function(JuliaCompilerMixin, formulas_parsers_2to3.Function):
                     if u'\n' in value:
                         value += u'\n{}'.format(u'  ' * depth)
                 statement.value = value
-            statements.append(u'{}{}\n'.format(u'  ' * depth, statement.source_julia(depth = depth)))
-        return u''.join(statements)
+        writer.write_statements(self.body, depth = depth)
 
 
 class FunctionFileInput(JuliaCompilerMixin, formulas_parsers_2to3.FunctionFileInput):
@@ -1673,7 +1818,7 @@ class FunctionFileInput(JuliaCompilerMixin, formulas_parsers_2to3.FunctionFileIn
         return function_wrapper
 
 
-class If(JuliaCompilerMixin, formulas_parsers_2to3.If):
+class If(JuliaBlockCompilerMixin, formulas_parsers_2to3.If):
     def juliaize(self):
         return self.__class__(
             container = self.container,
@@ -1691,18 +1836,14 @@ class If(JuliaCompilerMixin, formulas_parsers_2to3.If):
             parser = self.parser,
             )
 
-    def source_julia(self, depth = 0):
-        return u''.join(
-            u'{word}{test}\n{body}'.format(
-                body = u''.join(
-                    u'{}{}\n'.format(u'  ' * (depth + 1), statement.source_julia(depth = depth + 1))
-                    for statement in body
-                    ),
+    def write_julia(self, writer, depth = 0):
+        for index, (test, body) in enumerate(self.items):
+            writer.write(u'{word}{test}\n'.format(
                 test = u' {}'.format(test.source_julia(depth = depth + 2)) if test is not None else u'',
                 word = (u'{}else' if test is None else u'if' if index == 0 else u'{}elseif').format(u'  ' * depth),
-                )
-            for index, (test, body) in enumerate(self.items)
-            ) + u'{}end'.format(u'  ' * depth)
+                ))
+            writer.write_statements(body, depth = depth + 1)
+        writer.write(u'{}end'.format(u'  ' * depth))
 
 
 class Instant(JuliaCompilerMixin, formulas_parsers_2to3.Instant):
@@ -1732,7 +1873,9 @@ class Key(JuliaCompilerMixin, formulas_parsers_2to3.Key):
                     if key == u'taux':
                         node_value = parent_node.value['children']['taux_plein']
                     else:
-                        assert key in (u'taux_plein', u'taux_reduit'), key
+                        if key not in (u'taux_plein', u'taux_reduit'):
+                            raise formulas_parsers_2to3.ParseError("Unexpected key {} in legislation node {}".format(
+                                key, parent_node.name))
                         node_value = parent_node.value['children']['taux']
                 node_type = node_value['@type']
                 if node_type == u'Node':
@@ -1753,7 +1896,9 @@ class Key(JuliaCompilerMixin, formulas_parsers_2to3.Key):
                             parser = parser,
                             )
                 else:
-                    assert node_type == u'Scale'
+                    if node_type != u'Scale':
+                        raise formulas_parsers_2to3.ParseError("Unexpected type {} of legislation node {}".format(
+                            node_type, key))
                     hint = parser.TaxScale(
                         parser = parser,
                         )
@@ -2010,6 +2155,7 @@ class Tuple(JuliaCompilerMixin, formulas_parsers_2to3.Tuple):
 
 
 class UniformDictionary(JuliaCompilerMixin, formulas_parsers_2to3.UniformDictionary):
+    fields = ('julia',)
     julia = False
 
     def __init__(self, container = None, julia = False, key = None, node = None, parser = None, value = None):
@@ -2019,7 +2165,7 @@ class UniformDictionary(JuliaCompilerMixin, formulas_parsers_2to3.UniformDiction
         if julia:
             self.julia = julia
 
-    def guess(self, expected):
+    def guess_uncached(self, expected):
         if self.julia:
             # When iterating on a Julia dictionary, the iterator is a (key, value) couple, not a key only (as in
             # Python).
@@ -2033,7 +2179,7 @@ class UniformDictionary(JuliaCompilerMixin, formulas_parsers_2to3.UniformDiction
                     parser = parser,
                     )
 
-        return super(UniformDictionary, self).guess(expected)
+        return super(UniformDictionary, self).guess_uncached(expected)
 
 
 class Variable(JuliaCompilerMixin, formulas_parsers_2to3.Variable):
@@ -2080,11 +2226,12 @@ class XorExpression(JuliaCompilerMixin, formulas_parsers_2to3.XorExpression):
 # Formula-specific classes
 
 
-class FormulaClass(Class, formulas_parsers_2to3.FormulaClass):
+class FormulaClass(JuliaBlockCompilerMixin, Class, formulas_parsers_2to3.FormulaClass):
     def juliaize(self):
         return self
 
-    def source_julia(self, depth = 0):
+    def source_julia_hard_coded(self):
+        """Return the custom Julia implementation of the formula, when it has one."""
         parser = self.parser
         if parser.column.name == 'age':
             return textwrap.dedent(u"""
@@ -2239,11 +2386,20 @@ class FormulaClass(Class, formulas_parsers_2to3.FormulaClass):
                 """).format(
                 call = parser.source_julia_column_without_function(is_formula = True),
                 )
-        statements = None
+
+    def write_julia(self, writer, depth = 0):
+        hard_coded_source = self.source_julia_hard_coded()
+        if hard_coded_source is not None:
+            writer.write(hard_coded_source)
+            return
+        parser = self.parser
+        writer.write(u'\n{call} do simulation, variable, period\n'.format(
+            call = parser.source_julia_column_without_function(is_formula = True),
+            ))
         for variable in self.variable_by_name.itervalues():
             if isinstance(variable.value, parser.FormulaFunction):
                 # Simple formula
-                statements = variable.value.juliaize().source_julia_statements(depth = depth + 1)
+                variable.value.juliaize().write_julia_statements(writer, depth = depth + 1)
                 break
         else:
             # Dated formula
@@ -2252,60 +2408,63 @@ class FormulaClass(Class, formulas_parsers_2to3.FormulaClass):
                 for variable in self.variable_by_name.itervalues()
                 if isinstance(variable.value, parser.Decorator) and variable.name == 'dated_function'
                 ]
-            assert dated_functions_decorator
-            statements_blocks = []
-            for decorator in dated_functions_decorator:
+            if not dated_functions_decorator:
+                raise formulas_parsers_2to3.ParseError("Dated formula {} has no dated_function decorator".format(
+                    self.name))
+            for index, decorator in enumerate(dated_functions_decorator):
                 call = decorator.subject
-                assert isinstance(call, parser.Call)
-                assert call.keyword_argument is None
-                assert call.star_argument is None
+                if not isinstance(call, parser.Call):
+                    raise formulas_parsers_2to3.ParseError("Unexpected dated_function decorator in formula {}".format(
+                        self.name))
+                if call.keyword_argument is not None or call.star_argument is not None:
+                    raise formulas_parsers_2to3.ParseError(
+                        "Unexpected */** arguments of dated_function decorator in formula {}".format(
+                            self.name))
                 start_date = call.positional_arguments[0] \
                     if len(call.positional_arguments) >= 1 \
                     else call.named_arguments.get('start')
                 stop_date = call.positional_arguments[1] \
                     if len(call.positional_arguments) >= 2 \
                     else call.named_arguments.get('stop')
-                assert start_date is not None or stop_date is not None
+                if start_date is None and stop_date is None:
+                    raise formulas_parsers_2to3.ParseError(
+                        "Missing start and stop dates of dated_function decorator in formula {}".format(
+                            self.name))
                 if start_date is None:
                     test = u'{optional_else}if period.start <= {stop_date}'.format(
-                        optional_else = u'else' if statements_blocks else u'',
+                        optional_else = u'else' if index > 0 else u'',
                         stop_date = stop_date.juliaize().source_julia(depth = depth + 2),
                         )
                 elif stop_date is None:
                     test = u'{optional_else}if {start_date} <= period.start'.format(
-                        optional_else = u'else' if statements_blocks else u'',
+                        optional_else = u'else' if index > 0 else u'',
                         start_date = start_date.juliaize().source_julia(depth = depth + 2),
                         )
                 else:
                     test = u'{optional_else}if {start_date} <= period.start && period.start <= {stop_date}'.format(
-                        optional_else = u'else' if statements_blocks else u'',
+                        optional_else = u'else' if index > 0 else u'',
                         start_date = start_date.juliaize().source_julia(depth = depth + 2),
                         stop_date = stop_date.juliaize().source_julia(depth = depth + 2),
                         )
 
                 function = decorator.decorated
-                assert isinstance(function, parser.FormulaFunction)
-                statements_blocks.append(u"{indent}  {test}\n{statements}".format(
+                if not isinstance(function, parser.FormulaFunction):
+                    raise formulas_parsers_2to3.ParseError(
+                        "Unexpected function decorated by dated_function in formula {}".format(
+                            self.name))
+                writer.write(u"{indent}  {test}\n".format(
                     indent = u'  ' * depth,
-                    statements = function.juliaize().source_julia_statements(depth = depth + 2),
                     test = test,
                     ))
-            statements_blocks.append(textwrap.dedent(u"""\
+                function.juliaize().write_julia_statements(writer, depth = depth + 2)
+            writer.write(textwrap.dedent(u"""\
                 {indent}  else
                 {indent}    return period, default_array(variable)
                 {indent}  end
                 """).format(
                 indent = u'  ' * depth,
                 ))
-            statements = u''.join(statements_blocks)
-
-        return textwrap.dedent(u"""
-            {call} do simulation, variable, period
-            {statements}end
-            """).format(
-            call = parser.source_julia_column_without_function(is_formula = True),
-            statements = statements or u'',
-            )
+        writer.write(u'end\n')
 
 
 class FormulaFunction(Function, formulas_parsers_2to3.FormulaFunction):
@@ -2359,9 +2518,11 @@ class Parser(formulas_parsers_2to3.Parser):
     Variable = Variable
     XorExpression = XorExpression
 
-    def __init__(self, country_package = None, driver = None, tax_benefit_system = None):
-        super(Parser, self).__init__(country_package = country_package, driver = driver,
-            tax_benefit_system = tax_benefit_system)
+    def __init__(self, country_package = None, driver = None, node_arena = None, parse_trees_cache = None,
+            parse_whole_modules = False, profiler = None, tax_benefit_system = None, validate = True):
+        super(Parser, self).__init__(country_package = country_package, driver = driver, node_arena = node_arena,
+            parse_trees_cache = parse_trees_cache, parse_whole_modules = parse_whole_modules, profiler = profiler,
+            tax_benefit_system = tax_benefit_system, validate = validate)
         self.non_formula_function_by_name = collections.OrderedDict()
 
     def juliaize_name(self, name):
@@ -2521,8 +2682,8 @@ class Parser(formulas_parsers_2to3.Parser):
                 ):
             base_function_str = formula_class.base_function.func_name
         else:
-            assert False, u"Unhandled base function in formula {}: {}".format(column.name,
-                getattr(formula_class, 'base_function', None)).encode('utf-8')
+            raise formulas_parsers_2to3.ParseError(u"Unhandled base function in formula {}: {}".format(column.name,
+                getattr(formula_class, 'base_function', None)).encode('utf-8'))
 
         named_arguments = u''.join(
             u'  {},\n'.format(named_argument)
@@ -2564,6 +2725,340 @@ class Parser(formulas_parsers_2to3.Parser):
                 )
 
 
+def convert_columns(columns, jobs = 1, parser = None, parser_options = None, stale_modules_name = None,
+        stop_column_name = None):
+    """Convert columns to Julia.
+
+    When stale_modules_name is given, only the formulas defined in these modules are converted. The conversion then
+    stops at the formula named stop_column_name, unless it is defined in a stale module, as if its conversion failed
+    again. When parser is given, it is used instead of a new parser created with parser_options (for the serial
+    conversion).
+
+    Return the Julia sources of input variables, the Julia sources of formulas & functions by module (with the
+    names of the modules that contributed to each of them) and the index of the column whose conversion failed.
+    """
+    if parser is None:
+        parser = Parser(
+            driver = lib2to3.pgen2.driver.Driver(lib2to3.pygram.python_grammar, convert = lib2to3.pytree.convert,
+                logger = log),
+            **parser_options)
+    tax_benefit_system = parser.tax_benefit_system
+
+    contributors_name_by_module_name = {}
+    failed_column_index = None
+    function_column_index_by_name = {}
+    input_variable_definition_julia_source_by_name = collections.OrderedDict()
+    julia_source_by_name_by_module_name = {}
+
+    formula_result_by_column_index = None
+    function_result_by_name = None
+    if jobs > 1:
+        # Convert formulas in worker processes, grouped by module, because the functions of a module are parsed only
+        # once (at their first call). The results are then merged as if the conversion was serial.
+        columns_index_and_name_by_module_name = collections.OrderedDict()
+        stop_column_index = None
+        for column_index, column in enumerate(columns):
+            column_formula_class = column.formula_class
+            if issubclass(column_formula_class, formulas.SimpleFormula) and column_formula_class.function is None \
+                    or issubclass(column_formula_class, formulas.AbstractEntityToEntity) \
+                    or column.name in unconverted_formulas_name:
+                continue
+            column_module_name = inspect.getmodule(column_formula_class).__name__
+            if stale_modules_name is not None and column_module_name not in stale_modules_name:
+                if column.name == stop_column_name:
+                    stop_column_index = column_index
+                continue
+            columns_index_and_name_by_module_name.setdefault(column_module_name, []).append((column_index,
+                column.name))
+        pool = multiprocessing.Pool(jobs, initializer = setup_worker, initargs = (parser_options,))
+        try:
+            groups_result = pool.map(convert_formulas_group, sorted(columns_index_and_name_by_module_name.values(),
+                key = len, reverse = True), chunksize = 1)
+        finally:
+            pool.terminate()
+            pool.join()
+        formula_result_by_column_index = {}
+        function_changes = []
+        for formulas_result, group_function_changes in groups_result:
+            for formula_result in formulas_result:
+                formula_result_by_column_index[formula_result[0]] = formula_result
+            function_changes.extend(group_function_changes)
+        # Like the serial conversion, ignore the formulas after the first one that fails.
+        failed_columns_index = [
+            column_index
+            for column_index, output, julia_source, parse_error, juliaize_error in (
+                formula_result_by_column_index.itervalues())
+            if parse_error is not None or juliaize_error is not None
+            ]
+        if stop_column_index is not None:
+            failed_columns_index.append(stop_column_index)
+        last_column_index = min(failed_columns_index) if failed_columns_index else len(columns)
+        # The same function may have been parsed by several groups: Keep the first one, as the serial conversion.
+        function_result_by_name = collections.OrderedDict()
+        for column_index, function_name, function_result in sorted(function_changes,
+                key = lambda function_change: function_change[0]):
+            if column_index > last_column_index:
+                break
+            if function_result is None:
+                function_result_by_name.pop(function_name, None)
+            elif function_name not in function_result_by_name:
+                function_result_by_name[function_name] = function_result
+                function_column_index_by_name[function_name] = column_index
+
+    for column_index, column in enumerate(columns):
+        print column.name
+        parser.column = column
+
+        column_formula_class = column.formula_class
+        assert column_formula_class is not None
+        if issubclass(column_formula_class, formulas.SimpleFormula) and column_formula_class.function is None:
+            # Input variable
+            input_variable_definition_julia_source_by_name[column.name] = parser.source_julia_column_without_function()
+            continue
+        column_module_name = inspect.getmodule(column_formula_class).__name__
+        if stale_modules_name is not None and column_module_name not in stale_modules_name \
+                and column.name not in unconverted_formulas_name:
+            if column.name == stop_column_name:
+                # Stop conversion of columns, like the previous conversion that failed at this unchanged formula.
+                log.warning(u'Stopping at formula {}, whose conversion failed previously'.format(column.name))
+                failed_column_index = column_index
+                break
+            # The Julia source of this formula is up to date.
+            continue
+        if issubclass(column_formula_class, formulas.AbstractEntityToEntity):
+            # EntityToPerson or PersonToEntity converters
+            if issubclass(column_formula_class, formulas.PersonToEntity):
+                entity = tax_benefit_system.entity_class_by_key_plural[column.entity_key_plural]
+                if column_formula_class.operation is None:
+                    role = column_formula_class.roles[0]
+                    # print entity.key_singular, role
+                    expression = u"single_person_in_entity({variable}, get_entity(variable), {role})".format(
+                        role = name_by_role_by_entity_key_singular[entity.key_singular][role],
+                        variable = column_formula_class.variable_name,
+                        )
+                elif column_formula_class.operation == u'add':
+                    roles = column_formula_class.roles
+                    # print entity.key_singular, roles
+                    roles = u', [{}]'.format(u', '.join(
+                        name_by_role_by_entity_key_singular[entity.key_singular][role]
+                        for role in roles
+                        )) if roles else u''
+                    expression = u"sum_person_in_entity({variable}, get_entity(variable){roles})".format(
+                        roles = roles,
+                        variable = column_formula_class.variable_name,
+                        )
+                elif column_formula_class.operation == u'or':
+                    roles = column_formula_class.roles
+                    # print entity.key_singular, roles
+                    roles = u', [{}]'.format(u', '.join(
+                        name_by_role_by_entity_key_singular[entity.key_singular][role]
+                        for role in roles
+                        )) if roles else u''
+                    expression = u"any_person_in_entity({variable}, get_entity(variable){roles})".format(
+                        roles = roles,
+                        variable = column_formula_class.variable_name,
+                        )
+                else:
+                    raise formulas_parsers_2to3.ParseError(u"Unexpected operation {} in formula {}".format(
+                        column_formula_class.operation, column.name).encode('utf-8'))
+            else:
+                roles = column_formula_class.roles
+                # print entity.key_singular, roles
+                roles = u', [{}]'.format(u', '.join(
+                    name_by_role_by_entity_key_singular[entity.key_singular][role]
+                    for role in roles
+                    )) if roles else u''
+                expression = u"entity_to_person({variable}{roles})".format(
+                    roles = roles,
+                    variable = column_formula_class.variable_name,
+                    )
+            julia_source = textwrap.dedent(u"""
+                {call} do simulation, variable, period
+                  @calculate({variable}, period, accept_other_period = true)
+                  return period, {expression}
+                end
+                """).format(
+                call = parser.source_julia_column_without_function(is_formula = True),
+                expression = expression,
+                variable = column_formula_class.variable_name,
+                )
+            module_name = column_module_name
+            assert module_name.startswith('openfisca_france.model.')
+            module_name = module_name[len('openfisca_france.model.'):]
+            julia_source_by_name_by_module_name.setdefault(module_name, {})[column.name] = julia_source
+            contributors_name_by_module_name.setdefault(module_name, set()).add(column_module_name)
+            continue
+
+        if column.name in unconverted_formulas_name:
+            # Skip formulas that can't be easily converted to Julia and handle them as input variables.
+            input_variable_definition_julia_source_by_name[column.name] = parser.source_julia_column_without_function()
+            continue
+
+        if formula_result_by_column_index is not None:
+            column_index, output, julia_source, parse_error, juliaize_error = formula_result_by_column_index[
+                column_index]
+            sys.stdout.write(output)
+            if parse_error is not None:
+                # Stop conversion of columns, but write the existing results to Julia files.
+                sys.stderr.write(parse_error)
+                failed_column_index = column_index
+                break
+            if juliaize_error is not None:
+                raise Exception(juliaize_error)
+            module_name = column_module_name
+            assert module_name.startswith('openfisca_france.model.')
+            module_name = module_name[len('openfisca_france.model.'):]
+            julia_source_by_name_by_module_name.setdefault(module_name, {})[column.name] = julia_source
+            contributors_name_by_module_name.setdefault(module_name, set()).add(column_module_name)
+            continue
+
+        function_by_name = parser.non_formula_function_by_name.copy()
+        try:
+            formula_class_wrapper = parser.FormulaClassFileInput.parse(column_formula_class, parser = parser)
+        except:
+            # Stop conversion of columns, but write the existing results to Julia files.
+            traceback.print_exc()
+            failed_column_index = column_index
+        for function_name, function_wrapper in parser.non_formula_function_by_name.iteritems():
+            if function_by_name.get(function_name) is not function_wrapper:
+                function_column_index_by_name[function_name] = column_index
+        if failed_column_index is not None:
+            break
+
+        try:
+            julia_source = generate_julia_source(formula_class_wrapper)
+        except:
+            node = formula_class_wrapper.node
+            if node is not None:
+                print "An exception occurred When juliaizing formula {}:\n{}\n\n{}".format(column.name, repr(node),
+                    unicode(node).encode('utf-8'))
+            raise
+
+        module_name = formula_class_wrapper.containing_module.python.__name__
+        assert module_name.startswith('openfisca_france.model.')
+        module_name = module_name[len('openfisca_france.model.'):]
+        julia_source_by_name_by_module_name.setdefault(module_name, {})[column.name] = julia_source
+        contributors_name_by_module_name.setdefault(module_name, set()).add(column_module_name)
+
+    # Add non-formula functions to modules.
+    if function_result_by_name is not None:
+        for function_name, (module_name, output, julia_source, juliaize_error) in function_result_by_name.iteritems():
+            sys.stdout.write(output)
+            if juliaize_error is not None:
+                raise Exception(juliaize_error)
+            assert module_name.startswith('openfisca_france.model.')
+            module_name = module_name[len('openfisca_france.model.'):]
+            julia_source_by_name_by_module_name.setdefault(module_name, {})[function_name] = julia_source
+            contributors_name_by_module_name.setdefault(module_name, set()).add(inspect.getmodule(
+                columns[function_column_index_by_name[function_name]].formula_class).__name__)
+    for function_wrapper in parser.non_formula_function_by_name.itervalues():
+        try:
+            julia_source = generate_julia_source(function_wrapper)
+        except:
+            node = function_wrapper.node
+            if node is not None:
+                print "An exception occurred When juliaizing function {}:\n{}\n\n{}".format(function_wrapper.name,
+                    repr(node), unicode(node).encode('utf-8'))
+            raise
+
+        module_name = function_wrapper.containing_module.python.__name__
+        assert module_name.startswith('openfisca_france.model.')
+        module_name = module_name[len('openfisca_france.model.'):]
+        julia_source_by_name_by_module_name.setdefault(module_name, {})[function_wrapper.name] = julia_source
+        contributors_name_by_module_name.setdefault(module_name, set()).add(inspect.getmodule(
+            columns[function_column_index_by_name[function_wrapper.name]].formula_class).__name__)
+
+    log.info(u'Memoized guesses: {} hits, {} misses'.format(parser.guess_hit_count, parser.guess_miss_count))
+
+    return (input_variable_definition_julia_source_by_name, julia_source_by_name_by_module_name,
+        contributors_name_by_module_name, failed_column_index)
+
+
+def convert_formulas_group(columns_index_and_name):
+    """Convert to Julia a group of formulas (defined in the same module), in a worker process.
+
+    Return the result of each formula (with the messages printed during its conversion), stopping at the first formula
+    that can't be parsed, and the changes of non-formula functions, each one with the index of its column.
+    """
+    parser = Parser(**worker_parser_options)
+    tax_benefit_system = parser.tax_benefit_system
+    formulas_result = []
+    function_changes = []
+    stdout = sys.stdout
+    try:
+        for column_index, name in columns_index_and_name:
+            column = tax_benefit_system.column_by_name[name]
+            parser.column = column
+            function_by_name = parser.non_formula_function_by_name.copy()
+            sys.stdout = output = StringIO.StringIO()
+            julia_source = None
+            parse_error = None
+            juliaize_error = None
+            try:
+                formula_class_wrapper = parser.FormulaClassFileInput.parse(column.formula_class, parser = parser)
+            except:
+                parse_error = traceback.format_exc()
+            else:
+                try:
+                    julia_source = generate_julia_source(formula_class_wrapper)
+                except:
+                    node = formula_class_wrapper.node
+                    if node is not None:
+                        print "An exception occurred When juliaizing formula {}:\n{}\n\n{}".format(column.name,
+                            repr(node), unicode(node).encode('utf-8'))
+                    juliaize_error = traceback.format_exc()
+            formulas_result.append((column_index, output.getvalue(), julia_source, parse_error, juliaize_error))
+            for function_name, function_wrapper in parser.non_formula_function_by_name.iteritems():
+                if function_by_name.get(function_name) is not function_wrapper:
+                    function_changes.append((column_index, function_name, function_wrapper))
+            for function_name in function_by_name.iterkeys():
+                if function_name not in parser.non_formula_function_by_name:
+                    # Function removed
+                    function_changes.append((column_index, function_name, None))
+            if parse_error is not None or juliaize_error is not None:
+                break
+
+        # Like the serial conversion, convert functions once all their calls have been parsed.
+        function_result_by_wrapper_id = {}
+        for change_index, (column_index, function_name, function_wrapper) in enumerate(function_changes):
+            if function_wrapper is None:
+                continue
+            function_result = function_result_by_wrapper_id.get(id(function_wrapper))
+            if function_result is None:
+                sys.stdout = output = StringIO.StringIO()
+                julia_source = None
+                juliaize_error = None
+                try:
+                    julia_source = generate_julia_source(function_wrapper)
+                except:
+                    node = function_wrapper.node
+                    if node is not None:
+                        print "An exception occurred When juliaizing function {}:\n{}\n\n{}".format(function_name,
+                            repr(node), unicode(node).encode('utf-8'))
+                    juliaize_error = traceback.format_exc()
+                function_result_by_wrapper_id[id(function_wrapper)] = function_result = (
+                    function_wrapper.containing_module.python.__name__,
+                    output.getvalue(),
+                    julia_source,
+                    juliaize_error,
+                    )
+            function_changes[change_index] = (column_index, function_name, function_result)
+    finally:
+        sys.stdout = stdout
+    return formulas_result, function_changes
+
+
+def extend_stale_modules_name(stale_modules_name, contributors_name_by_module_name):
+    """Add to stale modules the other contributors of the Julia modules they contribute to."""
+    while True:
+        stale_modules_count = len(stale_modules_name)
+        for contributors_name in contributors_name_by_module_name.itervalues():
+            if not stale_modules_name.isdisjoint(contributors_name):
+                stale_modules_name.update(contributors_name)
+        if len(stale_modules_name) == stale_modules_count:
+            return stale_modules_name
+
+
 def generate_date_range_value_julia_source(date_range_value_json):
     for key in date_range_value_json.iterkeys():
         assert key in (
@@ -2581,9 +3076,38 @@ def generate_date_range_value_julia_source(date_range_value_json):
         )
 
 
+def generate_julia_source(wrapper):
+    """Convert the wrapper of a formula or a function to Julia and return its source."""
+    profiler = wrapper.parser.profiler
+    if profiler is None:
+        return wrapper.juliaize().source_julia(depth = 0)
+    column = wrapper.parser.column
+    profiler.start('juliaize', column = column)
+    try:
+        julia_wrapper = wrapper.juliaize()
+    finally:
+        profiler.stop()
+    # Function bodies are converted to Julia while generating their source: Their juliaize phase is nested in this one.
+    profiler.start('source_julia', column = column)
+    try:
+        return julia_wrapper.source_julia(depth = 0)
+    finally:
+        profiler.stop()
+
+
 def generate_legislation_node_julia_source(node_json, check_start_date_julia_source = None,
-        check_stop_date_julia_source = None, comments = None, descriptions = None, julia_source_by_path = None,
-        path_fragments = None):
+        check_stop_date_julia_source = None, comments = None, descriptions = None, path_fragments = None):
+    """Generate the Julia definitions of the parameters & scales of a legislation node, in order.
+
+    comments, descriptions & path_fragments are the stacks of the ancestors of the node: They are shared by the whole
+    walk, each node pushing its items before walking its children and popping them after.
+    """
+    if comments is None:
+        comments = []
+    if descriptions is None:
+        descriptions = []
+    if path_fragments is None:
+        path_fragments = []
     if node_json['@type'] == 'Node':
         for key in node_json.iterkeys():
             assert key in (
@@ -2595,16 +3119,22 @@ def generate_legislation_node_julia_source(node_json, check_start_date_julia_sou
                 'start',
                 'stop',
                 ), "Unexpected item key for node: {}".format(key)
+        comments.append(node_json.get('comment'))
+        descriptions.append(node_json.get('description'))
         for child_code, child_json in node_json['children'].iteritems():
-            generate_legislation_node_julia_source(
-                child_json,
-                check_start_date_julia_source = check_start_date_julia_source,
-                check_stop_date_julia_source = check_stop_date_julia_source,
-                comments = comments + [node_json.get('comment')],
-                descriptions = descriptions + [node_json.get('description')],
-                julia_source_by_path = julia_source_by_path,
-                path_fragments = path_fragments + [child_code],
-                )
+            path_fragments.append(child_code)
+            for julia_source in generate_legislation_node_julia_source(
+                    child_json,
+                    check_start_date_julia_source = check_start_date_julia_source,
+                    check_stop_date_julia_source = check_stop_date_julia_source,
+                    comments = comments,
+                    descriptions = descriptions,
+                    path_fragments = path_fragments,
+                    ):
+                yield julia_source
+            path_fragments.pop()
+        comments.pop()
+        descriptions.pop()
     elif node_json['@type'] == 'Parameter':
         for key in node_json.iterkeys():
             assert key in (
@@ -2636,7 +3166,7 @@ def generate_legislation_node_julia_source(node_json, check_start_date_julia_sou
 
         description = u' ; '.join(
             fragment
-            for fragment in descriptions + [node_json.get('description')]
+            for fragment in itertools.chain(descriptions, [node_json.get('description')])
             if fragment
             )
         if description:
@@ -2644,13 +3174,13 @@ def generate_legislation_node_julia_source(node_json, check_start_date_julia_sou
 
         comment = u' ; '.join(
             fragment
-            for fragment in comments + [node_json.get('comment')]
+            for fragment in itertools.chain(comments, [node_json.get('comment')])
             if fragment
             )
         if comment:
             named_arguments['comment'] = generate_string_julia_source(comment)
 
-        julia_source_by_path[u'.'.join(path_fragments)] = textwrap.dedent(u"""
+        yield textwrap.dedent(u"""
             @define_parameter({name}, Parameter{{{type}}}(
               [
             {values}  ],
@@ -2771,7 +3301,7 @@ def generate_legislation_node_julia_source(node_json, check_start_date_julia_sou
 
         description = u' ; '.join(
             fragment
-            for fragment in descriptions + [node_json.get('description')]
+            for fragment in itertools.chain(descriptions, [node_json.get('description')])
             if fragment
             )
         if description:
@@ -2779,13 +3309,13 @@ def generate_legislation_node_julia_source(node_json, check_start_date_julia_sou
 
         comment = u' ; '.join(
             fragment
-            for fragment in comments + [node_json.get('comment')]
+            for fragment in itertools.chain(comments, [node_json.get('comment')])
             if fragment
             )
         if comment:
             named_arguments['comment'] = generate_string_julia_source(comment)
 
-        julia_source_by_path[u'.'.join(path_fragments)] = textwrap.dedent(u"""
+        yield textwrap.dedent(u"""
             @define_parameter({name}, {tax_scale_type}(
               [
             {brackets}  ],
@@ -2809,6 +3339,98 @@ def generate_string_julia_source(s):
     return u'"{}"'.format(s.replace(u'"', u'\\"'))
 
 
+def get_formulas_julia_path(julia_package_dir, module_name):
+    return os.path.join(julia_package_dir, 'src', 'formulas', *module_name.split('.')) + '.jl'
+
+
+def get_global_fingerprint(country_package, legislation_json):
+    """Return a fingerprint of everything that changes the Julia source of every formula."""
+    fingerprint_hash = hashlib.sha1('{}:{}'.format(manifest_format_version, country_package.__name__))
+    for module in (formulas_parsers_2to3, sys.modules[__name__]):
+        fingerprint_hash.update(inspect.getsource(module))
+    fingerprint_hash.update(json.dumps(legislation_json, sort_keys = True))
+    return fingerprint_hash.hexdigest()
+
+
+def get_module_fingerprint_by_name(modules_name, country_package, tax_benefit_system, global_fingerprint):
+    """Return a fingerprint of each module defining formulas.
+
+    The fingerprint of a module changes when its source changes, when the source of a module of the country package
+    that it depends on (transitively) changes or when a variable whose name appears in these sources changes.
+    """
+    column_signature_by_name = {}
+    dependencies_name_by_module_name = {}
+    source_by_module_name = {}
+
+    def get_dependencies_name(module_name):
+        dependencies_name = dependencies_name_by_module_name.get(module_name)
+        if dependencies_name is None:
+            dependencies_name = set()
+            for value in vars(sys.modules[module_name]).itervalues():
+                if isinstance(value, types.ModuleType):
+                    dependency_name = value.__name__
+                else:
+                    dependency_name = getattr(value, '__module__', None)
+                    if not isinstance(dependency_name, basestring):
+                        continue
+                if dependency_name != module_name and dependency_name in sys.modules and (
+                        dependency_name == country_package.__name__
+                        or dependency_name.startswith(country_package.__name__ + '.')):
+                    dependencies_name.add(dependency_name)
+            dependencies_name_by_module_name[module_name] = dependencies_name
+        return dependencies_name
+
+    module_fingerprint_by_name = {}
+    for module_name in modules_name:
+        # Collect the module and its dependencies.
+        closure_modules_name = set()
+        remaining_modules_name = [module_name]
+        while remaining_modules_name:
+            closure_module_name = remaining_modules_name.pop()
+            if closure_module_name not in closure_modules_name:
+                closure_modules_name.add(closure_module_name)
+                remaining_modules_name.extend(get_dependencies_name(closure_module_name))
+
+        fingerprint_hash = hashlib.sha1(global_fingerprint)
+        identifiers = set()
+        for closure_module_name in sorted(closure_modules_name):
+            source = source_by_module_name.get(closure_module_name)
+            if source is None:
+                try:
+                    source = inspect.getsource(sys.modules[closure_module_name])
+                except (IOError, TypeError):
+                    # Module without source (empty package, extension, etc)
+                    source = ''
+                source_by_module_name[closure_module_name] = source
+            fingerprint_hash.update('\0{}\0'.format(closure_module_name))
+            fingerprint_hash.update(source)
+            identifiers.update(re.findall(r'\w+', source))
+        for column_name in sorted(identifiers.intersection(tax_benefit_system.column_by_name)):
+            column_signature = column_signature_by_name.get(column_name)
+            if column_signature is None:
+                column_json = tax_benefit_system.column_by_name[column_name].to_json()
+                # The line number of a formula changes each time a formula above it changes.
+                column_json.pop('line_number', None)
+                column_signature_by_name[column_name] = column_signature = json.dumps(column_json,
+                    default = unicode, sort_keys = True)
+            fingerprint_hash.update('\0{}\0'.format(column_name))
+            fingerprint_hash.update(column_signature)
+        module_fingerprint_by_name[module_name] = fingerprint_hash.hexdigest()
+    return module_fingerprint_by_name
+
+
+def load_manifest(julia_package_dir):
+    """Return the manifest of the previous conversion, or None when it is missing or obsolete."""
+    try:
+        with open(os.path.join(julia_package_dir, manifest_filename)) as manifest_file:
+            manifest = json.load(manifest_file)
+    except (IOError, ValueError):
+        return None
+    if not isinstance(manifest, dict) or manifest.get('format_version') != manifest_format_version:
+        return None
+    return manifest
+
+
 def main():
     parser = argparse.ArgumentParser(description = __doc__)
     parser.add_argument('julia_package_dir', help = u'path of the directory of the OpenFisca Julia package')
@@ -2816,202 +3438,253 @@ def main():
         help = u'name of the OpenFisca package to use for country-specific variables & formulas')
     parser.add_argument('-f', '--formula',
         help = u'name of the OpenFisca variable to convert (all are converted by default)')
+    parser.add_argument('-i', '--incremental', action = 'store_true', default = False,
+        help = u'convert only the modules that changed since the previous conversion and leave the other files alone')
+    parser.add_argument('--no-validate', action = 'store_false', default = True, dest = 'validate',
+        help = u'skip the validation of the wrappers & nodes created while parsing (like running python -O)')
+    parser.add_argument('-p', '--parse-cache-dir', default = None,
+        help = u'path of a directory where parse trees are cached between runs (default: no cache)')
+    parser.add_argument('-j', '--jobs', default = 1, type = int,
+        help = u'number of worker processes converting formulas in parallel (default: 1)')
+    parser.add_argument('-m', '--whole-modules', action = 'store_true', default = False,
+        help = u'parse each module of the country package once, instead of once per formula')
+    parser.add_argument('--profile', const = '-', default = None, metavar = 'REPORT_PATH', nargs = '?',
+        help = u'time the phases of the conversion and write their report as JSON (default: as text to stderr)')
     parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
     args = parser.parse_args()
+    if args.profile is not None and args.jobs > 1:
+        parser.error(u'--profile can only be used with a single job')
     logging.basicConfig(level = logging.DEBUG if args.verbose else logging.WARNING, stream = sys.stdout)
 
     country_package = importlib.import_module(args.country_package)
     TaxBenefitSystem = country_package.init_country()
     tax_benefit_system = TaxBenefitSystem()
 
-    parser = Parser(
+    parser_options = dict(
         country_package = country_package,
-        driver = lib2to3.pgen2.driver.Driver(lib2to3.pygram.python_grammar, convert = lib2to3.pytree.convert,
-            logger = log),
+        parse_trees_cache = parse_trees_caches.ParseTreesCache(args.parse_cache_dir)
+            if args.parse_cache_dir is not None
+            else None,
+        parse_whole_modules = args.whole_modules,
+        profiler = profilers.Profiler() if args.profile is not None else None,
         tax_benefit_system = tax_benefit_system,
+        validate = args.validate,
         )
-
     legislation_json = tax_benefit_system.legislation_json
-    parameter_julia_source_by_path = collections.OrderedDict()
-    generate_legislation_node_julia_source(
-        legislation_json,
-        check_start_date_julia_source = u'Date({}, {}, {})'.format(*legislation_json['start'].split(u'-')),
-        check_stop_date_julia_source = u'Date({}, {}, {})'.format(*legislation_json['stop'].split(u'-')),
-        comments = [],
-        descriptions = [],
-        julia_source_by_path = parameter_julia_source_by_path,
-        path_fragments = [],
+    # Parameters are written as soon as they are generated, without keeping their sources.
+    write_julia_file(
+        os.path.join(args.julia_package_dir, 'src', 'parameters.jl'),
+        itertools.chain(
+            [julia_file_header, u'\n'],
+            generate_legislation_node_julia_source(
+                legislation_json,
+                check_start_date_julia_source = u'Date({}, {}, {})'.format(*legislation_json['start'].split(u'-')),
+                check_stop_date_julia_source = u'Date({}, {}, {})'.format(*legislation_json['stop'].split(u'-')),
+                ),
+            ),
+        only_if_changed = args.incremental,
         )
-    julia_path = os.path.join(args.julia_package_dir, 'src', 'parameters.jl')
-    with codecs.open(julia_path, 'w', encoding = 'utf-8') as julia_file:
-        julia_file.write(julia_file_header)
-        julia_file.write(u'\n')
-        for parameter_julia_source in parameter_julia_source_by_path.itervalues():
-            julia_file.write(parameter_julia_source)
 
-    input_variable_definition_julia_source_by_name = collections.OrderedDict()
-    julia_source_by_name_by_module_name = {}
+    columns = tax_benefit_system.column_by_name.values()
+    previous_contributors_name_by_module_name = {}
+    stale_modules_name = None
+    stop_column_name = None
     if args.formula:
         columns = [tax_benefit_system.column_by_name[args.formula]]
     else:
-        columns = tax_benefit_system.column_by_name.itervalues()
-    for column in columns:
-        print column.name
-        parser.column = column
-
-        column_formula_class = column.formula_class
-        assert column_formula_class is not None
-        if issubclass(column_formula_class, formulas.SimpleFormula) and column_formula_class.function is None:
-            # Input variable
-            input_variable_definition_julia_source_by_name[column.name] = parser.source_julia_column_without_function()
-            continue
-        if issubclass(column_formula_class, formulas.AbstractEntityToEntity):
-            # EntityToPerson or PersonToEntity converters
-            if issubclass(column_formula_class, formulas.PersonToEntity):
-                entity = tax_benefit_system.entity_class_by_key_plural[column.entity_key_plural]
-                if column_formula_class.operation is None:
-                    role = column_formula_class.roles[0]
-                    # print entity.key_singular, role
-                    expression = u"single_person_in_entity({variable}, get_entity(variable), {role})".format(
-                        role = name_by_role_by_entity_key_singular[entity.key_singular][role],
-                        variable = column_formula_class.variable_name,
-                        )
-                elif column_formula_class.operation == u'add':
-                    roles = column_formula_class.roles
-                    # print entity.key_singular, roles
-                    roles = u', [{}]'.format(u', '.join(
-                        name_by_role_by_entity_key_singular[entity.key_singular][role]
-                        for role in roles
-                        )) if roles else u''
-                    expression = u"sum_person_in_entity({variable}, get_entity(variable){roles})".format(
-                        roles = roles,
-                        variable = column_formula_class.variable_name,
-                        )
-                elif column_formula_class.operation == u'or':
-                    roles = column_formula_class.roles
-                    # print entity.key_singular, roles
-                    roles = u', [{}]'.format(u', '.join(
-                        name_by_role_by_entity_key_singular[entity.key_singular][role]
-                        for role in roles
-                        )) if roles else u''
-                    expression = u"any_person_in_entity({variable}, get_entity(variable){roles})".format(
-                        roles = roles,
-                        variable = column_formula_class.variable_name,
-                        )
-                else:
-                    assert False, u"Unexpected operation"
-            else:
-                roles = column_formula_class.roles
-                # print entity.key_singular, roles
-                roles = u', [{}]'.format(u', '.join(
-                    name_by_role_by_entity_key_singular[entity.key_singular][role]
-                    for role in roles
-                    )) if roles else u''
-                expression = u"entity_to_person({variable}{roles})".format(
-                    roles = roles,
-                    variable = column_formula_class.variable_name,
-                    )
-            julia_source = textwrap.dedent(u"""
-                {call} do simulation, variable, period
-                  @calculate({variable}, period, accept_other_period = true)
-                  return period, {expression}
-                end
-                """).format(
-                call = parser.source_julia_column_without_function(is_formula = True),
-                expression = expression,
-                variable = column_formula_class.variable_name,
+        # The formulas converted before a failing one depend on the order of columns.
+        columns_fingerprint = hashlib.sha1('\0'.join(
+            column.name.encode('utf-8')
+            for column in columns
+            )).hexdigest()
+        global_fingerprint = get_global_fingerprint(country_package, legislation_json)
+        last_column_index_by_module_name = {}
+        for column_index, column in enumerate(columns):
+            column_formula_class = column.formula_class
+            if issubclass(column_formula_class, formulas.SimpleFormula) and column_formula_class.function is None \
+                    or column.name in unconverted_formulas_name:
+                continue
+            last_column_index_by_module_name[inspect.getmodule(column_formula_class).__name__] = column_index
+        module_fingerprint_by_name = get_module_fingerprint_by_name(last_column_index_by_module_name.iterkeys(),
+            country_package, tax_benefit_system, global_fingerprint)
+        manifest = load_manifest(args.julia_package_dir) if args.incremental else None
+        if manifest is not None and manifest['global_fingerprint'] == global_fingerprint:
+            previous_module_fingerprint_by_name = manifest['module_fingerprint_by_name']
+            stale_modules_name = set(
+                module_name
+                for module_name in set(module_fingerprint_by_name).union(previous_module_fingerprint_by_name)
+                if module_fingerprint_by_name.get(module_name) != previous_module_fingerprint_by_name.get(module_name)
                 )
-            module_name = inspect.getmodule(column_formula_class).__name__
-            assert module_name.startswith('openfisca_france.model.')
-            module_name = module_name[len('openfisca_france.model.'):]
-            julia_source_by_name_by_module_name.setdefault(module_name, {})[column.name] = julia_source
-            continue
-
-        if column.name in (
-                # 'age',  # custom Julia implementation
-                # 'age_en_mois',  # custom Julia implementation
-                # 'cmu_c_plafond',  # custom Julia implementation
-                'coefficient_proratisation',
-                # 'nombre_jours_calendaires',  # custom Julia implementation
-                # 'remuneration_apprenti',
-                # 'zone_apl',  # custom Julia implementation
-                ):
-            # Skip formulas that can't be easily converted to Julia and handle them as input variables.
-            input_variable_definition_julia_source_by_name[column.name] = parser.source_julia_column_without_function()
-            continue
-
-        try:
-            formula_class_wrapper = parser.FormulaClassFileInput.parse(column_formula_class, parser = parser)
-        except:
-            # Stop conversion of columns, but write the existing results to Julia files.
-            traceback.print_exc()
+            for module_name, contributors_name in manifest['contributors_name_by_module_name'].iteritems():
+                contributors_name = set(contributors_name)
+                previous_contributors_name_by_module_name[module_name] = contributors_name
+                if not os.path.exists(get_formulas_julia_path(args.julia_package_dir, module_name)):
+                    stale_modules_name.update(contributors_name)
+            extend_stale_modules_name(stale_modules_name, previous_contributors_name_by_module_name)
+            previous_failed_column_name = manifest['failed_column_name']
+            if previous_failed_column_name is not None:
+                if manifest['columns_fingerprint'] == columns_fingerprint and inspect.getmodule(
+                        tax_benefit_system.column_by_name[previous_failed_column_name].formula_class
+                        ).__name__ not in stale_modules_name:
+                    # The conversion of this formula would fail again: Stop there, like the previous conversion.
+                    stop_column_name = previous_failed_column_name
+                else:
+                    # The formulas after the failing one have never been converted.
+                    stale_modules_name.update(manifest['unconverted_modules_name'])
+                    extend_stale_modules_name(stale_modules_name, previous_contributors_name_by_module_name)
+
+    while True:
+        (input_variable_definition_julia_source_by_name, julia_source_by_name_by_module_name,
+            contributors_name_by_module_name, failed_column_index) = convert_columns(columns,
+            jobs = 1 if args.formula else args.jobs,
+            parser_options = parser_options,
+            stale_modules_name = stale_modules_name,
+            stop_column_name = stop_column_name,
+            )
+        if stale_modules_name is None:
             break
+        # A Julia module that has been regenerated must contain the sources coming from all its contributors: Those
+        # that contribute now and those that contributed to the previous conversion.
+        missing_modules_name = set()
+        for module_name, contributors_name in contributors_name_by_module_name.iteritems():
+            missing_modules_name.update(contributors_name.difference(stale_modules_name))
+            missing_modules_name.update(previous_contributors_name_by_module_name.get(module_name, set()).difference(
+                stale_modules_name))
+        if failed_column_index is not None and columns[failed_column_index].name != stop_column_name:
+            # Like a full conversion, ignore the formulas after the first one that fails. When it is the formula that
+            # failed previously, the unchanged Julia modules already ignore them.
+            for contributors_name in previous_contributors_name_by_module_name.itervalues():
+                if stale_modules_name.isdisjoint(contributors_name) and any(
+                        last_column_index_by_module_name.get(contributor_name, -1) >= failed_column_index
+                        for contributor_name in contributors_name
+                        ):
+                    missing_modules_name.update(contributors_name)
+        if not missing_modules_name:
+            break
+        log.info(u'Converting again, with the formulas of modules: {}'.format(u', '.join(sorted(
+            missing_modules_name))))
+        stale_modules_name.update(missing_modules_name)
+        extend_stale_modules_name(stale_modules_name, previous_contributors_name_by_module_name)
 
-        try:
-            julia_source = formula_class_wrapper.juliaize().source_julia(depth = 0)
-        except:
-            node = formula_class_wrapper.node
-            if node is not None:
-                print "An exception occurred When juliaizing formula {}:\n{}\n\n{}".format(column.name, repr(node),
-                    unicode(node).encode('utf-8'))
-            raise
-
-        module_name = formula_class_wrapper.containing_module.python.__name__
-        assert module_name.startswith('openfisca_france.model.')
-        module_name = module_name[len('openfisca_france.model.'):]
-        julia_source_by_name_by_module_name.setdefault(module_name, {})[column.name] = julia_source
-
-    # Add non-formula functions to modules.
-    for function_wrapper in parser.non_formula_function_by_name.itervalues():
-        try:
-            julia_source = function_wrapper.juliaize().source_julia(depth = 0)
-        except:
-            node = function_wrapper.node
-            if node is not None:
-                print "An exception occurred When juliaizing function {}:\n{}\n\n{}".format(function_wrapper.name,
-                    repr(node), unicode(node).encode('utf-8'))
-            raise
-
-        module_name = function_wrapper.containing_module.python.__name__
-        assert module_name.startswith('openfisca_france.model.')
-        module_name = module_name[len('openfisca_france.model.'):]
-        julia_source_by_name_by_module_name.setdefault(module_name, {})[function_wrapper.name] = julia_source
+    if parser_options['profiler'] is not None:
+        parser_options['profiler'].write_report(args.profile)
 
     if args.formula:
         for module_name, julia_source_by_name in julia_source_by_name_by_module_name.iteritems():
             for column_name, julia_source in sorted(julia_source_by_name.iteritems()):
                 print(julia_source)
-    else:
-        julia_path = os.path.join(args.julia_package_dir, 'src', 'input_variables.jl')
-        with codecs.open(julia_path, 'w', encoding = 'utf-8') as julia_file:
-            julia_file.write(julia_file_header)
-            julia_file.write(u'\n')
-            for input_variable_definition_julia_source in input_variable_definition_julia_source_by_name.itervalues():
-                julia_file.write(u'\n')
-                julia_file.write(input_variable_definition_julia_source)
-                julia_file.write(u'\n')
-
-        julia_path = os.path.join(args.julia_package_dir, 'src', 'formulas.jl')
-        with codecs.open(julia_path, 'w', encoding = 'utf-8') as julia_file:
-            julia_file.write(julia_file_header)
-            julia_file.write(u'\n\n')
-            for module_name in sorted(julia_source_by_name_by_module_name.iterkeys()):
-                julia_file.write(u'include("formulas/{}.jl")\n'.format(module_name.replace(u'.', u'/')))
+        return 0
+
+    if stale_modules_name is not None:
+        log.info(u'Converted the formulas of {} modules out of {}'.format(len(stale_modules_name),
+            len(module_fingerprint_by_name)))
+        # Keep the Julia modules whose contributors are all unchanged.
+        for module_name, contributors_name in previous_contributors_name_by_module_name.iteritems():
+            if stale_modules_name.isdisjoint(contributors_name):
+                assert module_name not in contributors_name_by_module_name, module_name
+                contributors_name_by_module_name[module_name] = contributors_name
+
+    write_julia_file(
+        os.path.join(args.julia_package_dir, 'src', 'input_variables.jl'),
+        u''.join(itertools.chain(
+            [julia_file_header, u'\n'],
+            (
+                u'\n{}\n'.format(julia_source)
+                for julia_source in input_variable_definition_julia_source_by_name.itervalues()
+                ),
+            )),
+        only_if_changed = args.incremental,
+        )
 
-        for module_name, julia_source_by_name in julia_source_by_name_by_module_name.iteritems():
-            julia_relative_path = os.path.join(*module_name.split('.')) + '.jl'
-            julia_path = os.path.join(args.julia_package_dir, 'src', 'formulas', julia_relative_path)
-            julia_dir = os.path.dirname(julia_path)
-            if not os.path.exists(julia_dir):
-                os.makedirs(julia_dir)
-            with codecs.open(julia_path, 'w', encoding = 'utf-8') as julia_file:
-                julia_file.write(julia_file_header)
-                for column_name, julia_source in sorted(julia_source_by_name.iteritems()):
-                    julia_file.write(u'\n')
-                    julia_file.write(julia_source)
+    write_julia_file(
+        os.path.join(args.julia_package_dir, 'src', 'formulas.jl'),
+        u''.join(itertools.chain(
+            [julia_file_header, u'\n\n'],
+            (
+                u'include("formulas/{}.jl")\n'.format(module_name.replace(u'.', u'/'))
+                for module_name in sorted(contributors_name_by_module_name.iterkeys())
+                ),
+            )),
+        only_if_changed = args.incremental,
+        )
+
+    for module_name, julia_source_by_name in julia_source_by_name_by_module_name.iteritems():
+        write_julia_file(
+            get_formulas_julia_path(args.julia_package_dir, module_name),
+            u''.join(itertools.chain(
+                [julia_file_header],
+                (
+                    u'\n{}'.format(julia_source)
+                    for column_name, julia_source in sorted(julia_source_by_name.iteritems())
+                    ),
+                )),
+            only_if_changed = args.incremental,
+            )
+
+    # Store the fingerprints of the modules, with the formula at which the conversion stopped and the modules whose
+    # formulas have not all been converted, for the next incremental conversion.
+    write_manifest(args.julia_package_dir, dict(
+        columns_fingerprint = columns_fingerprint,
+        contributors_name_by_module_name = dict(
+            (module_name, sorted(contributors_name))
+            for module_name, contributors_name in contributors_name_by_module_name.iteritems()
+            ),
+        failed_column_name = columns[failed_column_index].name if failed_column_index is not None else None,
+        format_version = manifest_format_version,
+        global_fingerprint = global_fingerprint,
+        module_fingerprint_by_name = module_fingerprint_by_name,
+        unconverted_modules_name = sorted(
+            module_name
+            for module_name, last_column_index in last_column_index_by_module_name.iteritems()
+            if failed_column_index is not None and last_column_index >= failed_column_index
+            ),
+        ))
 
     return 0
 
 
+def setup_worker(parser_options):
+    global worker_parser_options
+    worker_parser_options = dict(
+        driver = lib2to3.pgen2.driver.Driver(lib2to3.pygram.python_grammar, convert = lib2to3.pytree.convert,
+            logger = log),
+        **parser_options)
+
+
+def write_julia_file(julia_path, julia_source, only_if_changed = False):
+    """Write a Julia file, unless only_if_changed is true and the file already contains this source.
+
+    julia_source is either a string or an iterable of strings, each one being written as soon as it is generated.
+    """
+    if isinstance(julia_source, basestring):
+        julia_source = [julia_source]
+    julia_dir = os.path.dirname(julia_path)
+    if not os.path.exists(julia_dir):
+        os.makedirs(julia_dir)
+    # Write to a temporary file first, to compare it with the existing file without keeping the whole source.
+    temporary_path = julia_path + '.tmp'
+    try:
+        with codecs.open(temporary_path, 'w', encoding = 'utf-8') as julia_file:
+            for julia_source_fragment in julia_source:
+                julia_file.write(julia_source_fragment)
+        if only_if_changed and os.path.exists(julia_path) and filecmp.cmp(temporary_path, julia_path,
+                shallow = False):
+            os.remove(temporary_path)
+            return False
+        os.rename(temporary_path, julia_path)
+    except:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+    return True
+
+
+def write_manifest(julia_package_dir, manifest):
+    manifest_path = os.path.join(julia_package_dir, manifest_filename)
+    with open(manifest_path + '.tmp', 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent = 2, sort_keys = True)
+    os.rename(manifest_path + '.tmp', manifest_path)
+
+
 if __name__ == "__main__":
     sys.exit(main())
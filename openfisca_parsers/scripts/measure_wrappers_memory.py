@@ -0,0 +1,116 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Measure the memory used by wrappers when converting all the formulas of a country package to Julia."""
+
+
+import argparse
+import collections
+import gc
+import importlib
+import logging
+import os
+import resource
+import sys
+
+import lib2to3.pgen2.driver  # , tokenize, token
+import lib2to3.pygram
+import lib2to3.pytree
+from openfisca_core import formulas
+
+from openfisca_parsers import formulas_parsers_2to3
+from openfisca_parsers.scripts import formulas_to_julia
+
+
+app_name = os.path.splitext(os.path.basename(__file__))[0]
+log = logging.getLogger(app_name)
+
+
+def get_peak_rss():
+    """Return the peak resident set size of the current process, in kB."""
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # On Mac OS X, ru_maxrss is given in bytes.
+        peak_rss //= 1024
+    return peak_rss
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument('-c', '--country-package', default = 'openfisca_france',
+        help = u'name of the OpenFisca package to use for country-specific variables & formulas')
+    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
+    args = parser.parse_args()
+    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.WARNING, stream = sys.stdout)
+
+    country_package = importlib.import_module(args.country_package)
+    TaxBenefitSystem = country_package.init_country()
+    tax_benefit_system = TaxBenefitSystem()
+    tax_benefit_system_peak_rss = get_peak_rss()
+
+    parser = formulas_to_julia.Parser(
+        country_package = country_package,
+        driver = lib2to3.pgen2.driver.Driver(lib2to3.pygram.python_grammar, convert = lib2to3.pytree.convert,
+            logger = log),
+        tax_benefit_system = tax_benefit_system,
+        )
+    # Keep the Julia wrappers alive, to measure them too.
+    julia_wrappers = []
+    for column in tax_benefit_system.column_by_name.itervalues():
+        column_formula_class = column.formula_class
+        if issubclass(column_formula_class, formulas.AbstractEntityToEntity) \
+                or issubclass(column_formula_class, formulas.SimpleFormula) and column_formula_class.function is None:
+            continue
+        parser.column = column
+        try:
+            formula_class_wrapper = parser.FormulaClassFileInput.parse(column_formula_class, parser = parser)
+            julia_wrappers.append(formula_class_wrapper.juliaize())
+        except Exception:
+            log.info(u'Skipping formula {} that can not be converted to Julia'.format(column.name))
+
+    gc.collect()
+    count_by_class_name = collections.defaultdict(int)
+    size = 0
+    for item in gc.get_objects():
+        if isinstance(item, formulas_parsers_2to3.AbstractWrapper):
+            count_by_class_name[item.__class__.__name__] += 1
+            size += sys.getsizeof(item)
+            item_dict = getattr(item, '__dict__', None)
+            if item_dict is not None:
+                size += sys.getsizeof(item_dict)
+    peak_rss = get_peak_rss()
+
+    if args.verbose:
+        for class_name, count in sorted(count_by_class_name.iteritems(), key = lambda item: (-item[1], item[0])):
+            print u'{:>10}  {}'.format(count, class_name)
+    print u'Wrappers: {} instances, {} kB'.format(sum(count_by_class_name.itervalues()), size // 1024)
+    print u'Peak RSS: {} kB (including {} kB before parsing formulas)'.format(peak_rss, tax_benefit_system_peak_rss)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""List the variables calculated by formulas, using vectorized queries of a node arena of their modules."""
+
+
+import argparse
+import ast
+import importlib
+import inspect
+import logging
+import os
+import sys
+import time
+
+from openfisca_core import formulas
+
+from openfisca_parsers import frontends, node_arenas
+
+
+app_name = os.path.splitext(os.path.basename(__file__))[0]
+log = logging.getLogger(app_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument('-c', '--country-package', default = 'openfisca_france',
+        help = u'name of the OpenFisca package to use for country-specific variables & formulas')
+    parser.add_argument('-F', '--frontend', choices = frontends.frontends_name, default = 'lib2to3',
+        help = u'parser building the parse trees of modules: lib2to3, or the faster C parser of Python (native)')
+    parser.add_argument('-m', '--method', action = 'append', default = [],
+        help = u'name of a called method (may be repeated, default: calculate & its variants)')
+    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
+    args = parser.parse_args()
+    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.WARNING, stream = sys.stdout)
+
+    country_package = importlib.import_module(args.country_package)
+    TaxBenefitSystem = country_package.init_country()
+    tax_benefit_system = TaxBenefitSystem()
+
+    formula_modules = set(
+        inspect.getmodule(column.formula_class)
+        for column in tax_benefit_system.column_by_name.itervalues()
+        if column.formula_class is not None and issubclass(column.formula_class, formulas.AbstractFormula)
+        )
+    driver = frontends.create_driver(args.frontend, logger = log)
+    node_arena = node_arenas.NodeArena()
+    start = time.time()
+    for module in sorted(formula_modules, key = lambda module: module.__name__):
+        source = inspect.getsource(module)
+        if not source.endswith('\n'):
+            source += '\n'
+        node_arena.add_tree(driver.parse_string(source), key = module.__name__, source = source)
+    log.info(u'Node arena: {} trees, {} nodes, {} bytes, built in {:.3f} s'.format(len(node_arena.tree_roots),
+        node_arena.node_count, node_arena.nbytes, time.time() - start))
+
+    start = time.time()
+    calls_index = node_arena.find_attribute_calls(args.method or ['calculate', 'calculate_add',
+        'calculate_add_divide', 'calculate_divide'])
+    arguments_index = node_arena.get_first_arguments(calls_index)
+    # Keep only the calls whose first argument is a literal string, inside a class.
+    literals = arguments_index >= 0
+    literals[literals] = node_arena.types[arguments_index[literals]] == node_arenas.tokens.STRING
+    calls_index = calls_index[literals]
+    arguments_index = arguments_index[literals]
+    classes_index = node_arena.get_enclosing(calls_index, node_arenas.symbols.classdef)
+    log.info(u'{} calls found in {:.3f} s'.format(len(calls_index), time.time() - start))
+
+    # The name of a class is the leaf following the "class" keyword.
+    classes_name_id = node_arena.value_ids[node_arena.next_siblings[node_arena.first_children[classes_index]]]
+    classes_name_id[classes_index < 0] = -1
+    variables_name_by_class_name = {}
+    for class_name_id, argument_index in zip(classes_name_id, arguments_index):
+        if class_name_id < 0:
+            continue
+        variables_name_by_class_name.setdefault(node_arena.strings[class_name_id], set()).add(
+            ast.literal_eval(node_arena.strings[node_arena.value_ids[argument_index]]))
+    for class_name, variables_name in sorted(variables_name_by_class_name.iteritems()):
+        print u'{}: {}'.format(class_name, u', '.join(sorted(variables_name)))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
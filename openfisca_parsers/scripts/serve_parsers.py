@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""Serve the results of parsers over HTTP from a long-lived process, updating them when source files change.
+
+Queries (answered in JSON, except /julia that is answered in Julia):
+- GET /input-variables?name=VARIABLE
+- GET /source-formulas?name=VARIABLE[&name=VARIABLE...]
+- GET /impacts?parameter=PATH&name=VARIABLE (each argument may be repeated or omitted)
+- GET /julia?name=VARIABLE
+- GET /status
+"""
+
+
+import argparse
+import BaseHTTPServer
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+import traceback
+import urlparse
+
+from openfisca_parsers import servers
+
+
+app_name = os.path.splitext(os.path.basename(__file__))[0]
+log = logging.getLogger(app_name)
+
+
+class ParsersRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    def do_GET(self):
+        warm_parsers = self.server.warm_parsers
+        url = urlparse.urlparse(self.path)
+        arguments = urlparse.parse_qs(url.query)
+        try:
+            warm_parsers.check_sources()
+        except servers.RestartRequired as exception:
+            log.warning(u'{}: Restarting'.format(exception))
+            self.respond_json(dict(error = unicode(exception), restarting = True), status = 503)
+            self.server.restart_required = True
+            return
+        names = [
+            name.decode('utf-8')
+            for name in arguments.get('name', [])
+            ]
+        unknown_names = [
+            name
+            for name in names
+            if name not in warm_parsers.tax_benefit_system.column_by_name
+            ]
+        if unknown_names:
+            self.respond_json(dict(error = u'Unknown variables: {}'.format(u', '.join(unknown_names))), status = 404)
+            return
+        start_time = time.time()
+        try:
+            if url.path == '/impacts':
+                parameters = [
+                    parameter.decode('utf-8')
+                    for parameter in arguments.get('parameter', [])
+                    ]
+                data = dict(formulas = sorted(warm_parsers.get_impacted_formulas(parameters = parameters,
+                    variables = names)))
+            elif url.path == '/input-variables':
+                if len(names) != 1:
+                    self.respond_json(dict(error = u'A single name is required'), status = 400)
+                    return
+                input_variables, parameters, parse_failed = warm_parsers.get_input_variables_result(names[0])[:3]
+                data = dict(
+                    input_variables = sorted(input_variables) if input_variables is not None else None,
+                    name = names[0],
+                    parameters = sorted(parameters) if parameters is not None else None,
+                    status = u'input' if input_variables is None else u'failed' if parse_failed else u'ok',
+                    )
+            elif url.path == '/julia':
+                if len(names) != 1:
+                    self.respond_json(dict(error = u'A single name is required'), status = 400)
+                    return
+                self.respond(warm_parsers.get_julia_source(names[0]), 'text/plain; charset=utf-8')
+                return
+            elif url.path == '/source-formulas':
+                data = dict(
+                    (name, sorted(source_formulas))
+                    for name, source_formulas in warm_parsers.get_source_formulas_by_name(names).iteritems()
+                    )
+            elif url.path == '/status':
+                data = dict(
+                    input_variables_results = len(warm_parsers.input_variables_result_by_name),
+                    julia_results = len(warm_parsers.julia_result_by_name),
+                    source_formulas_results = len(warm_parsers.dependency_graph.source_formulas_by_name),
+                    watched_files = len(warm_parsers.watcher.mtime_by_path),
+                    )
+            else:
+                self.respond_json(dict(error = u'Unknown query: {}'.format(url.path)), status = 404)
+                return
+        except Exception:
+            log.exception(u'Query {} failed'.format(self.path))
+            self.respond_json(dict(error = traceback.format_exc().decode('utf-8')), status = 500)
+            return
+        log.info(u'Answered {} in {:.3f} s'.format(self.path, time.time() - start_time))
+        self.respond_json(data)
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+    def respond(self, body, content_type, status = 200):
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def respond_json(self, data, status = 200):
+        self.respond(unicode(json.dumps(data, ensure_ascii = False, indent = 2, sort_keys = True)),
+            'application/json; charset=utf-8', status = status)
+
+
+class ParsersServer(BaseHTTPServer.HTTPServer):
+    restart_required = False
+    warm_parsers = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-a', '--address', default = 'localhost',
+        help = u'address to listen to (default: localhost)')
+    parser.add_argument('-c', '--country-package', default = 'openfisca_france',
+        help = u'name of the OpenFisca package to use for country-specific variables & formulas')
+    parser.add_argument('-p', '--port', default = 2015, type = int, help = u'port to listen to (default: 2015)')
+    parser.add_argument('-v', '--verbose', action = 'store_true', default = False, help = "increase output verbosity")
+    args = parser.parse_args()
+    logging.basicConfig(level = logging.DEBUG if args.verbose else logging.INFO, stream = sys.stderr)
+
+    country_package = importlib.import_module(args.country_package)
+    TaxBenefitSystem = country_package.init_country()
+    tax_benefit_system = TaxBenefitSystem()
+
+    server = ParsersServer((args.address, args.port), ParsersRequestHandler)
+    server.warm_parsers = servers.WarmParsers(country_package, tax_benefit_system)
+    log.info(u'Serving {} on http://{}:{}/'.format(args.country_package, args.address, args.port))
+    try:
+        while not server.restart_required:
+            server.handle_request()
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        server.server_close()
+    # The country package must be imported again: Replace this process by a new one.
+    os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+
+"""Long-lived parsers, keeping their parse trees & results warm and invalidating them when source files change"""
+
+
+import ast
+import inspect
+import lib2to3.pgen2.driver
+import lib2to3.pygram
+import lib2to3.pytree
+import linecache
+import logging
+import os
+import StringIO
+import sys
+
+from . import impacts, input_variables_extractors, source_formulas_extractors
+
+
+log = logging.getLogger(__name__)
+
+
+class RestartRequired(Exception):
+    """Raised when source files changed in a way that requires to import the country package again"""
+    pass
+
+
+class UsedModulesMixin(object):
+    """Mixin recording the Python modules whose wrappers have been used to parse the last column"""
+    used_modules_name = None
+
+    def get_used_modules_name(self, column):
+        modules_name = set([inspect.getmodule(column.formula_class).__name__])
+        if self.used_modules_name is not None:
+            modules_name.update(self.used_modules_name)
+            self.used_modules_name = None
+        return modules_name
+
+    def reset_modules(self):
+        self.used_modules_name = set(self.python_module_by_name)
+        super(UsedModulesMixin, self).reset_modules()
+
+
+class InputVariablesParser(UsedModulesMixin, input_variables_extractors.Parser):
+    pass
+
+
+class SourceFormulasParser(UsedModulesMixin, source_formulas_extractors.Parser):
+    modules_name_by_name = None
+
+    def __init__(self, **kwargs):
+        super(SourceFormulasParser, self).__init__(**kwargs)
+        self.modules_name_by_name = {}
+
+    def get_source_formulas(self, column):
+        source_formulas = super(SourceFormulasParser, self).get_source_formulas(column)
+        self.modules_name_by_name[column.name] = self.get_used_modules_name(column)
+        return source_formulas
+
+
+class SourceWatcher(object):
+    """Polling of the modification times of the Python files of a directory tree"""
+    directory = None
+    mtime_by_path = None
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.mtime_by_path = self.scan()
+
+    def poll(self):
+        """Return the paths of the Python files that have been modified, added or removed since the last poll."""
+        mtime_by_path = self.scan()
+        changed_paths = set(
+            path
+            for path in set(mtime_by_path).union(self.mtime_by_path)
+            if mtime_by_path.get(path) != self.mtime_by_path.get(path)
+            )
+        self.mtime_by_path = mtime_by_path
+        return changed_paths
+
+    def scan(self):
+        mtime_by_path = {}
+        for dir_path, dirs_name, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.endswith('.py'):
+                    path = os.path.join(dir_path, filename)
+                    try:
+                        mtime_by_path[path] = os.stat(path).st_mtime
+                    except OSError:
+                        # File removed during the scan
+                        pass
+        return mtime_by_path
+
+
+class WarmParsers(object):
+    """Parsers of a country package, answering queries from cached results
+
+    Parse trees and results are kept from one query to the next. When source files of the country package change, only
+    the parse trees of their modules and the results that used these modules are forgotten.
+
+    The Python modules of the country package are not imported again, so changes that modify the variables themselves
+    (adding, removing or renaming classes and functions) raise RestartRequired.
+    """
+    country_package = None
+    definitions_name_by_path = None  # Names of the top-level classes & functions of each watched file
+    dependency_graph = None
+    impact_index = None
+    input_variables_parser = None
+    input_variables_result_by_name = None  # (input_variables, parameters, parse_failed, modules_name) by variable
+    julia_parser = None
+    julia_result_by_name = None  # (Julia source, modules_name) by variable
+    source_formulas_parser = None
+    tax_benefit_system = None
+    watcher = None
+
+    def __init__(self, country_package, tax_benefit_system):
+        self.country_package = country_package
+        self.tax_benefit_system = tax_benefit_system
+        self.input_variables_parser = InputVariablesParser(driver = create_driver(), parse_whole_modules = True,
+            tax_benefit_system = tax_benefit_system)
+        self.input_variables_result_by_name = {}
+        self.julia_result_by_name = {}
+        self.source_formulas_parser = SourceFormulasParser(driver = create_driver(), parse_whole_modules = True,
+            tax_benefit_system = tax_benefit_system)
+        self.dependency_graph = source_formulas_extractors.DependencyGraph(tax_benefit_system,
+            extractor = self.source_formulas_parser)
+        self.watcher = SourceWatcher(os.path.dirname(country_package.__file__))
+        self.definitions_name_by_path = dict(
+            (path, get_definitions_name(path))
+            for path in self.watcher.mtime_by_path
+            )
+
+    def check_sources(self):
+        """Forget the parse trees & results that depend on the modified source files.
+
+        Return the names of the modules that have been modified.
+        """
+        changed_paths = self.watcher.poll()
+        if not changed_paths:
+            return set()
+        module_by_path = dict(
+            (os.path.splitext(module.__file__)[0] + '.py', module)
+            for module_name, module in sys.modules.items()
+            if module is not None and module_name.split('.')[0] == self.country_package.__name__
+                and getattr(module, '__file__', None) is not None
+            )
+        changed_modules_name = set()
+        for path in sorted(changed_paths):
+            module = module_by_path.get(path)
+            if module is None:
+                if not os.path.exists(path) or path.endswith('__init__.py'):
+                    raise RestartRequired(u'Module {} has been added or removed'.format(path))
+                # A file that has never been imported can't be used by formulas.
+                continue
+            if not os.path.exists(path):
+                raise RestartRequired(u'Module {} has been removed'.format(module.__name__))
+            definitions_name = get_definitions_name(path)
+            if definitions_name is not None:
+                # Else the file is being edited and has a syntax error: Its formulas will fail to parse until it is
+                # fixed.
+                if definitions_name != self.definitions_name_by_path.get(path):
+                    raise RestartRequired(u'Classes or functions of module {} have changed'.format(module.__name__))
+            # Sources are read through linecache (by inspect), that doesn't notice modifications.
+            linecache.checkcache(path)
+            changed_modules_name.add(module.__name__)
+        if changed_modules_name:
+            log.info(u'Modules changed: {}'.format(u', '.join(sorted(changed_modules_name))))
+            self.invalidate(changed_modules_name)
+        return changed_modules_name
+
+    def get_impacted_formulas(self, parameters = None, variables = None):
+        if self.impact_index is None:
+            self.impact_index = impacts.ImpactIndex(self.tax_benefit_system, extractor = self)
+        return self.impact_index.get_impacted_formulas(parameters = parameters, variables = variables)
+
+    def get_input_variables_and_parameters(self, column):
+        return self.get_input_variables_result(column.name)[:2]
+
+    def get_input_variables_result(self, name):
+        """Return the input variables, the parameters and the parsing failure of the formula of a variable."""
+        result = self.input_variables_result_by_name.get(name)
+        if result is None:
+            column = self.tax_benefit_system.column_by_name[name]
+            parser = self.input_variables_parser
+            input_variables, parameters = parser.get_input_variables_and_parameters(column)
+            self.input_variables_result_by_name[name] = result = (input_variables, parameters, parser.parse_failed,
+                parser.get_used_modules_name(column))
+        return result
+
+    def get_julia_source(self, name):
+        """Return the Julia source of the formula of a variable and of the functions it calls."""
+        from .scripts import formulas_to_julia
+
+        result = self.julia_result_by_name.get(name)
+        if result is None:
+            column = self.tax_benefit_system.column_by_name[name]
+            parser = self.julia_parser
+            if parser is None:
+                self.julia_parser = parser = formulas_to_julia.Parser(country_package = self.country_package,
+                    driver = create_driver(), parse_whole_modules = True, tax_benefit_system = self.tax_benefit_system)
+            parser.non_formula_function_by_name.clear()
+            parser.python_module_by_name.clear()
+            stdout = sys.stdout
+            sys.stdout = output = StringIO.StringIO()
+            try:
+                (input_variable_definition_julia_source_by_name, julia_source_by_name_by_module_name,
+                    contributors_name_by_module_name, failed_column_index) = formulas_to_julia.convert_columns([column],
+                    parser = parser)
+            finally:
+                sys.stdout = stdout
+            assert failed_column_index is None, u'Conversion of {} to Julia failed:\n{}'.format(name,
+                output.getvalue().decode('utf-8'))
+            julia_sources = list(input_variable_definition_julia_source_by_name.itervalues())
+            for module_name, julia_source_by_name in sorted(julia_source_by_name_by_module_name.iteritems()):
+                julia_sources.extend(
+                    julia_source
+                    for function_name, julia_source in sorted(julia_source_by_name.iteritems())
+                    )
+            modules_name = set(parser.python_module_by_name)
+            modules_name.add(inspect.getmodule(column.formula_class).__name__)
+            self.julia_result_by_name[name] = result = (u'\n'.join(julia_sources), modules_name)
+        return result[0]
+
+    def get_source_formulas_by_name(self, names):
+        return self.dependency_graph.get_transitive_source_formulas_by_name(names)
+
+    def invalidate(self, modules_name):
+        """Forget the parse trees of the given modules and the results that used them."""
+        for parser in (self.input_variables_parser, self.julia_parser, self.source_formulas_parser):
+            if parser is None:
+                continue
+            for module_name in modules_name:
+                parser.definition_node_by_line_number_by_module_name.pop(module_name, None)
+                parser.definition_node_by_name_by_module_name.pop(module_name, None)
+                parser.module_node_by_name.pop(module_name, None)
+            # Module wrappers are cheap to build again, but functions of a modified module may be referenced by the
+            # wrappers of other modules.
+            parser.python_module_by_name.clear()
+
+        for result_by_name in (self.input_variables_result_by_name, self.julia_result_by_name):
+            for name, result in result_by_name.items():
+                if not modules_name.isdisjoint(result[-1]):
+                    del result_by_name[name]
+        self.impact_index = None
+
+        dependency_graph = self.dependency_graph
+        source_modules_name_by_name = self.source_formulas_parser.modules_name_by_name
+        for name, source_modules_name in source_modules_name_by_name.items():
+            if not modules_name.isdisjoint(source_modules_name):
+                dependency_graph.source_formulas_by_name.pop(name, None)
+                del source_modules_name_by_name[name]
+        dependency_graph.dependents_name_by_name = None
+        dependency_graph.topological_names = None
+        dependency_graph.transitive_dependents_by_name.clear()
+        dependency_graph.transitive_source_formulas_by_name.clear()
+
+
+def create_driver():
+    return lib2to3.pgen2.driver.Driver(lib2to3.pygram.python_grammar, convert = lib2to3.pytree.convert, logger = log)
+
+
+def get_definitions_name(path):
+    """Return the names of the classes & functions defined at the top level of a Python source file.
+
+    Return None when the file has a syntax error.
+    """
+    with open(path) as source_file:
+        source = source_file.read()
+    try:
+        tree = ast.parse(source, path)
+    except SyntaxError:
+        return None
+    return frozenset(
+        node.name
+        for node in tree.body
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef))
+        )
+
@@ -26,16 +26,15 @@
 """Extract input variables from Python formulas using lib2to3."""
 
 
-import lib2to3.pgen2.driver
-import lib2to3.pygram
-import lib2to3.pytree
 import logging
+import weakref
 
 from openfisca_core import formulas
 
-from . import formulas_parsers_2to3
+from . import formulas_parsers_2to3, frontends
 
 
+dependency_graph_by_tax_benefit_system = weakref.WeakKeyDictionary()
 log = logging.getLogger(__name__)
 
 
@@ -68,7 +67,201 @@ class Call(formulas_parsers_2to3.Call):
                 if input_variable_name is not None:
                     parser.source_formulas.add(input_variable_name)
                     return
-            assert False, "Unexpected class for input variable: {}".format(input_variable)
+            raise formulas_parsers_2to3.ParseError("Unexpected class for input variable: {}".format(input_variable))
+
+
+class DependencyGraph(object):
+    """Graph of the dependencies between the variables of a tax-benefit system
+
+    The source formulas of each variable are extracted once, at the first query that needs them, and the answers to
+    transitive queries are cached.
+    """
+    dependents_name_by_name = None  # Reverse adjacency lists, built when the whole graph is known
+    extractor = None
+    source_formulas_by_name = None  # Adjacency lists: direct source formulas of each variable (None = input variable)
+    tax_benefit_system = None
+    topological_names = None
+    transitive_dependents_by_name = None
+    transitive_source_formulas_by_name = None
+
+    def __init__(self, tax_benefit_system, extractor = None, source_formulas_by_name = None):
+        """Create a graph whose source formulas are extracted by extractor, unless they are given by name."""
+        self.tax_benefit_system = tax_benefit_system
+        if source_formulas_by_name is None:
+            self.extractor = extractor if extractor is not None else setup(tax_benefit_system)
+            self.source_formulas_by_name = {}
+        else:
+            self.extractor = extractor
+            self.source_formulas_by_name = source_formulas_by_name
+        self.transitive_dependents_by_name = {}
+        self.transitive_source_formulas_by_name = {}
+
+    def build(self):
+        """Extract the source formulas of every variable and index the reverse dependencies."""
+        if self.dependents_name_by_name is not None:
+            return self
+        dependents_name_by_name = dict(
+            (name, set())
+            for name in self.tax_benefit_system.column_by_name
+            )
+        for name in self.tax_benefit_system.column_by_name:
+            source_formulas = self.get_source_formulas(name)
+            if source_formulas is not None:
+                for source_name in source_formulas:
+                    dependents_name_by_name.setdefault(source_name, set()).add(name)
+        self.dependents_name_by_name = dict(
+            (name, frozenset(dependents_name))
+            for name, dependents_name in dependents_name_by_name.iteritems()
+            )
+        return self
+
+    def get_dependents(self, name):
+        """Return the names of the variables whose formulas directly use the given variable."""
+        self.build()
+        return self.dependents_name_by_name.get(name, frozenset())
+
+    def get_source_formulas(self, name):
+        """Return the names of the variables directly used by the formula of a variable (None for input variables)."""
+        try:
+            return self.source_formulas_by_name[name]
+        except KeyError:
+            pass
+        source_formulas = self.extractor.get_source_formulas(self.tax_benefit_system.column_by_name[name])
+        if source_formulas is not None:
+            source_formulas = frozenset(source_formulas)
+        self.source_formulas_by_name[name] = source_formulas
+        return source_formulas
+
+    def get_topological_names(self):
+        """Return the names of all the variables, each one after the variables its formula uses.
+
+        Variables that belong to a cycle (for example formulas using their own value for a previous period) are ordered
+        by a depth-first traversal of the cycle.
+        """
+        if self.topological_names is None:
+            topological_names = []
+            visited_names = set()
+            for root_name in sorted(self.tax_benefit_system.column_by_name):
+                if root_name in visited_names:
+                    continue
+                visited_names.add(root_name)
+                stack = [(root_name, iter(sorted(self.get_source_formulas(root_name) or ())))]
+                while stack:
+                    name, source_names_iterator = stack[-1]
+                    for source_name in source_names_iterator:
+                        if source_name not in visited_names:
+                            visited_names.add(source_name)
+                            stack.append((source_name, iter(sorted(self.get_source_formulas(source_name) or ()))))
+                            break
+                    else:
+                        stack.pop()
+                        topological_names.append(name)
+            self.topological_names = topological_names
+        return self.topological_names
+
+    def get_transitive_dependents(self, name):
+        """Return the names of the formulas that use the given variable, directly or not."""
+        transitive_dependents = self.transitive_dependents_by_name.get(name)
+        if transitive_dependents is None:
+            self.build()
+            transitive_dependents = set()
+            remaining_names = [name]
+            while remaining_names:
+                for dependent_name in self.dependents_name_by_name.get(remaining_names.pop(), ()):
+                    if dependent_name not in transitive_dependents:
+                        transitive_dependents.add(dependent_name)
+                        remaining_names.append(dependent_name)
+            self.transitive_dependents_by_name[name] = transitive_dependents = frozenset(transitive_dependents)
+        return transitive_dependents
+
+    def get_transitive_source_formulas(self, name):
+        """Return the names of the formulas used, directly or not, by the formula of a variable (including itself).
+
+        Input variables are not included.
+        """
+        transitive_source_formulas = self.transitive_source_formulas_by_name.get(name)
+        if transitive_source_formulas is None:
+            transitive_source_formulas = set()
+            remaining_names = set([name])
+            while remaining_names:
+                remaining_name = remaining_names.pop()
+                cached_source_formulas = self.transitive_source_formulas_by_name.get(remaining_name)
+                if cached_source_formulas is not None:
+                    # The cached closure is complete: No need to walk through it again.
+                    transitive_source_formulas.update(cached_source_formulas)
+                    continue
+                source_formulas = self.get_source_formulas(remaining_name)
+                if source_formulas is not None:
+                    transitive_source_formulas.add(remaining_name)
+                    for source_name in source_formulas:
+                        if source_name not in transitive_source_formulas:
+                            remaining_names.add(source_name)
+            self.transitive_source_formulas_by_name[name] = transitive_source_formulas = frozenset(
+                transitive_source_formulas)
+        return transitive_source_formulas
+
+    def get_transitive_source_formulas_by_name(self, names):
+        """Return the transitive source formulas (see get_transitive_source_formulas) of each given variable.
+
+        The variables reachable from the given ones are visited once, in a single depth-first traversal that computes
+        the closure of each strongly connected component from the closures of the components it uses. So every visited
+        variable gets its closure cached, and the variables of a cycle share the same frozenset.
+        """
+        closure_by_name = self.transitive_source_formulas_by_name
+        index_by_name = {}
+        low_link_by_name = {}
+        component_stack = []
+        component_names = set()  # Names in component_stack
+        for root_name in names:
+            if root_name in closure_by_name or root_name in index_by_name:
+                continue
+            index_by_name[root_name] = low_link_by_name[root_name] = len(index_by_name)
+            component_stack.append(root_name)
+            component_names.add(root_name)
+            stack = [(root_name, iter(self.get_source_formulas(root_name) or ()))]
+            while stack:
+                name, source_names_iterator = stack[-1]
+                for source_name in source_names_iterator:
+                    if source_name in closure_by_name:
+                        continue
+                    if source_name not in index_by_name:
+                        index_by_name[source_name] = low_link_by_name[source_name] = len(index_by_name)
+                        component_stack.append(source_name)
+                        component_names.add(source_name)
+                        stack.append((source_name, iter(self.get_source_formulas(source_name) or ())))
+                        break
+                    if source_name in component_names:
+                        low_link_by_name[name] = min(low_link_by_name[name], index_by_name[source_name])
+                else:
+                    stack.pop()
+                    if stack:
+                        parent_name = stack[-1][0]
+                        low_link_by_name[parent_name] = min(low_link_by_name[parent_name], low_link_by_name[name])
+                    if low_link_by_name[name] == index_by_name[name]:
+                        # name is the root of a strongly connected component: Its closure is complete.
+                        component = []
+                        while True:
+                            component_name = component_stack.pop()
+                            component_names.remove(component_name)
+                            component.append(component_name)
+                            if component_name == name:
+                                break
+                        closure = set()
+                        for component_name in component:
+                            source_formulas = self.get_source_formulas(component_name)
+                            if source_formulas is not None:
+                                closure.add(component_name)
+                                for source_name in source_formulas:
+                                    source_closure = closure_by_name.get(source_name)
+                                    if source_closure is not None:
+                                        closure.update(source_closure)
+                        closure = frozenset(closure)
+                        for component_name in component:
+                            closure_by_name[component_name] = closure
+        return dict(
+            (name, closure_by_name[name])
+            for name in names
+            )
 
 
 class Parser(formulas_parsers_2to3.Parser):
@@ -86,35 +279,41 @@ class Parser(formulas_parsers_2to3.Parser):
         self.source_formulas = source_formulas = set()
         try:
             self.FormulaClassFileInput.parse(formula_class, parser = self)
-        except AssertionError:
+        except formulas_parsers_2to3.ParseError:
             # When parsing fails, assume that all input variables have already been parsed.
             pass
         del self.column
         del self.source_formulas
-        self.python_module_by_name.clear()
+        self.reset_modules()
         return source_formulas
 
 
 def extract_source_formulas(tax_benefit_system, name):
-    extractor = setup(tax_benefit_system)
-
-    source_formulas = set()
-    remaining_names = set([name])
-    while remaining_names:
-        name = remaining_names.pop()
-        column = tax_benefit_system.column_by_name[name]
-        new_names = extractor.get_source_formulas(column)
-        if new_names is not None:
-            source_formulas.add(name)
-            for new_name in new_names:
-                if new_name not in source_formulas:
-                    remaining_names.add(new_name)
-    return source_formulas
-
-
-def setup(tax_benefit_system):
+    return set(get_dependency_graph(tax_benefit_system).get_transitive_source_formulas(name))
+
+
+def extract_source_formulas_by_name(tax_benefit_system, names):
+    """Return the source formulas of many variables at once, as frozensets shared between the variables of a cycle."""
+    return get_dependency_graph(tax_benefit_system).get_transitive_source_formulas_by_name(names)
+
+
+def get_dependency_graph(tax_benefit_system):
+    """Return the dependency graph of a tax-benefit system, creating it at the first call."""
+    dependency_graph = dependency_graph_by_tax_benefit_system.get(tax_benefit_system)
+    if dependency_graph is None:
+        dependency_graph_by_tax_benefit_system[tax_benefit_system] = dependency_graph = DependencyGraph(
+            tax_benefit_system)
+    return dependency_graph
+
+
+def setup(tax_benefit_system, frontend = 'lib2to3', parse_trees_cache = None, parse_whole_modules = False,
+        profiler = None, retain_modules = False, validate = True):
     return Parser(
-        driver = lib2to3.pgen2.driver.Driver(lib2to3.pygram.python_grammar, convert = lib2to3.pytree.convert,
-            logger = log),
+        driver = frontends.create_driver(frontend, logger = log),
+        parse_trees_cache = parse_trees_cache,
+        parse_whole_modules = parse_whole_modules,
+        profiler = profiler,
+        retain_modules = retain_modules,
         tax_benefit_system = tax_benefit_system,
+        validate = validate,
         )
@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+
+
+# OpenFisca -- A versatile microsimulation software
+# By: OpenFisca Team <contact@openfisca.fr>
+#
+# Copyright (C) 2011, 2012, 2013, 2014, 2015 OpenFisca Team
+# https://github.com/openfisca
+#
+# This file is part of OpenFisca.
+#
+# OpenFisca is free software; you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# OpenFisca is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Generator of synthetic country packages, used as fixtures by benchmarks"""
+
+
+import codecs
+import collections
+import itertools
+import json
+import os
+import random
+import textwrap
+
+
+country_package_init_source = textwrap.dedent(u"""\
+    # -*- coding: utf-8 -*-
+
+    \"\"\"Synthetic country package generated by openfisca_parsers.synthetic_countries\"\"\"
+
+
+    import json
+    import os
+
+
+    COUNTRY_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+    def init_country():
+        from openfisca_core.taxbenefitsystems import AbstractTaxBenefitSystem
+
+        from . import entities
+        from . import model  # Load formulas into entities. # noqa analysis:ignore
+
+        with open(os.path.join(COUNTRY_DIR, 'legislation.json')) as legislation_file:
+            legislation_json = json.load(legislation_file)
+
+        class TaxBenefitSystem(AbstractTaxBenefitSystem):
+            entity_class_by_key_plural = dict(
+                (entity_class.key_plural, entity_class)
+                for entity_class in entities.entity_class_by_symbol.itervalues()
+                )
+
+            def __init__(self):
+                super(TaxBenefitSystem, self).__init__(legislation_json = legislation_json)
+
+        return TaxBenefitSystem
+    """)
+entities_source = textwrap.dedent(u"""\
+    # -*- coding: utf-8 -*-
+
+
+    import collections
+
+    from openfisca_core.entities import AbstractEntity
+
+
+    class Familles(AbstractEntity):
+        column_by_name = collections.OrderedDict()
+        index_for_person_variable_name = 'idfam'
+        key_plural = 'familles'
+        key_singular = 'famille'
+        label = u'Famille'
+        max_cardinality_by_role_key = {'parents': 2}
+        role_for_person_variable_name = 'quifam'
+        roles_key = ['parents', 'enfants']
+        label_by_role_key = {
+            'enfants': u'Enfants',
+            'parents': u'Parents',
+            }
+        symbol = 'fam'
+
+
+    class Individus(AbstractEntity):
+        column_by_name = collections.OrderedDict()
+        is_persons_entity = True
+        key_plural = 'individus'
+        key_singular = 'individu'
+        label = u'Personne'
+        symbol = 'ind'
+
+
+    entity_class_by_symbol = dict(
+        fam = Familles,
+        ind = Individus,
+        )
+    """)
+model_base_source = textwrap.dedent(u"""\
+    # -*- coding: utf-8 -*-
+
+
+    from datetime import date
+
+    from openfisca_core.columns import BoolCol, FloatCol, IntCol
+    from openfisca_core.formulas import (dated_function, DatedFormulaColumn, make_reference_formula_decorator,
+        PersonToEntityColumn, reference_input_variable, SimpleFormulaColumn)
+
+    from ..entities import entity_class_by_symbol, Familles, Individus
+
+
+    __all__ = [
+        'BoolCol',
+        'date',
+        'dated_function',
+        'DatedFormulaColumn',
+        'Familles',
+        'FloatCol',
+        'Individus',
+        'IntCol',
+        'PersonToEntityColumn',
+        'reference_formula',
+        'reference_input_variable',
+        'SimpleFormulaColumn',
+        ]
+
+
+    reference_formula = make_reference_formula_decorator(entity_class_by_symbol = entity_class_by_symbol)
+    """)
+module_header_source = textwrap.dedent(u"""\
+    # -*- coding: utf-8 -*-
+
+    from __future__ import division
+
+    from numpy import maximum as max_, minimum as min_
+
+    from .base import *  # noqa analysis:ignore
+    """)
+
+
+def generate_country_package(directory, package_name = 'openfisca_synthetic', formulas_count = 200,
+        helpers_count = 20, input_variables_count = 50, modules_count = 10, parameters_count = 100, seed = 0):
+    """Write a synthetic country package in directory and return its path.
+
+    The package has two entities, input variables, formulas spread in modules (using variables defined before them,
+    legislation parameters, tax scales & helper functions) and a legislation JSON file.
+    """
+    assert formulas_count >= modules_count >= 1, (formulas_count, modules_count)
+    assert input_variables_count >= 2, input_variables_count
+    assert parameters_count >= 1, parameters_count
+    generator = random.Random(seed)
+    package_dir = os.path.join(directory, package_name)
+    model_dir = os.path.join(package_dir, 'model')
+    if not os.path.exists(model_dir):
+        os.makedirs(model_dir)
+
+    # Legislation: parameters grouped in branches, with a tax scale in each branch.
+    branches_count = max(1, parameters_count // 10)
+    parameters_path = []
+    branch_json_by_name = collections.OrderedDict()
+    for branch_index in range(branches_count):
+        children_json = collections.OrderedDict()
+        for parameter_index in range(branch_index, parameters_count, branches_count):
+            parameter_name = u'param_{}'.format(parameter_index)
+            children_json[parameter_name] = collections.OrderedDict((
+                ('@type', u'Parameter'),
+                ('description', u'Synthetic parameter {}'.format(parameter_index)),
+                ('format', u'rate' if parameter_index % 2 else u'float'),
+                ('values', [
+                    dict(start = u'{}-01-01'.format(year), stop = u'{}-12-31'.format(year),
+                        value = round(generator.uniform(0, 1), 4))
+                    for year in reversed(range(2010, 2016))
+                    ]),
+                ))
+            parameters_path.append((u'branch_{}'.format(branch_index), parameter_name))
+        children_json[u'bareme'] = collections.OrderedDict((
+            ('@type', u'Scale'),
+            ('brackets', [
+                dict(
+                    rate = [dict(start = u'2010-01-01', stop = u'2015-12-31', value = rate)],
+                    threshold = [dict(start = u'2010-01-01', stop = u'2015-12-31', value = threshold)],
+                    )
+                for threshold, rate in ((0, 0.0), (10000, 0.1), (25000, 0.3))
+                ]),
+            ('description', u'Synthetic tax scale {}'.format(branch_index)),
+            ))
+        branch_json_by_name[u'branch_{}'.format(branch_index)] = collections.OrderedDict((
+            ('@type', u'Node'),
+            ('children', children_json),
+            ('description', u'Synthetic branch {}'.format(branch_index)),
+            ))
+    legislation_json = collections.OrderedDict((
+        ('@type', u'Node'),
+        ('children', branch_json_by_name),
+        ('description', u'Synthetic legislation'),
+        ('start', u'2010-01-01'),
+        ('stop', u'2015-12-31'),
+        ))
+    with open(os.path.join(package_dir, 'legislation.json'), 'w') as legislation_file:
+        json.dump(legislation_json, legislation_file, indent = 2)
+
+    write_source(os.path.join(package_dir, '__init__.py'), country_package_init_source)
+    write_source(os.path.join(package_dir, 'entities.py'), entities_source)
+    write_source(os.path.join(model_dir, 'base.py'), model_base_source)
+
+    # Input variables
+    input_variables_source = [module_header_source]
+    input_variables_source.append(textwrap.dedent(u"""\
+
+
+        reference_input_variable(
+            column = IntCol,
+            entity_class = Individus,
+            is_permanent = True,
+            label = u"Identifiant de la famille",
+            name = 'idfam',
+            )
+
+
+        reference_input_variable(
+            column = IntCol,
+            entity_class = Individus,
+            is_permanent = True,
+            label = u"Rôle dans la famille",
+            name = 'quifam',
+            )
+        """))
+    individu_variables_name = []
+    for input_variable_index in range(input_variables_count):
+        name = u'input_{}'.format(input_variable_index)
+        input_variables_source.append(textwrap.dedent(u"""\
+
+
+            reference_input_variable(
+                column = FloatCol,
+                entity_class = Individus,
+                label = u"Synthetic input variable {index}",
+                name = '{name}',
+                )
+            """).format(index = input_variable_index, name = name))
+        individu_variables_name.append(name)
+    write_source(os.path.join(model_dir, 'input_variables.py'), u''.join(input_variables_source))
+
+    # Formulas
+    famille_variables_name = []
+    formulas_count_by_module_index = [
+        formulas_count // modules_count + (1 if module_index < formulas_count % modules_count else 0)
+        for module_index in range(modules_count)
+        ]
+    formula_index = 0
+    for module_index, module_formulas_count in enumerate(formulas_count_by_module_index):
+        module_source = [module_header_source]
+        module_helpers_name = []
+        module_variables_name = set()  # Formulas of the module that can be referenced by aggregations
+        for helper_index in range(module_index, helpers_count, modules_count):
+            helper_name = u'helper_{}'.format(helper_index)
+            module_source.append(textwrap.dedent(u"""\
+
+
+                def {name}(base, rate):
+                    return max_(base - {threshold}, 0) * rate
+                """).format(name = helper_name, threshold = generator.randint(0, 1000)))
+            module_helpers_name.append(helper_name)
+        for _ in range(module_formulas_count):
+            name = u'formula_{}'.format(formula_index)
+            kind = formula_index % 5 if famille_variables_name or formula_index % 5 != 4 else 0
+            variable_a, variable_b = generator.sample(individu_variables_name, 2)
+            branch_name, parameter_name = generator.choice(parameters_path)
+            other_parameter_name = generator.choice([
+                path_parameter_name
+                for path_branch_name, path_parameter_name in parameters_path
+                if path_branch_name == branch_name
+                ])
+            if kind == 0:
+                # Simple formula using parameters & a helper function
+                helper_call = u'{}({}, law.{})'.format(generator.choice(module_helpers_name), variable_b,
+                    other_parameter_name) if module_helpers_name else u'{} * law.{}'.format(variable_b,
+                    other_parameter_name)
+                formula_source = textwrap.dedent(u"""\
+
+
+                    @reference_formula
+                    class {name}(SimpleFormulaColumn):
+                        column = FloatCol
+                        entity_class = Individus
+                        label = u"Synthetic formula {index}"
+
+                        def function(self, simulation, period):
+                            period = period.start.offset('first-of', 'month').period('month')
+                            {variable_a} = simulation.calculate('{variable_a}', period)
+                            {variable_b} = simulation.calculate('{variable_b}', period)
+                            law = simulation.legislation_at(period.start).{branch}
+
+                            return period, max_({variable_a} * law.{parameter} - {helper_call}, 0)
+                    """).format(
+                    branch = branch_name,
+                    helper_call = helper_call,
+                    index = formula_index,
+                    name = name,
+                    parameter = parameter_name,
+                    variable_a = variable_a,
+                    variable_b = variable_b,
+                    )
+                individu_variables_name.append(name)
+            elif kind == 1:
+                # Formula using a tax scale on a yearly amount
+                formula_source = textwrap.dedent(u"""\
+
+
+                    @reference_formula
+                    class {name}(SimpleFormulaColumn):
+                        column = FloatCol
+                        entity_class = Individus
+                        label = u"Synthetic formula {index}"
+
+                        def function(self, simulation, period):
+                            period = period.start.offset('first-of', 'year').period('year')
+                            {variable_a} = simulation.calculate_add('{variable_a}', period)
+                            bareme = simulation.legislation_at(period.start).{branch}.bareme
+
+                            return period, bareme.calc({variable_a})
+                    """).format(
+                    branch = branch_name,
+                    index = formula_index,
+                    name = name,
+                    variable_a = variable_a,
+                    )
+                individu_variables_name.append(name)
+            elif kind == 2:
+                # Dated formula
+                formula_source = textwrap.dedent(u"""\
+
+
+                    @reference_formula
+                    class {name}(DatedFormulaColumn):
+                        column = FloatCol
+                        entity_class = Individus
+                        label = u"Synthetic formula {index}"
+
+                        @dated_function(date(2010, 1, 1), date(2012, 12, 31))
+                        def function_2010_2012(self, simulation, period):
+                            period = period.start.offset('first-of', 'month').period('month')
+                            {variable_a} = simulation.calculate('{variable_a}', period)
+
+                            return period, {variable_a} * 0.5
+
+                        @dated_function(date(2013, 1, 1))
+                        def function_2013(self, simulation, period):
+                            period = period.start.offset('first-of', 'month').period('month')
+                            {variable_a} = simulation.calculate('{variable_a}', period)
+                            {variable_b} = simulation.calculate('{variable_b}', period)
+                            law = simulation.legislation_at(period.start).{branch}
+
+                            return period, min_({variable_a}, {variable_b}) * law.{parameter}
+                    """).format(
+                    branch = branch_name,
+                    index = formula_index,
+                    name = name,
+                    parameter = parameter_name,
+                    variable_a = variable_a,
+                    variable_b = variable_b,
+                    )
+                individu_variables_name.append(name)
+            elif kind == 3:
+                # Person to entity aggregation
+                formula_source = textwrap.dedent(u"""\
+
+
+                    @reference_formula
+                    class {name}(PersonToEntityColumn):
+                        entity_class = Familles
+                        label = u"Synthetic formula {index}"
+                        operation = 'add'
+                        variable = {variable_a}
+                    """).format(
+                    index = formula_index,
+                    name = name,
+                    variable_a = variable_a,
+                    ) if variable_a in module_variables_name else textwrap.dedent(u"""\
+
+
+                    @reference_formula
+                    class {name}(SimpleFormulaColumn):
+                        column = FloatCol
+                        entity_class = Familles
+                        label = u"Synthetic formula {index}"
+
+                        def function(self, simulation, period):
+                            period = period.start.offset('first-of', 'month').period('month')
+                            {variable_a}_holder = simulation.compute('{variable_a}', period)
+                            {variable_a} = self.sum_by_entity({variable_a}_holder)
+
+                            return period, {variable_a}
+                    """).format(
+                    index = formula_index,
+                    name = name,
+                    variable_a = variable_a,
+                    )
+                famille_variables_name.append(name)
+            else:
+                # Formula of a family using other family formulas
+                variable_f = generator.choice(famille_variables_name)
+                formula_source = textwrap.dedent(u"""\
+
+
+                    @reference_formula
+                    class {name}(SimpleFormulaColumn):
+                        column = BoolCol
+                        entity_class = Familles
+                        label = u"Synthetic formula {index}"
+
+                        def function(self, simulation, period):
+                            period = period.start.offset('first-of', 'month').period('month')
+                            {variable_f} = simulation.calculate('{variable_f}', period)
+                            law = simulation.legislation_at(period.start).{branch}
+
+                            return period, {variable_f} > law.{parameter}
+                    """).format(
+                    branch = branch_name,
+                    index = formula_index,
+                    name = name,
+                    parameter = parameter_name,
+                    variable_f = variable_f,
+                    )
+                famille_variables_name.append(name)
+            module_source.append(formula_source)
+            module_variables_name.add(name)
+            formula_index += 1
+        write_source(os.path.join(model_dir, 'formulas_{}.py'.format(module_index)), u''.join(module_source))
+
+    write_source(os.path.join(model_dir, '__init__.py'), u''.join(itertools.chain(
+        [u'# -*- coding: utf-8 -*-\n\n\n', u'from . import input_variables  # noqa analysis:ignore\n'],
+        (
+            u'from . import formulas_{}  # noqa analysis:ignore\n'.format(module_index)
+            for module_index in range(modules_count)
+            ),
+        )))
+    return package_dir
+
+
+def write_source(file_path, source):
+    with codecs.open(file_path, 'w', encoding = 'utf-8') as source_file:
+        source_file.write(source)